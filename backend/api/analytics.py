@@ -1,13 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from typing import List, Dict, Any
+from sqlalchemy import func
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from database import get_db
-from models import Expense, Category, Budget, Goal
+from models import Expense, Budget, Goal, DailyRollup
 from api.auth import get_current_user
+from api.budgets import rollover_budgets
+from serialization import FastJSONResponse
+import recommendations
+import timeseries
+import pivot
+import sketches
+import running_stats
+import forecasts
+import queries
+import category_cache
+import category_tree
+import recurring
+import versions
 
 router = APIRouter()
 
@@ -16,6 +29,9 @@ class ExpensesByCategory(BaseModel):
     total: float
     count: int
     percentage: float
+    # Лише для ієрархічного режиму (rollup / parent_id)
+    category_id: Optional[int] = None
+    direct: Optional[bool] = None
 
 class MonthlyExpenses(BaseModel):
     month: str
@@ -36,17 +52,14 @@ async def get_dashboard_stats(
     current_user = Depends(get_current_user)
 ):
     
-    total_expenses = db.query(func.sum(Expense.amount)).filter(
-        Expense.user_id == current_user.id
+    # Суми — з денних підсумків, уже сконвертованих у базову валюту
+    total_expenses = db.query(func.sum(DailyRollup.total)).filter(
+        DailyRollup.user_id == current_user.id
     ).scalar() or 0.0
     
-    current_month = datetime.now().month
-    current_year = datetime.now().year
-    
-    total_expenses_this_month = db.query(func.sum(Expense.amount)).filter(
-        Expense.user_id == current_user.id,
-        extract('month', func.datetime(Expense.date)) == current_month,
-        extract('year', func.datetime(Expense.date)) == current_year
+    total_expenses_this_month = db.query(func.sum(DailyRollup.total)).filter(
+        DailyRollup.user_id == current_user.id,
+        func.substr(DailyRollup.day, 1, 7) == datetime.now().strftime('%Y-%m')
     ).scalar() or 0.0
     
     active_budgets = db.query(func.count(Budget.id)).filter(
@@ -59,9 +72,7 @@ async def get_dashboard_stats(
         Goal.is_achieved == False
     ).scalar() or 0
     
-    categories_count = db.query(func.count(Category.id)).filter(
-        (Category.user_id == current_user.id) | (Category.is_default == True)
-    ).scalar() or 0
+    categories_count = len(category_cache.get(db, current_user.id).rows())
     
     expenses_count = db.query(func.count(Expense.id)).filter(
         Expense.user_id == current_user.id
@@ -79,36 +90,41 @@ async def get_dashboard_stats(
 @router.get("/expenses-by-category", response_model=List[ExpensesByCategory])
 async def get_expenses_by_category(
     period_days: int = 30,
+    rollup: bool = False,
+    parent_id: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    
+    """Суми за категоріями; rollup=true — піддерева верхнього рівня, parent_id — піддерева дітей категорії"""
     start_date = (datetime.now() - timedelta(days=period_days)).strftime('%Y-%m-%d')
     
-    results = db.query(
-        Expense.category,
-        func.sum(Expense.amount).label('total'),
-        func.count(Expense.id).label('count')
-    ).filter(
-        Expense.user_id == current_user.id,
-        Expense.date >= start_date
-    ).group_by(Expense.category).all()
+    if rollup or parent_id is not None:
+        if parent_id is not None and category_cache.get(db, current_user.id).visible(parent_id) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Категорія не знайдена")
+        results = category_tree.subtree_totals(db, current_user.id, start_date, parent_id)
+    else:
+        results = [
+            {"category": row.category or category_tree.UNCATEGORIZED, "total": row.total, "count": row.count}
+            for row in db.query(
+                DailyRollup.category,
+                func.sum(DailyRollup.total).label('total'),
+                func.sum(DailyRollup.count).label('count')
+            ).filter(
+                DailyRollup.user_id == current_user.id,
+                DailyRollup.day >= start_date
+            ).group_by(DailyRollup.category)
+        ]
     
-    total_sum = sum(result.total for result in results)
+    total_sum = sum(result["total"] for result in results)
     
     expenses_by_category = []
     for result in results:
-        percentage = (result.total / total_sum * 100) if total_sum > 0 else 0
-        expenses_by_category.append(ExpensesByCategory(
-            category=result.category or "Без категории",
-            total=result.total,
-            count=result.count,
-            percentage=round(percentage, 2)
-        ))
+        percentage = (result["total"] / total_sum * 100) if total_sum > 0 else 0
+        expenses_by_category.append({**result, "percentage": round(percentage, 2)})
     
-    expenses_by_category.sort(key=lambda x: x.total, reverse=True)
+    expenses_by_category.sort(key=lambda x: x["total"], reverse=True)
     
-    return expenses_by_category
+    return FastJSONResponse(expenses_by_category)
 
 @router.get("/monthly-expenses", response_model=List[MonthlyExpenses])
 async def get_monthly_expenses(
@@ -117,17 +133,14 @@ async def get_monthly_expenses(
     current_user = Depends(get_current_user)
 ):
     
+    month = func.substr(DailyRollup.day, 1, 7)
     results = db.query(
-        func.strftime('%Y-%m', Expense.date).label('month'),
-        func.sum(Expense.amount).label('total'),
-        func.count(Expense.id).label('count')
+        month.label('month'),
+        func.sum(DailyRollup.total).label('total'),
+        func.sum(DailyRollup.count).label('count')
     ).filter(
-        Expense.user_id == current_user.id
-    ).group_by(
-        func.strftime('%Y-%m', Expense.date)
-    ).order_by(
-        func.strftime('%Y-%m', Expense.date).desc()
-    ).limit(months).all()
+        DailyRollup.user_id == current_user.id
+    ).group_by(month).order_by(month.desc()).limit(months).all()
     
     monthly_expenses = []
     for result in results:
@@ -141,40 +154,53 @@ async def get_monthly_expenses(
     
     return monthly_expenses
 
-@router.get("/budget-status")
+@router.get("/budget-status", dependencies=[Depends(rollover_budgets)])
 async def get_budget_status(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
+    # Витрачене в поточному вікні кожного бюджету рахується з денних підсумків
+    budgets = db.execute(queries.budget_rows(current_user.id)).all()
     
-    budgets = db.query(Budget).filter(
-        Budget.user_id == current_user.id,
-        Budget.is_active == True
-    ).all()
+    # Ще не записані регулярні витрати до кінця бюджетів (з правил, один прохід)
+    tomorrow = date.today() + timedelta(days=1)
+    ends = [budget.end_date[:10] for budget in budgets if budget.end_date]
+    scheduled = recurring.upcoming(db, current_user.id, tomorrow, date.fromisoformat(max(ends))) if ends else []
+    categories = category_cache.get(db, current_user.id) if scheduled else None
+    category_names = {
+        budget.category_id: categories.visible(budget.category_id).name
+        for budget in budgets if budget.category_id and categories.visible(budget.category_id)
+    } if scheduled else {}
     
     budget_status = []
     for budget in budgets:
-        remaining = max(0, budget.amount - budget.spent)
-        percentage_used = (budget.spent / budget.amount * 100) if budget.amount > 0 else 0
+        upcoming = recurring.scheduled_total(
+            scheduled, budget.start_date, budget.end_date, category_names.get(budget.category_id)
+        ) if scheduled and budget.end_date else 0.0
         
         status = "safe"
-        if percentage_used >= 90:
+        if budget.percentage_used >= 90:
             status = "danger"
-        elif percentage_used >= 75:
+        elif budget.percentage_used >= 75:
             status = "warning"
         
         budget_status.append({
             "id": budget.id,
             "name": budget.name,
             "amount": budget.amount,
+            "carried_over": budget.carried_over,
             "spent": budget.spent,
-            "remaining": remaining,
-            "percentage_used": round(percentage_used, 2),
+            "remaining": budget.remaining,
+            "percentage_used": round(budget.percentage_used, 2),
             "status": status,
-            "period": budget.period
+            "period": budget.period,
+            "start_date": budget.start_date,
+            "end_date": budget.end_date,
+            "scheduled": upcoming,
+            "projected_spent": round(budget.spent + upcoming, 2)
         })
     
-    return budget_status
+    return FastJSONResponse(budget_status)
 
 @router.get("/goals-progress")
 async def get_goals_progress(
@@ -202,4 +228,123 @@ async def get_goals_progress(
             "is_achieved": goal.is_achieved
         })
     
-    return goals_progress 
\ No newline at end of file
+    return FastJSONResponse(goals_progress) 
+
+@router.get("/recommendations")
+async def get_recommendations(
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Рекомендації дашборду: тренд, найбільша категорія, аномалії, ризики бюджетів"""
+    return FastJSONResponse(recommendations.get(db, current_user.id))
+
+@router.get("/timeseries")
+async def get_timeseries(
+    request: Request,
+    granularity: str = Query("month", pattern="^(day|week|month|quarter|year)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    category: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Витрати по відрізках часу з нулями для порожніх відрізків (паралельні масиви)"""
+    headers = None
+    # Без end ряд залежить від сьогоднішньої дати, тож ETag лише для явного періоду
+    if end is not None:
+        etag, not_modified = versions.conditional_get(request, db, current_user.id, "expenses")
+        if not_modified:
+            return not_modified
+        headers = versions.headers(etag)
+    
+    try:
+        data = timeseries.series(db, current_user.id, granularity, start, end, category)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    return FastJSONResponse(data, headers=headers)
+
+@router.get("/pivot")
+async def get_pivot(
+    request: Request,
+    rows: str = Query("category", pattern="^(category|week|month|quarter|year)$"),
+    cols: str = Query("month", pattern="^(category|week|month|quarter|year)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Зведена таблиця (напр. категорія × місяць) з підсумками і змінами між періодами"""
+    headers = None
+    if end is not None:
+        etag, not_modified = versions.conditional_get(request, db, current_user.id, "expenses")
+        if not_modified:
+            return not_modified
+        headers = versions.headers(etag)
+    
+    try:
+        data = pivot.build(db, current_user.id, rows, cols, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    return FastJSONResponse(data, headers=headers)
+
+@router.get("/distribution")
+async def get_distribution(
+    request: Request,
+    category: Optional[str] = None,
+    percentiles: str = Query(",".join(str(p) for p in sketches.DEFAULT_PERCENTILES)),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Перцентилі сум витрат (медіана, p90...) з ескізів квантилів, без сканування витрат"""
+    try:
+        points = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        points = []
+    if not points or any(not 0 <= p <= 100 for p in points):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="percentiles — список чисел від 0 до 100 через кому"
+        )
+    
+    etag, not_modified = versions.conditional_get(request, db, current_user.id, "expenses")
+    if not_modified:
+        return not_modified
+    
+    data = sketches.distribution(db, current_user.id, category, points)
+    return FastJSONResponse(data, headers=versions.headers(etag))
+
+@router.get("/statistics")
+async def get_statistics(
+    request: Request,
+    category: Optional[str] = None,
+    amount: Optional[float] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Середнє, дисперсія, волатильність і межі сум витрат по категоріях за O(1)
+
+    З параметром amount для кожного рядка додається z-оцінка цієї суми.
+    """
+    etag, not_modified = versions.conditional_get(request, db, current_user.id, "expenses")
+    if not_modified:
+        return not_modified
+    
+    summary = running_stats.summary(db, current_user.id, category)
+    overall = summary.pop(running_stats.ALL, None)
+    categories = [{"category": name, **stats} for name, stats in sorted(summary.items())]
+    if amount is not None:
+        for stats in categories + ([overall] if overall else []):
+            stats["zscore"] = running_stats.zscore(stats, amount)
+    
+    return FastJSONResponse({"overall": overall, "categories": categories}, headers=versions.headers(etag))
+
+@router.get("/spending-forecast")
+async def get_spending_forecast(
+    days: int = Query(30, ge=1, le=forecasts.MAX_FORECAST_DAYS),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Прогноз денних витрат зі збереженої моделі (тренд × день тижня)"""
+    return FastJSONResponse(forecasts.forecast(db, current_user.id, days))
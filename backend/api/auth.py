@@ -9,7 +9,7 @@ import os
 from pydantic import BaseModel, EmailStr, validator
 import re
 
-from database import get_db
+from database import get_db, route_session
 from models import User
 
 router = APIRouter()
@@ -223,6 +223,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     if not user.is_active:
         print(f"User not active: {email}")
         raise credentials_exception
+    
+    # Всі подальші запити цієї сесії йдуть у шард користувача
+    route_session(db, user.id)
         
     return user 
 
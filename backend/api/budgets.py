@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
 
 from database import get_db
-from models import Budget, Category
+from models import Budget
 from api.auth import get_current_user
+import budget_periods
+import category_cache
+import queries
+import serialization
+import versions
 
 router = APIRouter()
 
@@ -15,8 +20,18 @@ class BudgetCreate(BaseModel):
     amount: float = Field(..., gt=0)
     period: str = Field(..., pattern="^(monthly|weekly|yearly)$")
     start_date: str
-    end_date: str
+    # Без end_date вікно закінчується разом із періодом, що починається з start_date
+    end_date: Optional[str] = None
     category_id: Optional[int] = None
+    carry_over: bool = False
+
+    def window_end(self):
+        if self.end_date:
+            return self.end_date
+        start = budget_periods.parse_day(self.start_date)
+        if start is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Некоректна дата початку")
+        return budget_periods.window(self.period, start, start)[1].isoformat()
 
 class BudgetResponse(BaseModel):
     id: int
@@ -28,30 +43,37 @@ class BudgetResponse(BaseModel):
     end_date: str
     category_id: Optional[int]
     is_active: bool
+    carry_over: bool = False
+    carried_over: float = 0.0
     remaining: float = 0.0
     percentage_used: float = 0.0
     
     class Config:
         from_attributes = True
 
-@router.get("/", response_model=List[BudgetResponse])
+async def rollover_budgets(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    """Залежність для читань, що мають бачити поточне вікно бюджетів"""
+    budget_periods.ensure_current(db, current_user.id)
+
+def _budget_response(db, budget_id, user_id):
+    """Рядок BudgetResponse з витраченим у поточному вікні (з денних підсумків)"""
+    return db.execute(queries.budget_row_by_id, {"budget_id": budget_id, "user_id": user_id}).one()._asdict()
+
+@router.get("/", response_model=List[BudgetResponse], dependencies=[Depends(rollover_budgets)])
 async def get_budgets(
+    request: Request,
     active_only: bool = True,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    query = db.query(Budget).filter(Budget.user_id == current_user.id)
-    
-    if active_only:
-        query = query.filter(Budget.is_active == True)
-    
-    budgets = query.order_by(Budget.created_at.desc()).all()
-    
-    for budget in budgets:
-        budget.remaining = max(0, budget.amount - budget.spent)
-        budget.percentage_used = (budget.spent / budget.amount * 100) if budget.amount > 0 else 0
-    
-    return budgets
+    # Витрачене рахується з витрат, тож список змінюється і з версією витрат
+    version = ".".join(versions.current(db, current_user.id, collection) for collection in ("budgets", "expenses"))
+    etag, not_modified = versions.conditional_get(request, db, current_user.id, "budgets", version)
+    if not_modified:
+        return not_modified
+    
+    result = db.execute(queries.budget_rows(current_user.id, active_only))
+    return serialization.rows_response(result, headers=versions.headers(etag))
 
 @router.post("/", response_model=BudgetResponse, status_code=status.HTTP_201_CREATED)
 async def create_budget(
@@ -60,12 +82,7 @@ async def create_budget(
     current_user = Depends(get_current_user)
 ):
     if budget.category_id:
-        category = db.query(Category).filter(
-            Category.id == budget.category_id,
-            (Category.user_id == current_user.id) | (Category.is_default == True)
-        ).first()
-        
-        if not category:
+        if category_cache.get(db, current_user.id).visible(budget.category_id) is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Категорія не знайдена"
@@ -74,23 +91,21 @@ async def create_budget(
     db_budget = Budget(
         name=budget.name,
         amount=budget.amount,
-        spent=0.0,
         period=budget.period,
         start_date=budget.start_date,
-        end_date=budget.end_date,
+        end_date=budget.window_end(),
+        anchor_date=budget.start_date[:10],
         category_id=budget.category_id,
+        carry_over=budget.carry_over,
+        carried_over=0.0,
         is_active=True,
         user_id=current_user.id
     )
     
     db.add(db_budget)
     db.commit()
-    db.refresh(db_budget)
-    
-    db_budget.remaining = db_budget.amount
-    db_budget.percentage_used = 0.0
     
-    return db_budget
+    return _budget_response(db, db_budget.id, current_user.id)
 
 @router.put("/{budget_id}", response_model=BudgetResponse)
 async def update_budget(
@@ -100,10 +115,7 @@ async def update_budget(
     current_user = Depends(get_current_user)
 ):
     """Обновить бюджет"""
-    db_budget = db.query(Budget).filter(
-        Budget.id == budget_id,
-        Budget.user_id == current_user.id
-    ).first()
+    db_budget = db.scalars(queries.budget_by_id, {"budget_id": budget_id, "user_id": current_user.id}).first()
     
     if not db_budget:
         raise HTTPException(
@@ -112,12 +124,7 @@ async def update_budget(
         )
     
     if budget_data.category_id:
-        category = db.query(Category).filter(
-            Category.id == budget_data.category_id,
-            (Category.user_id == current_user.id) | (Category.is_default == True)
-        ).first()
-        
-        if not category:
+        if category_cache.get(db, current_user.id).visible(budget_data.category_id) is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Категорія не знайдена"
@@ -127,16 +134,14 @@ async def update_budget(
     db_budget.amount = budget_data.amount
     db_budget.period = budget_data.period
     db_budget.start_date = budget_data.start_date
-    db_budget.end_date = budget_data.end_date
+    db_budget.end_date = budget_data.window_end()
+    db_budget.anchor_date = budget_data.start_date[:10]
     db_budget.category_id = budget_data.category_id
+    db_budget.carry_over = budget_data.carry_over
     
     db.commit()
-    db.refresh(db_budget)
     
-    db_budget.remaining = max(0, db_budget.amount - db_budget.spent)
-    db_budget.percentage_used = (db_budget.spent / db_budget.amount * 100) if db_budget.amount > 0 else 0
-    
-    return db_budget
+    return _budget_response(db, budget_id, current_user.id)
 
 @router.delete("/{budget_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_budget(
@@ -144,10 +149,7 @@ async def delete_budget(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    db_budget = db.query(Budget).filter(
-        Budget.id == budget_id,
-        Budget.user_id == current_user.id
-    ).first()
+    db_budget = db.scalars(queries.budget_by_id, {"budget_id": budget_id, "user_id": current_user.id}).first()
     
     if not db_budget:
         raise HTTPException(
@@ -166,10 +168,7 @@ async def toggle_budget_status(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    db_budget = db.query(Budget).filter(
-        Budget.id == budget_id,
-        Budget.user_id == current_user.id
-    ).first()
+    db_budget = db.scalars(queries.budget_by_id, {"budget_id": budget_id, "user_id": current_user.id}).first()
     
     if not db_budget:
         raise HTTPException(
@@ -179,9 +178,5 @@ async def toggle_budget_status(
     
     db_budget.is_active = not db_budget.is_active
     db.commit()
-    db.refresh(db_budget)
-    
-    db_budget.remaining = max(0, db_budget.amount - db_budget.spent)
-    db_budget.percentage_used = (db_budget.spent / db_budget.amount * 100) if db_budget.amount > 0 else 0
     
-    return db_budget 
\ No newline at end of file
+    return _budget_response(db, budget_id, current_user.id) 
\ No newline at end of file
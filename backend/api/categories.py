@@ -1,19 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from database import get_db
 from models import Category
 from api.auth import get_current_user
+import category_cache
+import category_tree
+import recategorize
+import running_stats
+import versions
+from serialization import FastJSONResponse
 
 router = APIRouter()
 
 class CategoryCreate(BaseModel):
-    name: str
+    name: str = Field(..., pattern=running_stats.CATEGORY_PATTERN)
     description: Optional[str] = None
     color: Optional[str] = "#607D8B"
     icon: Optional[str] = "📦"
+    parent_id: Optional[int] = None
 
 class CategoryResponse(BaseModel):
     id: int
@@ -22,28 +30,42 @@ class CategoryResponse(BaseModel):
     color: str
     icon: str
     is_default: bool
+    parent_id: Optional[int] = None
     
     class Config:
         from_attributes = True
 
+def check_parent(db, categories, parent_id, category_id=None):
+    """Батьківська категорія має бути видимою і не лежати в піддереві самої категорії"""
+    if parent_id is None:
+        return
+    if categories.visible(parent_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Батьківська категорія не знайдена"
+        )
+    if category_id is not None and category_tree.is_descendant(db, parent_id, category_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Категорію не можна перенести всередину її власного піддерева"
+        )
+
 @router.get("/", response_model=List[CategoryResponse])
 async def get_categories(
+    request: Request,
     include_default: bool = True,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    query = db.query(Category)
+    version = versions.current(db, current_user.id, "categories")
+    etag, not_modified = versions.conditional_get(request, db, current_user.id, "categories", version)
+    if not_modified:
+        return not_modified
     
-    if include_default:
-        query = query.filter(
-            (Category.user_id == current_user.id) | 
-            (Category.is_default == True)
-        )
-    else:
-        query = query.filter(Category.user_id == current_user.id)
-    
-    categories = query.order_by(Category.is_default.desc(), Category.name).all()
-    return categories
+    categories = category_cache.get(db, current_user.id, version)
+    return FastJSONResponse(
+        [row._asdict() for row in categories.rows(include_default)], headers=versions.headers(etag)
+    )
 
 @router.post("/", response_model=CategoryResponse, status_code=status.HTTP_201_CREATED)
 async def create_category(
@@ -51,16 +73,13 @@ async def create_category(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    existing = db.query(Category).filter(
-        Category.name == category.name,
-        Category.user_id == current_user.id
-    ).first()
-    
-    if existing:
+    categories = category_cache.get(db, current_user.id)
+    if categories.own_id(category.name) is not None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Категорія з такою назвою вже існує"
         )
+    check_parent(db, categories, category.parent_id)
     
     db_category = Category(
         name=category.name,
@@ -68,7 +87,8 @@ async def create_category(
         color=category.color,
         icon=category.icon,
         is_default=False,
-        user_id=current_user.id
+        user_id=current_user.id,
+        parent_id=category.parent_id
     )
     
     db.add(db_category)
@@ -84,46 +104,85 @@ async def update_category(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    db_category = db.query(Category).filter(
-        Category.id == category_id,
-        Category.user_id == current_user.id,
-        Category.is_default == False  
-    ).first()
-    
-    if not db_category:
+    categories = category_cache.get(db, current_user.id)
+    if categories.owned(category_id) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Категорія не знайдена або не може бути змінена"
         )
+    check_parent(db, categories, category_data.parent_id, category_id)
+    
+    db_category = db.get(Category, category_id)
     
     db_category.name = category_data.name
     db_category.description = category_data.description
     db_category.color = category_data.color
     db_category.icon = category_data.icon
+    db_category.parent_id = category_data.parent_id
     
     db.commit()
     db.refresh(db_category)
     
     return db_category
 
+@router.post("/{category_id}/merge-into/{target_id}")
+async def merge_category(
+    category_id: int,
+    target_id: int,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Злити категорію в target: витрати й бюджети переходять до target, дочірні категорії — під target"""
+    categories = category_cache.get(db, current_user.id)
+    source, target = categories.owned(category_id), categories.visible(target_id)
+    if source is None or target is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Категорія не знайдена або не може бути змінена"
+        )
+    if category_tree.is_descendant(db, target_id, category_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Категорію не можна злити з нею самою або з її підкатегорією"
+        )
+    
+    try:
+        moved = recategorize.move(
+            db, current_user.id, recategorize.expense_filter(current_user.id, [source.name]),
+            target.name, target_id, repoint_budgets_from=category_id
+        )
+        for child in db.scalars(select(Category).where(Category.parent_id == category_id)):
+            child.parent_id = target_id
+        db.flush()
+        db.delete(db.get(Category, category_id))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to merge category: {str(e)}"
+        )
+    
+    return {"moved": moved, "category_id": target_id, "category": target.name}
+
 @router.delete("/{category_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_category(
     category_id: int,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    db_category = db.query(Category).filter(
-        Category.id == category_id,
-        Category.user_id == current_user.id,
-        Category.is_default == False  
-    ).first()
-    
-    if not db_category:
+    if category_cache.get(db, current_user.id).owned(category_id) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Категорія не знайдена або не може бути видалена"
         )
     
+    db_category = db.get(Category, category_id)
+    
+    # Дочірні категорії піднімаються на рівень видаленої
+    for child in db.scalars(select(Category).where(Category.parent_id == category_id)):
+        child.parent_id = db_category.parent_id
+    db.flush()
     db.delete(db_category)
     db.commit()
     
@@ -0,0 +1,75 @@
+import os
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.orm import Session
+
+from database import get_db
+from api.auth import get_current_user
+import events
+
+router = APIRouter()
+
+# EventSource у браузері не вміє слати заголовки, тож токен можна передати в ?token=.
+# Це дозволено лише для цього маршруту: решта API читає токен тільки із заголовка
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
+
+# Коментар-пульс, щоб проксі не закривали тихе з'єднання
+HEARTBEAT_SECONDS = 15
+# Після цього часу потік закривається, EventSource перепідключається сам
+# (і заново перевіряє токен)
+MAX_STREAM_SECONDS = int(os.getenv("SPENDIO_SSE_MAX_SECONDS", "300"))
+RETRY_MS = 3000
+
+
+@router.get("/")
+async def stream_events(
+    request: Request,
+    token: Optional[str] = Query(None),
+    header_token: Optional[str] = Depends(optional_oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    """Потік SSE зі сповіщеннями про зміни даних користувача
+
+    Кожна подія `change` містить список колекцій, що змінились; клієнт
+    перезапитує лише їх. Поки даних ніхто не змінює, потік не робить запитів до БД.
+
+    Токен приймається із заголовка Authorization або з ?token= — другий варіант
+    існує лише для EventSource і лише на цьому маршруті; інші маршрути токен
+    із рядка запиту ігнорують.
+    """
+    if not (header_token or token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    current_user = await get_current_user(header_token or token, db)
+    user_id = current_user.id
+    # З'єднання з БД не тримається весь час життя потоку
+    db.close()
+
+    async def stream():
+        subscription = events.broker.subscribe(user_id)
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            while time.monotonic() < deadline:
+                if await request.is_disconnected():
+                    break
+                event = await subscription.get(min(HEARTBEAT_SECONDS, max(deadline - time.monotonic(), 0)))
+                if event is None:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield events.format_event(events.merge([event] + subscription.drain()))
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,20 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
 
-from database import get_db
+from database import get_db, UserMoving
 from models import Expense
 from api.auth import get_current_user
+from api.recurring import materialize_recurring
+import categorizer
+import duplicates
+import fx
+import queries
+import recategorize
+import running_stats
+import serialization
+import versions
+import write_queue
 
 router = APIRouter()
 
 class ExpenseCreate(BaseModel):
     amount: float = Field(..., gt=0)
     description: str
-    category: str
+    category: str = Field(..., pattern=running_stats.CATEGORY_PATTERN)
     date: str
+    # Без валюти — базова (fx.BASE_CURRENCY)
+    currency: Optional[str] = Field(None, pattern=fx.CURRENCY_PATTERN)
 
 class ExpenseResponse(BaseModel):
     id: int
@@ -23,26 +35,90 @@ class ExpenseResponse(BaseModel):
     category: str
     date: str
     user_id: int  # Додаємо user_id для перевірки ізоляції
+    duplicate_of: Optional[int] = None
+    recurring_rule_id: Optional[int] = None
+    currency: Optional[str] = None
     
     class Config:
         from_attributes = True
 
+class ExpenseImport(BaseModel):
+    amount: float = Field(..., gt=0)
+    description: str
+    category: Optional[str] = Field(None, pattern=running_stats.CATEGORY_PATTERN)
+    date: str
+    currency: Optional[str] = Field(None, pattern=fx.CURRENCY_PATTERN)
+
+class ExpenseRecategorize(BaseModel):
+    category: str = Field(..., min_length=1, pattern=running_stats.CATEGORY_PATTERN)
+    # Фільтри витрат; порожній рядок у from_categories — витрати без категорії
+    from_categories: Optional[List[str]] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    description: Optional[str] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+
+# Межа розміру одного імпорту
+MAX_BULK_EXPENSES = 5000
+
+DUPLICATE_POLICY_PATTERN = "^(reject|merge|flag)$"
+
+def check_currencies(db, currencies):
+    """400 для валют без завантажених курсів (інакше суму не перевести в базову)"""
+    unknown = sorted({currency for currency in currencies if not fx.is_known(db, currency)})
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Немає курсу для валют: {', '.join(unknown)}"
+        )
+
 @router.post("/", response_model=ExpenseResponse, status_code=status.HTTP_201_CREATED)
-async def create_expense(expense: ExpenseCreate, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+async def create_expense(
+    expense: ExpenseCreate,
+    response: Response,
+    on_duplicate: Optional[str] = Query(None, pattern=DUPLICATE_POLICY_PATTERN),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    check_currencies(db, [expense.currency])
+    policy = duplicates.resolve_policy(on_duplicate)
+    (original,) = duplicates.find(db, current_user.id, [(expense.date, expense.amount, expense.description, expense.currency)])
+    if original is not None:
+        if policy == "reject":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"message": "Duplicate expense", "duplicate_of": original}
+            )
+        if policy == "merge":
+            response.status_code = status.HTTP_200_OK
+            return db.scalars(queries.expense_by_id, {"expense_id": original, "user_id": current_user.id}).first()
+    
     try:
-        db_expense = Expense(
+        values = dict(
             amount=expense.amount,
             description=expense.description,
             category=expense.category,
             date=expense.date,
-            user_id=current_user.id
+            currency=expense.currency,
+            user_id=current_user.id,
+            duplicate_of=original
         )
         
+        if write_queue.GROUP_COMMIT_ENABLED:
+            # Вставка комітиться разом з вставками інших запитів
+            return await write_queue.insert(db, Expense, values)
+        
+        db_expense = Expense(**values)
         db.add(db_expense)
         db.commit()
         db.refresh(db_expense)
         
         return db_expense
+    except UserMoving:
+        # 503 з Retry-After (обробник у main), а не 500
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -50,8 +126,9 @@ async def create_expense(expense: ExpenseCreate, db: Session = Depends(get_db),
             detail=f"Failed to create expense: {str(e)}"
         )
 
-@router.get("/", response_model=List[ExpenseResponse])
+@router.get("/", response_model=List[ExpenseResponse], dependencies=[Depends(materialize_recurring)])
 async def get_expenses(
+    request: Request,
     skip: int = 0, 
     limit: int = 100, 
     category: Optional[str] = None, 
@@ -60,24 +137,135 @@ async def get_expenses(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    query = db.query(Expense).filter(Expense.user_id == current_user.id)
+    etag, not_modified = versions.conditional_get(request, db, current_user.id, "expenses")
+    if not_modified:
+        return not_modified
     
-    if category:
-        query = query.filter(Expense.category == category)
+    # Швидкий шлях: Core-рядки одразу в JSON, без ORM-об'єктів і валідації кожного рядка
+    result = db.execute(queries.expense_rows(current_user.id, category, start_date, end_date, skip, limit))
+    return serialization.rows_response(result, headers=versions.headers(etag))
+
+# Маршрути з фіксованим шляхом оголошуються до /{expense_id}, інакше
+# "suggest-category" розбирався б як expense_id
+@router.get("/suggest-category")
+async def suggest_category(
+    description: str = Query(..., min_length=1),
+    top: int = Query(3, ge=1, le=10),
+    current_user = Depends(get_current_user)
+):
+    """Найімовірніша категорія для опису з моделі користувача (або глобальної)"""
+    return categorizer.suggest(current_user.id, description, top)
+
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def bulk_create_expenses(
+    items: List[ExpenseImport],
+    on_duplicate: Optional[str] = Query(None, pattern=DUPLICATE_POLICY_PATTERN),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Імпорт витрат однією транзакцією
+
+    Витрати без категорії категоризуються пакетно, дублікати (з історії або
+    всередині пачки) обробляються за політикою on_duplicate. ids відповідає
+    порядку items: для злитих дублікатів — id наявної витрати.
+    """
+    if len(items) > MAX_BULK_EXPENSES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Не більше {MAX_BULK_EXPENSES} витрат за один запит"
+        )
     
-    if start_date:
-        query = query.filter(Expense.date >= start_date)
+    check_currencies(db, [item.currency for item in items])
+    policy = duplicates.resolve_policy(on_duplicate)
+    originals = duplicates.find(db, current_user.id, [(item.date, item.amount, item.description, item.currency) for item in items])
+    duplicate_indexes = [index for index, original in enumerate(originals) if original is not None]
+    if duplicate_indexes and policy == "reject":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Duplicate expenses", "duplicates": duplicate_indexes}
+        )
+    
+    # Для merge дублікати не записуються; від'ємний original — перше входження в пачці
+    inserted = [index for index, original in enumerate(originals) if original is None or policy == "flag"]
+    uncategorized = [index for index in inserted if not items[index].category]
+    predicted = dict(zip(uncategorized, categorizer.predict(
+        current_user.id, [items[index].description for index in uncategorized]
+    )))
+    expenses = {
+        index: Expense(
+            amount=items[index].amount,
+            description=items[index].description,
+            category=items[index].category or predicted[index],
+            date=items[index].date,
+            currency=items[index].currency,
+            user_id=current_user.id,
+            duplicate_of=originals[index] if originals[index] is not None and originals[index] >= 0 else None
+        )
+        for index in inserted
+    }
     
-    if end_date:
-        query = query.filter(Expense.date <= end_date)
+    try:
+        db.add_all(expenses.values())
+        db.flush()
+        ids = []
+        for index, original in enumerate(originals):
+            if original is not None and original < 0:
+                original = expenses[-1 - original].id
+            if index in expenses:
+                if original is not None:
+                    expenses[index].duplicate_of = original
+                ids.append(expenses[index].id)
+            else:
+                ids.append(original)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import expenses: {str(e)}"
+        )
+    
+    return {
+        "created": len(expenses),
+        "auto_categorized": len(uncategorized),
+        "duplicates": len(duplicate_indexes),
+        "policy": policy,
+        "ids": ids
+    }
+
+@router.post("/recategorize")
+async def recategorize_expenses(
+    request: ExpenseRecategorize,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Змінити категорію всім витратам за фільтром одним UPDATE у транзакції"""
+    filters = request.model_dump(exclude={"category"}, exclude_none=True)
+    if "from_categories" in filters:
+        filters["categories"] = filters.pop("from_categories")
+    if not filters:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Потрібен хоча б один фільтр витрат"
+        )
     
-    expenses = query.order_by(Expense.date.desc()).offset(skip).limit(limit).all()
+    try:
+        updated = recategorize.move(
+            db, current_user.id, recategorize.expense_filter(current_user.id, **filters), request.category
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to recategorize expenses: {str(e)}"
+        )
     
-    return expenses
+    return {"updated": updated, "category": request.category}
 
 @router.get("/{expense_id}", response_model=ExpenseResponse)
 async def get_expense(expense_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    expense = db.query(Expense).filter(Expense.id == expense_id, Expense.user_id == current_user.id).first()
+    expense = db.scalars(queries.expense_by_id, {"expense_id": expense_id, "user_id": current_user.id}).first()
     
     if expense is None:
         raise HTTPException(
@@ -94,7 +282,7 @@ async def update_expense(
     db: Session = Depends(get_db), 
     current_user = Depends(get_current_user)
 ):
-    db_expense = db.query(Expense).filter(Expense.id == expense_id, Expense.user_id == current_user.id).first()
+    db_expense = db.scalars(queries.expense_by_id, {"expense_id": expense_id, "user_id": current_user.id}).first()
     
     if db_expense is None:
         raise HTTPException(
@@ -102,10 +290,12 @@ async def update_expense(
             detail="Expense not found"
         )
     
+    check_currencies(db, [expense_data.currency])
     db_expense.amount = expense_data.amount
     db_expense.description = expense_data.description
     db_expense.category = expense_data.category
     db_expense.date = expense_data.date
+    db_expense.currency = expense_data.currency
     
     db.commit()
     db.refresh(db_expense)
@@ -114,7 +304,7 @@ async def update_expense(
 
 @router.delete("/{expense_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_expense(expense_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    db_expense = db.query(Expense).filter(Expense.id == expense_id, Expense.user_id == current_user.id).first()
+    db_expense = db.scalars(queries.expense_by_id, {"expense_id": expense_id, "user_id": current_user.id}).first()
     
     if db_expense is None:
         raise HTTPException(
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel, Field
@@ -7,6 +7,9 @@ from datetime import datetime
 from database import get_db
 from models import Goal
 from api.auth import get_current_user
+import queries
+import serialization
+import versions
 
 router = APIRouter()
 
@@ -41,23 +44,18 @@ class GoalResponse(BaseModel):
 
 @router.get("/", response_model=List[GoalResponse])
 async def get_goals(
+    request: Request,
     achieved_only: Optional[bool] = None,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
     """Отримати всі цілі користувача"""
-    query = db.query(Goal).filter(Goal.user_id == current_user.id)
+    etag, not_modified = versions.conditional_get(request, db, current_user.id, "goals")
+    if not_modified:
+        return not_modified
     
-    if achieved_only is not None:
-        query = query.filter(Goal.is_achieved == achieved_only)
-    
-    goals = query.order_by(Goal.is_achieved, Goal.target_date).all()
-    
-    for goal in goals:
-        goal.progress_percentage = (goal.current_amount / goal.target_amount * 100) if goal.target_amount > 0 else 0
-        goal.remaining_amount = max(0, goal.target_amount - goal.current_amount)
-    
-    return goals
+    result = db.execute(queries.goal_rows(current_user.id, achieved_only))
+    return serialization.rows_response(result, headers=versions.headers(etag))
 
 @router.post("/", response_model=GoalResponse, status_code=status.HTTP_201_CREATED)
 async def create_goal(
@@ -93,10 +91,7 @@ async def update_goal(
     current_user = Depends(get_current_user)
 ):
     """Оновити ціль"""
-    db_goal = db.query(Goal).filter(
-        Goal.id == goal_id,
-        Goal.user_id == current_user.id
-    ).first()
+    db_goal = db.scalars(queries.goal_by_id, {"goal_id": goal_id, "user_id": current_user.id}).first()
     
     if not db_goal:
         raise HTTPException(
@@ -130,10 +125,7 @@ async def add_money_to_goal(
     current_user = Depends(get_current_user)
 ):
     """Додати гроші до цілі"""
-    db_goal = db.query(Goal).filter(
-        Goal.id == goal_id,
-        Goal.user_id == current_user.id
-    ).first()
+    db_goal = db.scalars(queries.goal_by_id, {"goal_id": goal_id, "user_id": current_user.id}).first()
     
     if not db_goal:
         raise HTTPException(
@@ -169,10 +161,7 @@ async def withdraw_money_from_goal(
     current_user = Depends(get_current_user)
 ):
     """Зняти гроші з цілі"""
-    db_goal = db.query(Goal).filter(
-        Goal.id == goal_id,
-        Goal.user_id == current_user.id
-    ).first()
+    db_goal = db.scalars(queries.goal_by_id, {"goal_id": goal_id, "user_id": current_user.id}).first()
     
     if not db_goal:
         raise HTTPException(
@@ -206,10 +195,7 @@ async def delete_goal(
     current_user = Depends(get_current_user)
 ):
     """Видалити ціль"""
-    db_goal = db.query(Goal).filter(
-        Goal.id == goal_id,
-        Goal.user_id == current_user.id
-    ).first()
+    db_goal = db.scalars(queries.goal_by_id, {"goal_id": goal_id, "user_id": current_user.id}).first()
     
     if not db_goal:
         raise HTTPException(
@@ -1,9 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from database import get_db
+from database import get_db, shard_router
 from models import User, Expense, Category, Budget, Goal
 import utils
+import write_queue
+import compression
+import versions
+import events
+import idempotency
+import recommendations
+import sketches
+import jobs
+import forecasts
+import categorizer
+import recurring
+import fx
+import recategorize
+import category_cache
+import budget_periods
 
 router = APIRouter()
 
@@ -24,15 +39,44 @@ async def health_check(db: Session = Depends(get_db)):
             "error": str(e)
         }
 
+@router.get("/health/metrics")
+async def metrics():
+    """Внутрішні метрики підсистем (черга групових комітів тощо)"""
+    return {
+        "write_queue": write_queue.stats(),
+        "compression": compression.stats(),
+        "etag": versions.stats(),
+        "events": events.stats(),
+        "idempotency": idempotency.stats(),
+        "recommendations": recommendations.stats(),
+        "sketches": sketches.stats(),
+        "jobs": jobs.stats(),
+        "forecasts": forecasts.stats(),
+        "categorizer": categorizer.stats(),
+        "recurring": recurring.stats(),
+        "fx": fx.stats(),
+        "recategorize": recategorize.stats(),
+        "category_cache": category_cache.stats(),
+        "budget_periods": budget_periods.stats()
+    }
+
 @router.get("/database-status")
 def database_status(db: Session = Depends(get_db)):
     """Перевірка стану бази даних"""
     try:
         users_count = db.query(User).count()
-        expenses_count = db.query(Expense).count()
-        categories_count = db.query(Category).count()
-        budgets_count = db.query(Budget).count()
-        goals_count = db.query(Goal).count()
+        
+        # Таблиці з даними користувачів рахуються на всіх шардах паралельно
+        per_shard = shard_router.fan_out(lambda shard_db: {
+            "expenses": shard_db.query(Expense).count(),
+            "categories": shard_db.query(Category).count(),
+            "budgets": shard_db.query(Budget).count(),
+            "goals": shard_db.query(Goal).count()
+        }, db)
+        expenses_count = sum(shard["expenses"] for shard in per_shard)
+        categories_count = sum(shard["categories"] for shard in per_shard)
+        budgets_count = sum(shard["budgets"] for shard in per_shard)
+        goals_count = sum(shard["goals"] for shard in per_shard)
         
         return {
             "status": "connected",
@@ -44,7 +88,8 @@ def database_status(db: Session = Depends(get_db)):
                 "goals": goals_count
             },
             "total_records": users_count + expenses_count + categories_count + budgets_count + goals_count,
-            "has_data": users_count > 0
+            "has_data": users_count > 0,
+            "shards": per_shard if shard_router.enabled else None
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Помилка підключення до БД: {str(e)}")
@@ -0,0 +1,158 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import date, timedelta
+from pydantic import BaseModel, Field
+
+from database import get_db
+from models import RecurringRule
+from api.auth import get_current_user
+from serialization import FastJSONResponse
+import recurring
+import running_stats
+import versions
+
+router = APIRouter()
+
+class RecurringRuleCreate(BaseModel):
+    amount: float = Field(..., gt=0)
+    description: str
+    category: Optional[str] = Field(None, pattern=running_stats.CATEGORY_PATTERN)
+    frequency: str = Field("monthly", pattern="^(daily|weekly|monthly|yearly|custom)$")
+    interval: int = Field(1, ge=1, le=366)
+    # Для frequency=custom: правило RRULE, напр. "FREQ=MONTHLY;BYDAY=MO;BYSETPOS=1"
+    rrule: Optional[str] = None
+    start_date: date
+    end_date: Optional[date] = None
+
+class RecurringRuleResponse(BaseModel):
+    id: int
+    amount: float
+    description: Optional[str]
+    category: Optional[str]
+    rule: str
+    start_date: str
+    end_date: Optional[str]
+    materialized_through: Optional[str]
+    is_active: bool
+    next_occurrence: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+async def materialize_recurring(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+    """Залежність для читань, що мають бачити регулярні витрати, які вже настали"""
+    recurring.ensure_materialized(db, current_user.id)
+
+
+def _response(rule, today):
+    following = recurring.next_occurrence(rule, today) if rule.is_active else None
+    return {
+        "id": rule.id,
+        "amount": rule.amount,
+        "description": rule.description,
+        "category": rule.category,
+        "rule": rule.rule,
+        "start_date": rule.start_date,
+        "end_date": rule.end_date,
+        "materialized_through": rule.materialized_through,
+        "is_active": rule.is_active,
+        "next_occurrence": following.isoformat() if following else None
+    }
+
+
+@router.post("/", response_model=RecurringRuleResponse, status_code=status.HTTP_201_CREATED)
+async def create_recurring_rule(
+    data: RecurringRuleCreate,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    if data.end_date is not None and data.end_date < data.start_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="end_date не може бути раніше за start_date"
+        )
+    try:
+        rule = recurring.build_rule(data.frequency, data.start_date, data.interval, data.rrule)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    db_rule = RecurringRule(
+        amount=data.amount,
+        description=data.description,
+        category=data.category,
+        rule=rule,
+        start_date=data.start_date.isoformat(),
+        end_date=data.end_date.isoformat() if data.end_date else None,
+        is_active=True,
+        user_id=current_user.id
+    )
+    db.add(db_rule)
+    db.commit()
+
+    # Входження, що вже настали (правило з датою в минулому), записуються одразу
+    today = date.today()
+    recurring.materialize(db, current_user.id, today)
+    db.refresh(db_rule)
+    return _response(db_rule, today)
+
+@router.get("/", response_model=List[RecurringRuleResponse])
+async def get_recurring_rules(
+    request: Request,
+    active_only: bool = True,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    etag, not_modified = versions.conditional_get(request, db, current_user.id, "recurring")
+    if not_modified:
+        return not_modified
+
+    stmt = select(RecurringRule).where(RecurringRule.user_id == current_user.id).order_by(RecurringRule.id)
+    if active_only:
+        stmt = stmt.where(RecurringRule.is_active == True)
+    today = date.today()
+    rules = [_response(rule, today) for rule in db.scalars(stmt)]
+    return FastJSONResponse(rules, headers=versions.headers(etag))
+
+@router.get("/upcoming", dependencies=[Depends(materialize_recurring)])
+async def get_upcoming(
+    days: int = Query(30, ge=1, le=recurring.MAX_UPCOMING_DAYS),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Заплановані входження на days днів вперед (обчислюються з правил, не зберігаються)"""
+    start = date.today()
+    end = start + timedelta(days=days - 1)
+    occurrences = recurring.upcoming(db, current_user.id, start, end)
+    return FastJSONResponse({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "occurrences": occurrences,
+        "total": recurring.scheduled_total(occurrences)
+    })
+
+@router.delete("/{rule_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_recurring_rule(
+    rule_id: int,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    # Дні, що вже настали, записуються до вимкнення правила
+    recurring.materialize(db, current_user.id)
+    db_rule = db.scalars(
+        select(RecurringRule).where(RecurringRule.id == rule_id, RecurringRule.user_id == current_user.id)
+    ).first()
+
+    if db_rule is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Правило не знайдено"
+        )
+
+    # Уже записані витрати лишаються в історії, нові входження більше не з'являються
+    db_rule.is_active = False
+    db.commit()
+
+    return None
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from database import get_db
+from api.auth import get_current_user
+import changefeed
+from serialization import FastJSONResponse
+
+router = APIRouter()
+
+@router.get("/")
+async def sync_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(changefeed.DEFAULT_LIMIT, ge=1, le=changefeed.MAX_LIMIT),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Зміни витрат, категорій, бюджетів і цілей після курсора since
+
+    Клієнт зберігає cursor з відповіді і передає його наступного разу;
+    has_more = true означає, що треба одразу запитати наступну сторінку,
+    reset = true — що локальні дані треба замінити отриманими.
+    """
+    return FastJSONResponse(changefeed.changes_since(db, current_user.id, since, limit))
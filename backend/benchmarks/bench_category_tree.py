@@ -0,0 +1,159 @@
+"""Бенчмарк підсумків піддерев глибокого дерева категорій
+
+Порівнюються три способи отримати суми за піддеревами верхнього рівня:
+  * рекурсивний обхід у Python з запитом на кожну категорію;
+  * дерево й суми за назвами двома запитами + рекурсивний обхід у пам'яті;
+  * category_tree.subtree_totals — один JOIN підсумків з таблицею замикання
+    (те, що віддає /api/analytics/expenses-by-category?rollup=true).
+Для кожного способу друкуються час і кількість SQL-запитів.
+
+Запуск з каталогу backend:
+    python benchmarks/bench_category_tree.py [кількість_витрат] [глибина] [розгалуження]
+    # за замовчуванням 200 000 витрат, глибина 5, по 4 дочірні категорії
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Category, DailyRollup, Expense
+import category_tree
+import rollups
+
+USER_ID = 1
+START = "2024-01-01"
+
+
+def build_tree(depth, fanout):
+    """Категорії (id, parent_id, name) повного дерева заданої глибини"""
+    nodes, level = [], [None]
+    for _ in range(depth):
+        next_level = []
+        for parent_id in level:
+            for _ in range(fanout):
+                category_id = len(nodes) + 1
+                nodes.append((category_id, parent_id, f"Категорія {category_id}"))
+                next_level.append(category_id)
+        level = next_level
+    return nodes
+
+
+def seed(engine, rows, nodes, batch=100000):
+    rng = np.random.default_rng(42)
+    days = (np.datetime64(START) + rng.integers(0, 366, rows)).astype(str)
+    amounts = np.round(rng.gamma(2.0, 150.0, rows), 2)
+    picked = rng.integers(0, len(nodes), rows)
+    with engine.begin() as conn:
+        conn.execute(insert(Category), [
+            {"id": category_id, "parent_id": parent_id, "name": name, "user_id": USER_ID, "is_default": False}
+            for category_id, parent_id, name in nodes
+        ])
+        category_tree.rebuild(conn)
+        for offset in range(0, rows, batch):
+            conn.execute(insert(Expense), [
+                {"amount": float(amounts[i]), "description": "x", "category": nodes[picked[i]][2],
+                 "date": days[i], "user_id": USER_ID}
+                for i in range(offset, min(offset + batch, rows))
+            ])
+        rollups.rebuild(conn)
+
+
+def _category_total(db, name):
+    return db.execute(
+        select(func.coalesce(func.sum(DailyRollup.total), 0.0))
+        .where(DailyRollup.user_id == USER_ID, DailyRollup.category == name, DailyRollup.day >= START)
+    ).scalar()
+
+
+def recursive_queries(db):
+    def walk(category):
+        children = db.execute(
+            select(Category.id, Category.name).where(Category.parent_id == category.id)
+        ).all()
+        return _category_total(db, category.name) + sum(walk(child) for child in children)
+
+    roots = db.execute(
+        select(Category.id, Category.name).where(Category.user_id == USER_ID, Category.parent_id.is_(None))
+    ).all()
+    return {root.id: walk(root) for root in roots}
+
+
+def in_memory_walk(db):
+    children = {}
+    for category_id, parent_id, name in db.execute(
+        select(Category.id, Category.parent_id, Category.name).where(Category.user_id == USER_ID)
+    ):
+        children.setdefault(parent_id, []).append((category_id, name))
+    totals = dict(db.execute(
+        select(DailyRollup.category, func.sum(DailyRollup.total))
+        .where(DailyRollup.user_id == USER_ID, DailyRollup.day >= START)
+        .group_by(DailyRollup.category)
+    ).all())
+
+    def walk(category_id, name):
+        return totals.get(name, 0.0) + sum(walk(*child) for child in children.get(category_id, ()))
+
+    return {category_id: walk(category_id, name) for category_id, name in children[None]}
+
+
+def closure_join(db):
+    return {row["category_id"]: row["total"] for row in category_tree.subtree_totals(db, USER_ID, START)}
+
+
+def measure(Session, engine, fn, repeats=3):
+    queries = []
+    listener = lambda *args: queries.append(1)
+    event.listen(engine, "before_cursor_execute", listener)
+    best = float("inf")
+    try:
+        for _ in range(repeats):
+            queries.clear()
+            db = Session()
+            started = time.perf_counter()
+            result = fn(db)
+            best = min(best, time.perf_counter() - started)
+            db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return best, len(queries), result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    fanout = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    nodes = build_tree(depth, fanout)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{directory}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        started = time.perf_counter()
+        seed(engine, rows, nodes)
+        print(f"{rows:,} витрат, {len(nodes):,} категорій (глибина {depth}, розгалуження {fanout}), "
+              f"заповнення {time.perf_counter() - started:.1f} с")
+
+        Session = sessionmaker(bind=engine)
+        cases = [
+            ("рекурсія з запитами", recursive_queries),
+            ("2 запити + обхід у пам'яті", in_memory_walk),
+            ("JOIN з замиканням", closure_join),
+        ]
+        expected = None
+        print(f"{'спосіб':<30}{'час, мс':>12}{'SQL-запитів':>14}")
+        for name, fn in cases:
+            seconds, query_count, result = measure(Session, engine, fn)
+            print(f"{name:<30}{seconds * 1000:>12.1f}{query_count:>14}")
+            rounded = {key: round(value, 2) for key, value in result.items()}
+            assert expected is None or rounded == expected, f"{name}: інші суми"
+            expected = rounded
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Бенчмарк стиснення: трафік проти CPU для gzip / brotli / zstd
+
+Корисні навантаження: експорт 5000 витрат і річний прогноз по днях.
+Для кожного кодека і рівня друкуються коефіцієнт стиснення, час
+стиснення, а також оцінка часу доставки на повільному мобільному
+каналі (1 Мбіт/с) — сума CPU + передачі показує точку балансу.
+Рядок "stream" — стиснення чанками по 8 КіБ зі скиданням буфера, як
+у CompressionMiddleware для StreamingResponse.
+
+Запуск з каталогу backend:
+    python benchmarks/bench_compression.py
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import compression
+from serialization import dumps
+
+LINK_BYTES_PER_SECOND = 1_000_000 / 8
+CATEGORIES = ["Продукти", "Транспорт", "Розваги", "Здоров'я", "Освіта", "Одяг", "Комунальні", "Інше"]
+
+
+def expenses_export(rows=5000):
+    start = datetime(2024, 1, 1)
+    return dumps([
+        {
+            "id": i,
+            "amount": round(10.0 + (i * 37) % 900 + 0.25, 2),
+            "description": f"Покупка №{i} в магазині",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "date": (start + timedelta(days=i % 365)).strftime("%Y-%m-%d"),
+            "user_id": 1
+        }
+        for i in range(rows)
+    ])
+
+
+def year_forecast():
+    start = datetime(2025, 1, 1)
+    return dumps([
+        {
+            "date": (start + timedelta(days=i)).strftime("%Y-%m-%d"),
+            "predicted": round(450 + 80 * ((i % 7) / 6) + i * 0.3, 2),
+            "lower": round(300 + i * 0.25, 2),
+            "upper": round(600 + i * 0.35, 2)
+        }
+        for i in range(365)
+    ])
+
+
+def codecs():
+    yield compression.GzipCodec(1)
+    yield compression.GzipCodec(6)
+    yield compression.GzipCodec(9)
+    if compression.brotli is not None:
+        yield compression.BrotliCodec(4)
+        yield compression.BrotliCodec(11)
+    if compression.zstandard is not None:
+        yield compression.ZstdCodec(3)
+        yield compression.ZstdCodec(19)
+
+
+def level_of(codec):
+    return getattr(codec, "level", getattr(codec, "quality", ""))
+
+
+def timed(fn, repeats=5):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def streamed(codec, payload, chunk_size=8192):
+    compress, finish = codec.stream()
+    out = [compress(payload[i:i + chunk_size]) for i in range(0, len(payload), chunk_size)]
+    out.append(finish())
+    return b"".join(out)
+
+
+def main():
+    payloads = [("5000 витрат", expenses_export()), ("річний прогноз", year_forecast())]
+    print(f"{'payload':<16}{'кодек':<14}{'розмір КіБ':>12}{'стиснення':>11}{'CPU мс':>9}{'1 Мбіт/с мс':>14}{'разом мс':>10}")
+    for name, payload in payloads:
+        raw_transfer = len(payload) / LINK_BYTES_PER_SECOND * 1000
+        print(f"{name:<16}{'identity':<14}{len(payload) / 1024:>12.1f}{1.0:>11.2f}{0.0:>9.2f}"
+              f"{raw_transfer:>14.1f}{raw_transfer:>10.1f}")
+        for codec in codecs():
+            for mode, fn in (("", lambda: codec.compress(payload)), (" stream", lambda: streamed(codec, payload))):
+                seconds, body = timed(fn)
+                transfer = len(body) / LINK_BYTES_PER_SECOND * 1000
+                label = f"{codec.name}-{level_of(codec)}{mode}"
+                print(f"{name:<16}{label:<14}{len(body) / 1024:>12.1f}{len(payload) / len(body):>11.2f}"
+                      f"{seconds * 1000:>9.2f}{transfer:>14.1f}{seconds * 1000 + transfer:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
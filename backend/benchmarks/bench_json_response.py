@@ -0,0 +1,94 @@
+"""Бенчмарк серіалізації відповідей: jsonable_encoder + json проти FastJSONResponse
+
+Відтворює дві найважчі відповіді: GET /api/expenses?limit=1000 і
+/api/analytics/expenses-by-category, і для кожного кодувальника міряє
+час рендеру та пікові алокації (tracemalloc).
+
+Запуск з каталогу backend:
+    python benchmarks/bench_json_response.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import serialization
+from serialization import FastJSONResponse
+
+CATEGORIES = ["Продукти", "Транспорт", "Розваги", "Здоров'я", "Освіта", "Одяг", "Комунальні", "Інше"]
+
+
+def expenses_payload(rows=1000):
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "id": i,
+            "amount": round(10.0 + (i * 37) % 900 + 0.25, 2),
+            "description": f"Покупка №{i}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "date": (start + timedelta(days=i % 365)).strftime("%Y-%m-%d"),
+            "user_id": 1,
+            "created_at": start + timedelta(minutes=i)
+        }
+        for i in range(rows)
+    ]
+
+
+def by_category_payload():
+    return [
+        {"category": name, "total": 1234.5 * (i + 1), "count": 10 * (i + 1), "percentage": 12.5}
+        for i, name in enumerate(CATEGORIES)
+    ]
+
+
+def stdlib_render(content):
+    # Шлях FastAPI за замовчуванням для відповідей без response_model
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast_render(content):
+    return FastJSONResponse(content).body
+
+
+def measure(fn, content, iterations):
+    fn(content)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(content)
+    elapsed = (time.perf_counter() - started) / iterations
+
+    tracemalloc.start()
+    fn(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1e3, peak / 1024
+
+
+def main():
+    payloads = [
+        ("GET /api/expenses?limit=1000", expenses_payload(), 50),
+        ("GET /api/analytics/expenses-by-category", by_category_payload(), 5000),
+    ]
+    orjson_module = serialization.orjson
+    encoders = [("jsonable_encoder+json", stdlib_render), ("FastJSONResponse", fast_render)]
+
+    print(f"{'відповідь':<42}{'кодувальник':<28}{'мс':>10}{'пік КіБ':>12}")
+    for name, content, iterations in payloads:
+        for label, fn in encoders:
+            ms, kib = measure(fn, content, iterations)
+            print(f"{name:<42}{label:<28}{ms:>10.3f}{kib:>12.1f}")
+        if orjson_module is not None:
+            serialization.orjson = None
+            ms, kib = measure(fast_render, content, iterations)
+            serialization.orjson = orjson_module
+            print(f"{name:<42}{'FastJSONResponse (fallback)':<28}{ms:>10.3f}{kib:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Бенчмарк списків: ORM + from_attributes-валідація проти Core-рядків у JSON
+
+Для кожного ендпоінта порівнюється старий шлях (ORM-сутності, pydantic
+TypeAdapter з from_attributes, jsonable_encoder, json) і швидкий шлях
+(select потрібних колонок -> serialization.rows_response).
+
+Запуск з каталогу backend:
+    python benchmarks/bench_list_endpoints.py [кількість_рядків]
+"""
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Expense, Category, Budget, Goal
+from api.expenses import ExpenseResponse
+from api.categories import CategoryResponse
+from api.budgets import BudgetResponse
+from api.goals import GoalResponse
+import queries
+import serialization
+
+USER_ID = 1
+
+
+def seed(db, rows):
+    db.add_all([
+        Expense(amount=10.0 + i % 500, description=f"Покупка {i}", category="Продукти",
+                date=f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}", user_id=USER_ID)
+        for i in range(rows)
+    ])
+    db.add_all([
+        Category(name=f"Категорія {i}", description="", color="#607D8B", icon="📦",
+                 is_default=False, user_id=USER_ID)
+        for i in range(rows)
+    ])
+    db.add_all([
+        Budget(name=f"Бюджет {i}", amount=1000.0, spent=float(i % 1000), period="monthly",
+               start_date="2024-01-01", end_date="2024-01-31", is_active=True, user_id=USER_ID)
+        for i in range(rows)
+    ])
+    db.add_all([
+        Goal(title=f"Ціль {i}", description="", target_amount=5000.0, current_amount=float(i % 5000),
+             target_date="2025-01-01", is_achieved=False, user_id=USER_ID)
+        for i in range(rows)
+    ])
+    db.commit()
+
+
+def orm_path(db, model, response_model, extra=None):
+    objects = db.query(model).filter(model.user_id == USER_ID).all()
+    if extra:
+        for obj in objects:
+            extra(obj)
+    validated = TypeAdapter(List[response_model]).validate_python(objects, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def budget_extra(budget):
+    budget.remaining = max(0, budget.amount - budget.spent)
+    budget.percentage_used = (budget.spent / budget.amount * 100) if budget.amount > 0 else 0
+
+
+def goal_extra(goal):
+    goal.progress_percentage = (goal.current_amount / goal.target_amount * 100) if goal.target_amount > 0 else 0
+    goal.remaining_amount = max(0, goal.target_amount - goal.current_amount)
+
+
+def best_of(fn, repeats=5):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    seed(Session(), rows)
+
+    def fresh(fn):
+        def run():
+            db = Session()
+            try:
+                return fn(db)
+            finally:
+                db.close()
+        return run
+
+    cases = [
+        ("GET /api/expenses",
+         fresh(lambda db: orm_path(db, Expense, ExpenseResponse)),
+         fresh(lambda db: serialization.rows_response(db.execute(queries.expense_rows(USER_ID, limit=rows))))),
+        ("GET /api/categories",
+         fresh(lambda db: orm_path(db, Category, CategoryResponse)),
+         fresh(lambda db: serialization.rows_response(db.execute(queries.category_rows(USER_ID, False))))),
+        ("GET /api/budgets",
+         fresh(lambda db: orm_path(db, Budget, BudgetResponse, budget_extra)),
+         fresh(lambda db: serialization.rows_response(db.execute(queries.budget_rows(USER_ID))))),
+        ("GET /api/goals",
+         fresh(lambda db: orm_path(db, Goal, GoalResponse, goal_extra)),
+         fresh(lambda db: serialization.rows_response(db.execute(queries.goal_rows(USER_ID))))),
+    ]
+
+    encoder = "orjson" if serialization.orjson is not None else "json"
+    print(f"{rows} рядків на ендпоінт, серіалізатор швидкого шляху: {encoder}")
+    print(f"{'ендпоінт':<22}{'ORM рядків/с':>16}{'Core рядків/с':>16}{'прискорення':>14}")
+    for name, before, after in cases:
+        before_s = best_of(before)
+        after_s = best_of(after)
+        print(f"{name:<22}{rows / before_s:>16,.0f}{rows / after_s:>16,.0f}{before_s / after_s:>13.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Бенчмарк зведеної таблиці категорія × місяць
+
+Порівнюються три способи отримати матрицю за рік:
+  * по одному GROUP BY category на кожен місяць (як 12 викликів expenses-by-category);
+  * один запит по витратах + pandas (одне сканування таблиці);
+  * pivot.build з денних підсумків (те, що віддає /api/analytics/pivot).
+Для кожного способу друкуються час і кількість SQL-запитів.
+
+Запуск з каталогу backend:
+    python benchmarks/bench_pivot.py [кількість_витрат]   # за замовчуванням 1 000 000
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Expense
+import pivot
+import rollups
+
+USER_ID = 1
+CATEGORIES = ["Продукти", "Транспорт", "Розваги", "Кафе", "Комунальні", "Здоров'я", "Освіта", "Одяг"]
+START, END = date(2024, 1, 1), date(2024, 12, 31)
+
+
+def seed(engine, rows, batch=100000):
+    rng = np.random.default_rng(42)
+    days = (np.datetime64("2024-01-01") + rng.integers(0, 366, rows)).astype(str)
+    amounts = np.round(rng.gamma(2.0, 150.0, rows), 2)
+    categories = rng.integers(0, len(CATEGORIES), rows)
+    with engine.begin() as conn:
+        for offset in range(0, rows, batch):
+            conn.execute(insert(Expense), [
+                {"amount": float(amounts[i]), "description": "x", "category": CATEGORIES[categories[i]],
+                 "date": days[i], "user_id": USER_ID}
+                for i in range(offset, min(offset + batch, rows))
+            ])
+        rollups.rebuild(conn)
+
+
+def per_month_queries(db):
+    matrix = {}
+    for month in range(1, 13):
+        month_start = f"2024-{month:02d}-01"
+        month_end = f"2024-{month:02d}-31"
+        for category, total in db.execute(
+            select(Expense.category, func.sum(Expense.amount))
+            .where(Expense.user_id == USER_ID, Expense.date >= month_start, Expense.date <= month_end)
+            .group_by(Expense.category)
+        ):
+            matrix[(category, month)] = total
+    return matrix
+
+
+def single_scan(db):
+    frame = pd.DataFrame(
+        db.execute(select(Expense.date, Expense.category, Expense.amount).where(Expense.user_id == USER_ID)).all(),
+        columns=["date", "category", "amount"]
+    )
+    frame["month"] = frame["date"].str.slice(0, 7)
+    return frame.pivot_table(index="category", columns="month", values="amount", aggfunc="sum", fill_value=0.0)
+
+
+def from_rollups(db):
+    return pivot.build(db, USER_ID, "category", "month", START, END)
+
+
+def measure(Session, engine, fn, repeats=3):
+    queries = []
+    listener = lambda *args: queries.append(1)
+    event.listen(engine, "before_cursor_execute", listener)
+    best = float("inf")
+    try:
+        for _ in range(repeats):
+            queries.clear()
+            db = Session()
+            started = time.perf_counter()
+            fn(db)
+            best = min(best, time.perf_counter() - started)
+            db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return best, len(queries)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{directory}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        started = time.perf_counter()
+        seed(engine, rows)
+        print(f"{rows:,} витрат за 2024 рік, заповнення {time.perf_counter() - started:.1f} с")
+
+        Session = sessionmaker(bind=engine)
+        cases = [
+            ("12 × GROUP BY по витратах", per_month_queries),
+            ("1 сканування + pandas", single_scan),
+            ("pivot.build (підсумки)", from_rollups),
+        ]
+        print(f"{'спосіб':<30}{'час, мс':>12}{'SQL-запитів':>14}")
+        for name, fn in cases:
+            seconds, query_count = measure(Session, engine, fn)
+            print(f"{name:<30}{seconds * 1000:>12.1f}{query_count:>14}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
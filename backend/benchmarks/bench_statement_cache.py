@@ -0,0 +1,91 @@
+"""Мікробенчмарк: побудова + компіляція запитів на кожен запит проти кешованих
+
+Запуск з каталогу backend:
+    python benchmarks/bench_statement_cache.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Expense, Category
+import queries
+
+ITERATIONS = 5000
+
+
+def timed(fn, iterations=ITERATIONS):
+    fn()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([
+        Expense(amount=float(i), description=f"e{i}", category="food", date="2024-01-15", user_id=1)
+        for i in range(50)
+    ])
+    db.add(Category(name="Продукти", is_default=True))
+    db.commit()
+
+    # Лише побудова запиту + ключ кешу: те, що роутер робить до виконання SQL
+    def build_expense_query():
+        query = db.query(Expense).filter(Expense.id == 7, Expense.user_id == 1)
+        query.statement._generate_cache_key()
+
+    def build_expense_cached():
+        queries.expense_by_id._generate_cache_key()
+
+    def build_list_query():
+        query = db.query(Expense).filter(Expense.user_id == 1).filter(Expense.category == "food")
+        query.order_by(Expense.date.desc()).offset(0).limit(100).statement._generate_cache_key()
+
+    def build_list_cached():
+        queries.expense_rows(1, category="food")._generate_cache_key()
+
+    # Повний запит: побудова, кеш/компіляція, виконання і завантаження об'єктів
+    def run_get_expense():
+        db.query(Expense).filter(Expense.id == 7, Expense.user_id == 1).first()
+
+    def run_get_expense_cached():
+        db.scalars(queries.expense_by_id, {"expense_id": 7, "user_id": 1}).first()
+
+    def run_get_categories():
+        db.query(Category).filter(
+            (Category.user_id == 1) | (Category.is_default == True)
+        ).order_by(Category.is_default.desc(), Category.name).all()
+
+    def run_get_categories_cached():
+        db.execute(queries.category_rows(1)).all()
+
+    # Компіляція без кешу — верхня межа того, що економить кеш SQLAlchemy
+    def compile_uncached():
+        db.query(Expense).filter(Expense.id == 7, Expense.user_id == 1).statement.compile(engine)
+
+    rows = [
+        ("get_expense: побудова запиту", build_expense_query, build_expense_cached),
+        ("get_expenses: побудова запиту", build_list_query, build_list_cached),
+        ("get_expense: весь запит", run_get_expense, run_get_expense_cached),
+        ("get_categories: весь запит", run_get_categories, run_get_categories_cached),
+    ]
+
+    print(f"{'сценарій':<34}{'query() мкс':>14}{'кеш мкс':>12}{'прискорення':>14}")
+    for name, before, after in rows:
+        before_us = timed(before)
+        after_us = timed(after)
+        print(f"{name:<34}{before_us:>14.1f}{after_us:>12.1f}{before_us / after_us:>13.1f}x")
+    print(f"\nПовна компіляція SQL без кешу: {timed(compile_uncached, 1000):.1f} мкс на запит")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import threading
+from datetime import date, datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select, update, func, case, literal, bindparam
+
+import changefeed
+import changes
+import jobs
+import queries
+import versions
+from models import Budget
+
+# Вікна бюджетів за періодом. Бюджет зберігає поточне вікно (start_date,
+# end_date) і день відліку anchor_date; коли вікно минає, пакетний обхід
+# переносить усі такі бюджети у вікно, що містить сьогодні, одним UPDATE
+# (з перенесенням невитраченого залишку для carry_over). Читання бачать уже
+# актуальне вікно і не рахують дат для кожного рядка; витрачене в ньому
+# рахується з денних підсумків (queries.BUDGET_COLUMNS), а не зберігається.
+PERIODS = {
+    "weekly": relativedelta(weeks=1),
+    "monthly": relativedelta(months=1),
+    "yearly": relativedelta(years=1),
+}
+ROLLOVER_INTERVAL_SECONDS = 3600
+
+_rolled = {}
+_rolled_lock = threading.Lock()
+_stats = {"rolled_over": 0, "lazy_runs": 0, "sweeps": 0}
+
+
+def parse_day(value):
+    try:
+        return datetime.fromisoformat(str(value)[:10]).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def window(period, anchor, day):
+    """(start, end) вікна періоду, що містить day; вікна відлічуються від anchor"""
+    step = PERIODS[period]
+    if period == "weekly":
+        count = (day - anchor).days // 7
+    elif period == "monthly":
+        count = (day.year - anchor.year) * 12 + day.month - anchor.month
+    else:
+        count = day.year - anchor.year
+    # Кожна межа рахується від anchor, а не від попередньої (31.01 -> 28.02 -> 31.03)
+    if anchor + step * count > day:
+        count -= 1
+    return anchor + step * count, anchor + step * (count + 1) - timedelta(days=1)
+
+
+_day = lambda column: func.substr(column, 1, 10)
+
+_expired = select(
+    Budget.id, Budget.user_id, Budget.period, Budget.start_date, Budget.anchor_date
+).where(
+    Budget.is_active == True,
+    Budget.period.in_(list(PERIODS)),
+    _day(Budget.end_date) < bindparam("today")
+)
+
+# SET бачить значення рядка до зміни: залишок рахується за старим вікном.
+# update(Budget), а не Budget.__table__: сесія маршрутизує вираз у шард за mapper;
+# core_only — пакетне виконання з WHERE за bindparam замість ORM-оновлення за ключем
+_rollover = update(Budget).where(Budget.id == bindparam("budget_id")).values(
+    carried_over=case(
+        (Budget.carry_over == True, func.max(
+            literal(0.0),
+            Budget.amount + func.coalesce(Budget.carried_over, 0.0)
+            - queries.budget_spent_between(_day(Budget.start_date), _day(Budget.end_date))
+        )),
+        else_=literal(0.0)
+    ),
+    anchor_date=func.coalesce(Budget.anchor_date, _day(Budget.start_date)),
+    start_date=bindparam("start"),
+    end_date=bindparam("end"),
+    change_seq=bindparam("seq")
+).execution_options(dml_strategy="core_only")
+
+
+def rollover(db, today=None, user_id=None):
+    """Перенести бюджети з вікном, що минуло, у вікно, яке містить today
+
+    Один SELECT і один пакетний UPDATE на всі такі бюджети бази (або одного
+    користувача). Повертає кількість перенесених бюджетів; комітить викликач.
+    """
+    today = today or date.today()
+    stmt = _expired if user_id is None else _expired.where(Budget.user_id == user_id)
+    expired = db.execute(stmt, {"today": today.isoformat()}).all()
+
+    windows = {}
+    rows = []
+    for budget in expired:
+        anchor = parse_day(budget.anchor_date) or parse_day(budget.start_date)
+        if anchor is None:
+            continue
+        key = (budget.period, anchor)
+        if key not in windows:
+            windows[key] = window(budget.period, anchor, today)
+        start, end = windows[key]
+        rows.append({"budget_id": budget.id, "user_id": budget.user_id,
+                     "start": start.isoformat(), "end": end.isoformat()})
+    if not rows:
+        return 0
+
+    seq = changefeed.allocate(db, len(rows))
+    db.execute(_rollover, [{**row, "seq": seq + offset} for offset, row in enumerate(rows)])
+    users = {row["user_id"] for row in rows}
+    versions.bump(db, {(uid, "budgets") for uid in users})
+    changes.record_bulk(db, "budgets", users)
+    _stats["rolled_over"] += len(rows)
+    return len(rows)
+
+
+def ensure_current(db, user_id, today=None):
+    """Ліниво перенести бюджети користувача, що минули, — не частіше разу на день"""
+    today = today or date.today()
+    with _rolled_lock:
+        if _rolled.get(user_id) == today:
+            return 0
+    rolled = rollover(db, today, user_id)
+    if rolled:
+        db.commit()
+    _stats["lazy_runs"] += 1
+    with _rolled_lock:
+        _rolled[user_id] = today
+    return rolled
+
+
+@changes.on_commit
+def _forget_rolled(changeset):
+    # Новий чи змінений бюджет може мати вікно, що вже минуло
+    users = {change.user_id for change in changeset
+             if change.table == "budgets" and isinstance(change, changes.Change)}
+    if users:
+        with _rolled_lock:
+            for user_id in users:
+                _rolled.pop(user_id, None)
+
+
+def rollover_due(bind, today=None):
+    """Пакетно перенести бюджети всіх користувачів однієї бази"""
+    from database import SessionLocal
+
+    db = SessionLocal(bind=bind)
+    try:
+        rolled = rollover(db, today)
+        db.commit()
+    finally:
+        db.close()
+    return rolled
+
+
+@jobs.periodic("budget-rollover", ROLLOVER_INTERVAL_SECONDS)
+def _sweep():
+    from database import shard_router
+
+    for shard_engine in shard_router.engines:
+        rollover_due(shard_engine)
+    _stats["sweeps"] += 1
+
+
+def limit(budget):
+    """Ліміт поточного вікна: сума бюджету плюс перенесений залишок"""
+    return (budget.amount or 0.0) + (budget.carried_over or 0.0)
+
+
+def stats():
+    with _rolled_lock:
+        tracked = len(_rolled)
+    return {**_stats, "tracked_users": tracked}
@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+from sqlalchemy import select, bindparam
+
+import queries
+import versions
+from models import Category
+
+# Кеш категорій процесу: незмінний знімок стандартних категорій (спільний для
+# всіх користувачів бази) і знімки власних категорій користувачів. Знімок
+# актуальний, доки не змінилась версія колекції categories (див. versions):
+# запис категорії через ORM збільшує версію, і наступне читання завантажує
+# знімок заново. Перевірка категорій і пошук id за назвою не звертаються до
+# таблиці categories, лише до версії (один запит за первинним ключем).
+MAX_CACHED_USERS = 10000
+
+_defaults = {}
+_users = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "default_loads": 0}
+
+_default_rows = select(*queries.CATEGORY_COLUMNS).where(Category.is_default == True)
+_user_rows = select(*queries.CATEGORY_COLUMNS).where(Category.user_id == bindparam("user_id"))
+
+
+def _sort_key(row):
+    # Порядок queries.category_rows: стандартні першими, далі за назвою
+    return (not row.is_default, row.name is not None, row.name or "")
+
+
+class CategoryMap:
+    """Незмінний знімок категорій: рядки CATEGORY_COLUMNS за id і за назвою"""
+
+    __slots__ = ("version", "rows", "by_id", "by_name")
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = tuple(sorted(rows, key=_sort_key))
+        self.by_id = MappingProxyType({row.id: row for row in self.rows})
+        self.by_name = MappingProxyType({row.name: row.id for row in self.rows})
+
+
+class UserCategories:
+    """Категорії, видимі користувачу: власні поверх стандартних"""
+
+    __slots__ = ("user_id", "defaults", "own")
+
+    def __init__(self, user_id, defaults, own):
+        self.user_id = user_id
+        self.defaults = defaults
+        self.own = own
+
+    @property
+    def version(self):
+        return f"{self.own.version}.{self.defaults.version}"
+
+    def visible(self, category_id):
+        """Рядок категорії, яку користувач може використовувати (власна або стандартна)"""
+        return self.own.by_id.get(category_id) or self.defaults.by_id.get(category_id)
+
+    def owned(self, category_id):
+        """Рядок власної (не стандартної) категорії — лише такі можна змінювати"""
+        row = self.own.by_id.get(category_id)
+        return row if row is not None and not row.is_default else None
+
+    def own_id(self, name):
+        return self.own.by_name.get(name)
+
+    def resolve(self, name):
+        """id категорії за назвою: власна, а якщо такої немає — стандартна"""
+        category_id = self.own.by_name.get(name)
+        return category_id if category_id is not None else self.defaults.by_name.get(name)
+
+    def rows(self, include_default=True):
+        """Рядки для списку категорій у порядку queries.category_rows"""
+        if not include_default:
+            return list(self.own.rows)
+        rows = {row.id: row for row in self.defaults.rows}
+        rows.update((row.id, row) for row in self.own.rows)
+        return sorted(rows.values(), key=_sort_key)
+
+
+def get(db, user_id, version=None):
+    """Категорії користувача з кешу; version — вже прочитана versions.current(..., "categories")"""
+    own_version, defaults_version = (version or versions.current(db, user_id, "categories")).split(".")
+    bind = db.get_bind(mapper=Category.__mapper__)
+
+    with _lock:
+        defaults = _defaults.get(bind)
+    if defaults is None or defaults.version != defaults_version:
+        defaults = CategoryMap(defaults_version, db.execute(_default_rows).all())
+        _stats["default_loads"] += 1
+        if not db.info.get("committed_changes"):
+            with _lock:
+                _defaults[bind] = defaults
+
+    key = (bind, user_id)
+    with _lock:
+        own = _users.get(key)
+        if own is not None and own.version == own_version:
+            _users.move_to_end(key)
+            _stats["hits"] += 1
+            return UserCategories(user_id, defaults, own)
+
+    own = CategoryMap(own_version, db.execute(_user_rows, {"user_id": user_id}).all())
+    _stats["misses"] += 1
+    if db.info.get("committed_changes"):
+        # Незакомічені зміни цієї транзакції: після відкату версія повториться
+        return UserCategories(user_id, defaults, own)
+    with _lock:
+        _users[key] = own
+        _users.move_to_end(key)
+        while len(_users) > MAX_CACHED_USERS:
+            _users.popitem(last=False)
+    return UserCategories(user_id, defaults, own)
+
+
+def clear():
+    with _lock:
+        _defaults.clear()
+        _users.clear()
+
+
+def stats():
+    with _lock:
+        cached = len(_users)
+    return {**_stats, "cached_users": cached}
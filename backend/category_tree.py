@@ -0,0 +1,186 @@
+from sqlalchemy import select, insert, delete, exists, func, literal, and_, or_, case, bindparam, true
+from sqlalchemy.orm import aliased
+
+import changes
+from models import Category, CategoryClosure, DailyRollup
+
+# Ієрархія категорій у таблиці замикання (closure table): для кожної категорії
+# зберігаються всі її предки з глибиною. Підсумки піддерева — один JOIN
+# підсумків з замиканням, без рекурсивного обходу дерева в Python. Замикання
+# оновлюється в транзакції запису категорії (створення, переміщення, видалення).
+
+UNCATEGORIZED = "Без категории"
+
+changes.track_history(Category.parent_id)
+
+def _link(session, category_id, parent_id):
+    """Рядки замикання нової категорії: вона сама + усі предки батька"""
+    rows = select(literal(category_id), literal(category_id), literal(0))
+    if parent_id is not None:
+        rows = rows.union_all(
+            select(CategoryClosure.ancestor_id, literal(category_id), CategoryClosure.depth + 1)
+            .where(CategoryClosure.descendant_id == parent_id)
+        )
+    session.execute(insert(CategoryClosure).from_select(["ancestor_id", "descendant_id", "depth"], rows))
+
+
+def _move(session, category_id, parent_id):
+    """Перенести піддерево category_id під parent_id (None — на верхній рівень)"""
+    subtree = select(CategoryClosure.descendant_id).where(CategoryClosure.ancestor_id == category_id)
+    # Від'єднати піддерево від усіх колишніх предків (зв'язки всередині піддерева лишаються)
+    session.execute(delete(CategoryClosure).where(
+        CategoryClosure.descendant_id.in_(subtree),
+        CategoryClosure.ancestor_id.not_in(subtree)
+    ).execution_options(synchronize_session=False))
+    if parent_id is None:
+        return
+    above, below = aliased(CategoryClosure), aliased(CategoryClosure)
+    session.execute(insert(CategoryClosure).from_select(
+        ["ancestor_id", "descendant_id", "depth"],
+        # Декартів добуток: кожен предок батька × кожен вузол піддерева
+        select(above.ancestor_id, below.descendant_id, above.depth + below.depth + 1)
+        .select_from(above).join(below, true())
+        .where(above.descendant_id == parent_id, below.ancestor_id == category_id)
+    ))
+
+
+def is_descendant(db, category_id, ancestor_id):
+    """Чи лежить category_id у піддереві ancestor_id (включно з нею самою)"""
+    return db.execute(select(exists().where(
+        CategoryClosure.ancestor_id == ancestor_id, CategoryClosure.descendant_id == category_id
+    ))).scalar()
+
+
+@changes.after_flush
+def _maintain_closure(session, changeset):
+    changed = [change for change in changeset if change.table == "categories"]
+    if not changed:
+        return
+    # Батьки, вставлені в цьому ж flush, отримують рядки замикання раніше за дітей
+    pending = {change.obj.id: change for change in changed if change.kind == "insert"}
+    while pending:
+        ready = [key for key, change in pending.items() if change.obj.parent_id not in pending]
+        if not ready:
+            raise ValueError("Цикл у батьківських категоріях")
+        for key in sorted(ready):
+            _link(session, key, pending.pop(key).obj.parent_id)
+
+    for change in changed:
+        if change.kind == "update" and change.changed("parent_id"):
+            parent_id = change.obj.parent_id
+            if parent_id is not None and is_descendant(session, parent_id, change.id):
+                raise ValueError("Категорію не можна перенести всередину її власного піддерева")
+            _move(session, change.id, parent_id)
+        elif change.kind == "delete":
+            session.execute(delete(CategoryClosure).where(
+                or_(CategoryClosure.ancestor_id == change.id, CategoryClosure.descendant_id == change.id)
+            ).execution_options(synchronize_session=False))
+
+
+def rebuild(conn, user_id=None):
+    """Перебудувати замикання з parent_id усіх категорій (рекурсивний CTE)
+
+    З user_id — лише рядки власних категорій користувача: від кожної з них
+    угору до кореня (після переносу користувача в інший шард).
+    """
+    if user_id is None:
+        tree = select(
+            Category.id.label("ancestor_id"), Category.id.label("descendant_id"), literal(0).label("depth")
+        ).cte("tree", recursive=True)
+        child = aliased(Category)
+        tree = tree.union_all(
+            select(tree.c.ancestor_id, child.id, tree.c.depth + 1).join(child, child.parent_id == tree.c.descendant_id)
+        )
+        conn.execute(delete(CategoryClosure))
+        conn.execute(insert(CategoryClosure).from_select(["ancestor_id", "descendant_id", "depth"], select(tree)))
+        return
+
+    drop_user(conn, user_id)
+    tree = select(
+        Category.id.label("ancestor_id"), Category.id.label("descendant_id"), literal(0).label("depth")
+    ).where(Category.user_id == user_id).cte("tree", recursive=True)
+    node = aliased(Category)
+    tree = tree.union_all(
+        select(node.parent_id, tree.c.descendant_id, tree.c.depth + 1)
+        .join(node, node.id == tree.c.ancestor_id)
+        .where(node.parent_id.is_not(None))
+    )
+    conn.execute(insert(CategoryClosure).from_select(["ancestor_id", "descendant_id", "depth"], select(tree)))
+
+
+def drop_user(conn, user_id):
+    """Видалити рядки замикання власних категорій користувача (таблиця без user_id)"""
+    own = select(Category.id).where(Category.user_id == user_id)
+    conn.execute(delete(CategoryClosure).where(
+        or_(CategoryClosure.descendant_id.in_(own), CategoryClosure.ancestor_id.in_(own))
+    ))
+
+
+def ensure_built(bind):
+    """Побудувати замикання для бази, де категорії з'явились раніше за нього"""
+    with bind.begin() as conn:
+        has_closure = conn.execute(select(CategoryClosure.ancestor_id).limit(1)).first() is not None
+        has_categories = conn.execute(select(Category.id).limit(1)).first() is not None
+        if has_categories and not has_closure:
+            rebuild(conn)
+
+
+# Категорія, якою для користувача позначено назву в expenses: власна, а якщо
+# такої немає — стандартна (назви витрат не прив'язані до id)
+_named = select(
+    Category.name,
+    func.coalesce(
+        func.max(case((Category.user_id == bindparam("user_id"), Category.id))), func.min(Category.id)
+    ).label("id")
+).where(
+    (Category.user_id == bindparam("user_id")) | (Category.is_default == True)
+).group_by(Category.name).subquery("named")
+
+_ancestor = aliased(Category, name="ancestor")
+
+# Спершу підсумки за назвами (рядків — скільки категорій, а не днів), потім
+# розподіл по предках через замикання — усе одним запитом
+_by_name = select(
+    DailyRollup.category,
+    func.sum(DailyRollup.total).label("total"),
+    func.sum(DailyRollup.count).label("count")
+).where(
+    DailyRollup.user_id == bindparam("user_id"),
+    DailyRollup.day >= bindparam("start")
+).group_by(DailyRollup.category).subquery("by_name")
+
+_subtree_totals = select(
+    _ancestor.id.label("category_id"),
+    _ancestor.name.label("name"),
+    func.sum(_by_name.c.total).label("total"),
+    func.sum(_by_name.c.count).label("count")
+).select_from(_by_name).outerjoin(
+    _named, _named.c.name == _by_name.c.category
+).outerjoin(
+    CategoryClosure, CategoryClosure.descendant_id == _named.c.id
+).outerjoin(
+    _ancestor, _ancestor.id == CategoryClosure.ancestor_id
+).group_by(_ancestor.id)
+
+# Верхній рівень дерева + витрати з назвами без категорії (ancestor = NULL)
+_top_level_totals = _subtree_totals.where(or_(_ancestor.id.is_(None), _ancestor.parent_id.is_(None)))
+
+# Прямі діти parent_id (з піддеревами) і власні витрати самої parent_id
+_children_totals = _subtree_totals.where(or_(
+    _ancestor.parent_id == bindparam("parent_id"),
+    and_(_ancestor.id == bindparam("parent_id"), CategoryClosure.depth == 0)
+))
+
+
+def subtree_totals(db, user_id, start, parent_id=None):
+    """Суми витрат з дня start по піддеревах: верхнього рівня або дітей parent_id"""
+    params = {"user_id": user_id, "start": start}
+    if parent_id is None:
+        rows = db.execute(_top_level_totals, params).all()
+    else:
+        rows = db.execute(_children_totals, {**params, "parent_id": parent_id}).all()
+    return [
+        {"category_id": row.category_id, "category": row.name or UNCATEGORIZED,
+         "total": row.total, "count": row.count, "direct": row.category_id == parent_id}
+        for row in rows
+    ]
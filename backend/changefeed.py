@@ -0,0 +1,136 @@
+from sqlalchemy import select, update, insert, bindparam, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import changes
+import queries
+from models import Expense, Category, Budget, Goal, ChangeSequence, Tombstone
+
+# Таблиці, зміни яких віддає /api/sync: таблиця -> модель
+SYNC_MODELS = {
+    "expenses": Expense,
+    "categories": Category,
+    "budgets": Budget,
+    "goals": Goal
+}
+
+# Особливий надгробок: ідентифікатори рядків користувача змінились
+# (перенесення між шардами), клієнт має почати синхронізацію з нуля
+RESET_ENTITY = "*"
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+
+def allocate(conn, count, floor=0):
+    """Зарезервувати count номерів послідовності БД; повертає перший
+
+    floor піднімає лічильник щонайменше до заданого значення (потрібно,
+    коли користувач переходить на шард з меншим лічильником).
+    """
+    stmt = sqlite_insert(ChangeSequence).values(id=1, value=floor + count)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["id"],
+        set_={"value": func.max(ChangeSequence.value, floor) + count}
+    ).returning(ChangeSequence.value)
+    last = conn.execute(stmt).scalar_one()
+    return last - count + 1
+
+
+def last_seq(conn):
+    return conn.execute(select(ChangeSequence.value).where(ChangeSequence.id == 1)).scalar() or 0
+
+
+@changes.on_flush
+def _stamp_changes(session, changeset):
+    tracked = [change for change in changeset if change.table in SYNC_MODELS]
+    if not tracked:
+        return
+
+    seq = allocate(session, len(tracked))
+    tombstones = []
+    for change in tracked:
+        if change.kind == "delete":
+            tombstones.append({
+                "entity": change.table,
+                "entity_id": change.obj.id,
+                "user_id": change.user_id,
+                "change_seq": seq
+            })
+        else:
+            change.obj.change_seq = seq
+        seq += 1
+    if tombstones:
+        session.execute(insert(Tombstone), tombstones)
+
+
+def stamp_unsequenced(bind):
+    """Видати номери рядкам без change_seq (дані до міграції, сирі INSERT)"""
+    with bind.begin() as conn:
+        for model in SYNC_MODELS.values():
+            table = model.__table__
+            ids = conn.execute(
+                select(table.c.id).where(table.c.change_seq.is_(None)).order_by(table.c.id)
+            ).scalars().all()
+            if not ids:
+                continue
+            first = allocate(conn, len(ids))
+            conn.execute(
+                update(table).where(table.c.id == bindparam("row_id")).values(change_seq=bindparam("seq")),
+                [{"row_id": row_id, "seq": first + offset} for offset, row_id in enumerate(ids)]
+            )
+
+
+def mark_reset(conn, user_id, floor=0):
+    """Записати надгробок скидання: клієнти користувача синхронізуються з нуля"""
+    conn.execute(insert(Tombstone).values(
+        entity=RESET_ENTITY,
+        entity_id=0,
+        user_id=user_id,
+        change_seq=allocate(conn, 1, floor)
+    ))
+
+
+_reset_query = select(Tombstone.change_seq).where(
+    Tombstone.user_id == bindparam("user_id"),
+    Tombstone.entity == RESET_ENTITY,
+    Tombstone.change_seq > bindparam("since")
+).limit(1)
+
+
+def changes_since(db, user_id, since=0, limit=DEFAULT_LIMIT):
+    """Зміни користувача з номером після since, не більше limit на сутність
+
+    Верхня межа upto фіксується до вибірки, тож рядки, закомічені під час
+    запиту, прийдуть наступного разу. Якщо якась сутність обрізана лімітом,
+    upto зсувається перед першим необрізаним рядком — курсор не пропускає змін.
+    """
+    upto = last_seq(db)
+    reset = since > 0 and db.execute(_reset_query, {"user_id": user_id, "since": since}).first() is not None
+    if reset or since > upto:
+        # Курсор з іншого шарду або з очищеної БД — повна синхронізація
+        reset, since = True, 0
+
+    params = {"user_id": user_id, "since": since, "upto": upto, "limit": limit + 1}
+    fetched = {name: db.execute(stmt, params).all() for name, stmt in queries.changed_rows.items()}
+    deleted = db.execute(queries.deleted_rows, params).all() if since > 0 else []
+
+    has_more = False
+    for rows in list(fetched.values()) + [deleted]:
+        if len(rows) > limit:
+            has_more = True
+            upto = min(upto, rows[limit].change_seq - 1)
+
+    result = {"cursor": upto, "has_more": has_more, "reset": reset}
+    for name, rows in fetched.items():
+        result[name] = [_without_seq(row) for row in rows if row.change_seq <= upto]
+    result["deleted"] = {name: [] for name in SYNC_MODELS}
+    for row in deleted:
+        if row.change_seq <= upto and row.entity in SYNC_MODELS:
+            result["deleted"][row.entity].append(row.entity_id)
+    return result
+
+
+def _without_seq(row):
+    data = row._asdict()
+    del data["change_seq"]
+    return data
@@ -0,0 +1,146 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# Реєстр обробників змін ORM-сесій. Обробники flush викликаються в тій самій
+# транзакції до запису (можуть писати похідні таблиці), обробники after_flush —
+# одразу після запису, коли вже відомі первинні ключі нових рядків, обробники
+# commit — після успішного коміту (кеші, сповіщення).
+_flush_handlers = []
+_after_flush_handlers = []
+_commit_handlers = []
+
+
+class Change:
+    """Зміна одного ORM-об'єкта: kind = insert | update | delete
+
+    id і user_id фіксуються одразу після flush, тож обробники commit можуть
+    читати їх навіть для видалених або вже застарілих (expired) об'єктів.
+    """
+
+    __slots__ = ("kind", "obj", "id", "user_id", "_state")
+
+    def __init__(self, kind, obj):
+        self.kind = kind
+        self.obj = obj
+        self.id = None
+        self.user_id = getattr(obj, "user_id", None)
+        self._state = inspect(obj)
+
+    @property
+    def table(self):
+        return self.obj.__table__.name
+
+    def old(self, key):
+        """Значення атрибута до зміни (для insert/без змін — поточне)"""
+        if self.kind == "update":
+            history = self._state.attrs[key].history
+            if history.deleted:
+                return history.deleted[0]
+        return getattr(self.obj, key)
+
+    def changed(self, key):
+        return self.kind == "update" and self._state.attrs[key].history.has_changes()
+
+
+class BulkChange:
+    """Зміна рядків таблиці одним Core-запитом, повз ORM
+
+    Обробникам commit відомі лише таблиця і користувач — цього досить
+    для черги завдань, подій і кешів.
+    """
+
+    __slots__ = ("kind", "obj", "id", "user_id", "table")
+
+    def __init__(self, table, user_id):
+        self.kind = "update"
+        self.obj = None
+        self.id = None
+        self.user_id = user_id
+        self.table = table
+
+
+def record_bulk(session, table, user_ids):
+    """Передати обробникам commit зміни, записані Core-запитами в транзакції сесії"""
+    session.info.setdefault("committed_changes", []).extend(BulkChange(table, user_id) for user_id in user_ids)
+
+
+def track_history(*attributes):
+    """Завжди знати старе значення атрибутів для Change.old()
+
+    Після коміту об'єкти expired, і присвоєння не бачить попереднього
+    значення; active_history змушує ORM дочитати його перед зміною.
+    """
+    for attribute in attributes:
+        event.listen(attribute, "set", _keep_value, active_history=True, retval=True)
+
+
+def _keep_value(target, value, oldvalue, initiator):
+    return value
+
+
+def on_flush(fn):
+    """Зареєструвати fn(session, changes), що виконується перед кожним flush"""
+    _flush_handlers.append(fn)
+    return fn
+
+
+def after_flush(fn):
+    """Зареєструвати fn(session, changes), що виконується після flush (id вже присвоєні)
+
+    Обробник може виконувати лише Core-запити, не змінюючи ORM-об'єкти сесії.
+    """
+    _after_flush_handlers.append(fn)
+    return fn
+
+
+def on_commit(fn):
+    """Зареєструвати fn(changes), що виконується після успішного коміту"""
+    _commit_handlers.append(fn)
+    return fn
+
+
+def collect(session):
+    changes = [Change("insert", obj) for obj in session.new]
+    changes += [
+        Change("update", obj) for obj in session.dirty
+        if session.is_modified(obj, include_collections=False)
+    ]
+    changes += [Change("delete", obj) for obj in session.deleted]
+    return changes
+
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session, flush_context, instances):
+    changes = collect(session)
+    if not changes:
+        return
+    for handler in _flush_handlers:
+        handler(session, changes)
+    session.info.setdefault("committed_changes", []).extend(changes)
+    session.info["flushing_changes"] = changes
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    for change in session.info.get("committed_changes", ()):
+        if change.id is None:
+            change.id = getattr(change.obj, "id", None)
+    flushed = session.info.pop("flushing_changes", None)
+    if flushed:
+        for handler in _after_flush_handlers:
+            handler(session, flushed)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    changes = session.info.pop("committed_changes", None)
+    if not changes:
+        return
+    for handler in _commit_handlers:
+        handler(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("committed_changes", None)
+    session.info.pop("flushing_changes", None)
@@ -0,0 +1,299 @@
+import threading
+import zlib
+from collections import OrderedDict
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli необов'язковий
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard необов'язковий
+    zstandard = None
+
+# Типи вмісту, які варто стискати (JSON-відповіді API насамперед)
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+
+class GzipCodec:
+    name = "gzip"
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return (
+            lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH),
+            compressor.flush
+        )
+
+
+class BrotliCodec:
+    name = "br"
+
+    def __init__(self, quality=4):
+        self.quality = quality
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.quality)
+
+    def stream(self):
+        compressor = brotli.Compressor(quality=self.quality)
+        return (
+            lambda chunk: compressor.process(chunk) + compressor.flush(),
+            compressor.finish
+        )
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def __init__(self, level=3):
+        self.level = level
+        self._compressor = zstandard.ZstdCompressor(level=level)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def stream(self):
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return (
+            lambda chunk: compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+            compressor.flush
+        )
+
+
+def available_codecs(gzip_level=6, brotli_quality=4, zstd_level=3):
+    """Кодеки в порядку переваги сервера (доступні лише встановлені)"""
+    codecs = []
+    if zstandard is not None:
+        codecs.append(ZstdCodec(zstd_level))
+    if brotli is not None:
+        codecs.append(BrotliCodec(brotli_quality))
+    codecs.append(GzipCodec(gzip_level))
+    return codecs
+
+
+def negotiate(accept_encoding, codecs):
+    """Вибір кодека за Accept-Encoding з урахуванням q-значень"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+
+    best = None
+    for codec in codecs:
+        quality = accepted.get(codec.name, accepted.get("*", 0.0))
+        if quality > 0 and (best is None or quality > best[0]):
+            best = (quality, codec)
+    return best[1] if best else None
+
+
+class CompressedCache:
+    """LRU стиснених тіл для відповідей з ETag (обмежене за байтами)"""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._items.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """ASGI-стиснення відповідей: zstd / br / gzip за Accept-Encoding
+
+    Відповіді менші за minimum_size ідуть без стиснення, але всі відповіді
+    типів, що стискаються, мають Vary: Accept-Encoding — інакше спільний кеш
+    віддав би нестиснене тіло клієнту, що просив gzip, і навпаки. Потокові відповіді
+    (StreamingResponse) стискаються по чанках зі скиданням буфера, тож
+    клієнт отримує дані одразу. Для відповідей з ETag тег стає слабким
+    (W/"...", як у nginx), а стиснене тіло кешується за (ETag, кодек).
+    """
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, brotli_quality=4, zstd_level=3,
+                 cache_bytes=16 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.codecs = available_codecs(gzip_level, brotli_quality, zstd_level)
+        self.cache = CompressedCache(cache_bytes)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        global _active
+        _active = self
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # HEAD і клієнти без підтримуваного кодека отримують лише заголовок Vary
+        codec = None
+        if scope.get("method") != "HEAD":
+            codec = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.codecs)
+        responder = _CompressingResponder(self, codec, scope, send)
+        await self.app(scope, receive, responder)
+
+    def stats(self):
+        return {
+            "codecs": [codec.name for codec in self.codecs],
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+            "etag_cache_hits": self.cache.hits,
+            "etag_cache_misses": self.cache.misses
+        }
+
+
+_active = None
+
+
+def stats():
+    """Метрики активного екземпляра middleware (для /api/health/metrics)"""
+    return _active.stats() if _active is not None else None
+
+
+class _CompressingResponder:
+
+    def __init__(self, middleware, codec, scope, send):
+        self.middleware = middleware
+        self.codec = codec
+        self.path = scope.get("path", "")
+        self.send = send
+        self.start_message = None
+        self.buffer = b""
+        self.mode = None  # None -> ще вирішуємо, "plain" або "stream"
+        self.stream = None
+
+    def _compressible(self, headers):
+        if "content-encoding" in headers or self.start_message["status"] in (204, 304):
+            return False
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("text/event-stream"):
+            return False
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            if not self._compressible(headers):
+                self.mode = "plain"
+                await self.send(message)
+            elif self.codec is None:
+                self.mode = "plain"
+                MutableHeaders(scope=message).add_vary_header("Accept-Encoding")
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.mode == "plain":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.mode == "stream":
+            await self._send_chunk(body, more_body)
+            return
+
+        self.buffer += body
+        if not more_body:
+            await self._send_whole(self.buffer)
+        elif len(self.buffer) >= self.middleware.minimum_size:
+            self._start_stream()
+            await self.send(self.start_message)
+            buffered, self.buffer = self.buffer, b""
+            await self._send_chunk(buffered, True)
+
+    async def _send_whole(self, body):
+        headers = MutableHeaders(scope=self.start_message)
+        if len(body) < self.middleware.minimum_size:
+            headers.add_vary_header("Accept-Encoding")
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        etag = headers.get("etag")
+        compressed = None
+        cache_key = None
+        if etag:
+            cache_key = (self.path, etag, self.codec.name)
+            compressed = self.middleware.cache.get(cache_key)
+        if compressed is None:
+            compressed = self.codec.compress(body)
+            if cache_key:
+                self.middleware.cache.put(cache_key, compressed)
+
+        self.middleware.bytes_in += len(body)
+        self.middleware.bytes_out += len(compressed)
+        self._set_encoding_headers(headers)
+        headers["content-length"] = str(len(compressed))
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": compressed})
+
+    def _start_stream(self):
+        self.mode = "stream"
+        self.stream = self.codec.stream()
+        headers = MutableHeaders(scope=self.start_message)
+        self._set_encoding_headers(headers)
+        if "content-length" in headers:
+            del headers["content-length"]
+
+    async def _send_chunk(self, body, more_body):
+        compress, finish = self.stream
+        chunk = compress(body) if body else b""
+        if not more_body:
+            chunk += finish()
+        self.middleware.bytes_in += len(body)
+        self.middleware.bytes_out += len(chunk)
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _set_encoding_headers(self, headers):
+        headers["content-encoding"] = self.codec.name
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = "W/" + etag
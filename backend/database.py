@@ -1,18 +1,254 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, text, Column, Integer, String, Float, DateTime
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.sql.util import find_tables
 from datetime import datetime
 
+import changes
+
 DATABASE_URL = "sqlite:///./data.db"
 
+# Кількість шардів для даних користувачів; 1 = одна база data.db (як раніше)
+SHARD_COUNT = int(os.getenv("SPENDIO_SHARDS", "1"))
+SHARD_URL_TEMPLATE = os.getenv("SPENDIO_SHARD_URL", "sqlite:///./data_shard{}.db")
+
+# Таблиці, які завжди живуть у головній базі (каталог користувачів, черга завдань)
+DIRECTORY_TABLES = {"users", "user_shards", "jobs"}
+
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class UserMoving(RuntimeError):
+    """Дані користувача переносяться в інший шард — запит варто повторити пізніше"""
+
+
+class RoutingSession(Session):
+    """Сесія, що відправляє таблиці користувацьких даних у шард користувача"""
+
+    shard_engine = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.shard_engine is not None:
+            # Core-вирази на Table (__table__) приходять без mapper — маршрут за їхніми таблицями
+            if mapper is not None:
+                tables = [mapper.local_table]
+            elif clause is not None:
+                tables = find_tables(clause, include_crud=True)
+            else:
+                tables = []
+            if any(table.name not in DIRECTORY_TABLES for table in tables):
+                return self.shard_engine
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+class ShardRouter:
+    """Маршрутизація користувачів по файлах бази даних
+
+    Новий користувач потрапляє у шард за хешем user_id, після чого
+    призначення фіксується в таблиці user_shards, тож зміна кількості
+    шардів чи ребалансування не «губить» вже записані дані.
+    """
+
+    def __init__(self, directory_engine, shard_count, url_template, reload_seconds=30):
+        self.directory_engine = directory_engine
+        self.shard_count = shard_count
+        self.reload_seconds = reload_seconds
+        if shard_count > 1:
+            self.engines = [
+                create_engine(url_template.format(i), connect_args={"check_same_thread": False})
+                for i in range(shard_count)
+            ]
+        else:
+            self.engines = [directory_engine]
+        self._assignments = {}
+        self._moving = set()
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.shard_count > 1
+
+    @staticmethod
+    def hash_shard(user_id, shard_count):
+        return zlib.crc32(str(user_id).encode()) % shard_count
+
+    def _reload(self):
+        with self.directory_engine.connect() as conn:
+            rows = conn.execute(text("SELECT user_id, shard, moving FROM user_shards")).all()
+        self._assignments = {user_id: shard for user_id, shard, _ in rows}
+        self._moving = {user_id for user_id, _, moving in rows if moving}
+        self._loaded_at = time.monotonic()
+
+    def shard_for(self, user_id):
+        """Номер шарду користувача (фіксує призначення при першому зверненні)
+
+        Під час переносу даних користувача піднімає UserMoving. Інші процеси
+        бачать перенос після перечитування призначень (reload_seconds).
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            if time.monotonic() - self._loaded_at > self.reload_seconds:
+                self._reload()
+            if user_id in self._moving:
+                raise UserMoving(f"Дані користувача {user_id} переносяться в інший шард")
+            shard = self._assignments.get(user_id)
+            if shard is None:
+                shard = self.hash_shard(user_id, self.shard_count)
+                with self.directory_engine.begin() as conn:
+                    conn.execute(
+                        text("INSERT OR IGNORE INTO user_shards (user_id, shard, assigned_at) VALUES (:u, :s, :t)"),
+                        {"u": user_id, "s": shard, "t": datetime.utcnow()}
+                    )
+                self._assignments[user_id] = shard
+            return shard
+
+    def engine_for(self, user_id):
+        return self.engines[self.shard_for(user_id)]
+
+    def begin_move(self, user_id):
+        """Позначити користувача як такого, що переноситься: нові запити до нього відхиляються"""
+        with self.directory_engine.begin() as conn:
+            conn.execute(text("UPDATE user_shards SET moving = 1 WHERE user_id = :u"), {"u": user_id})
+        with self._lock:
+            self._moving.add(user_id)
+
+    def assign(self, user_id, shard):
+        """Перепризначення користувача (завершує перенос, використовується ребалансуванням)"""
+        with self.directory_engine.begin() as conn:
+            conn.execute(
+                text("INSERT OR REPLACE INTO user_shards (user_id, shard, assigned_at, moving) VALUES (:u, :s, :t, 0)"),
+                {"u": user_id, "s": shard, "t": datetime.utcnow()}
+            )
+        with self._lock:
+            self._assignments[user_id] = shard
+            self._moving.discard(user_id)
+
+    def fan_out(self, fn, db=None):
+        """Виконати fn(session) на кожному шарді паралельно, повертає список результатів
+
+        Без шардування використовується сесія запиту db (якщо передана).
+        """
+        if not self.enabled and db is not None:
+            return [fn(db)]
+
+        def run(shard_engine):
+            db = SessionLocal(bind=shard_engine)
+            try:
+                return fn(db)
+            finally:
+                db.close()
+
+        if len(self.engines) == 1:
+            return [run(self.engines[0])]
+        with ThreadPoolExecutor(max_workers=len(self.engines)) as pool:
+            return list(pool.map(run, self.engines))
+
+
+shard_router = ShardRouter(engine, SHARD_COUNT, SHARD_URL_TEMPLATE)
+
+
+@changes.after_flush
+def _fence_stale_routing(session, changeset):
+    # Після flush сесія тримає блокування запису шарду: якщо користувача вже
+    # переносять (або перенесли), запис у старий шард відкочується, а не губиться
+    shard_engine = getattr(session, "shard_engine", None)
+    if shard_engine is None:
+        return
+    users = {
+        change.user_id for change in changeset
+        if change.user_id is not None and change.table not in DIRECTORY_TABLES
+    }
+    for user_id in users:
+        if shard_router.engine_for(user_id) is not shard_engine:
+            raise UserMoving(f"Дані користувача {user_id} перенесено в інший шард")
+
+
+def upgrade_schema(bind):
+    """create_all + додавання нових колонок та індексів до вже існуючих таблиць
+
+    create_all не змінює існуючі таблиці, тож колонки, що з'явились у
+    моделях пізніше, додаються через ALTER TABLE (усі вони nullable).
+    """
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table.name})"))}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+def init_shards():
+    """Створити таблиці на всіх шардах і скопіювати туди стандартні категорії"""
+    import category_tree
+    import changefeed
+    import duplicates
+    import fx
+    import rollups
+    import running_stats
+
+    upgrade_schema(engine)
+    category_tree.ensure_built(engine)
+    changefeed.stamp_unsequenced(engine)
+    duplicates.backfill(engine)
+    rollups.ensure_built(engine)
+    running_stats.ensure_built(engine)
+    if not shard_router.enabled:
+        if fx.RATES_FILE:
+            fx.load_file([engine])
+        return
+
+    with engine.connect() as conn:
+        defaults = conn.execute(text(
+            "SELECT name, description, color, icon, created_at FROM categories WHERE is_default = 1"
+        )).mappings().all()
+
+    for shard_engine in shard_router.engines:
+        upgrade_schema(shard_engine)
+        with shard_engine.begin() as conn:
+            existing = conn.execute(text("SELECT COUNT(*) FROM categories WHERE is_default = 1")).scalar()
+            if existing == 0 and defaults:
+                conn.execute(
+                    text("""
+                        INSERT INTO categories (name, description, color, icon, is_default, created_at, user_id)
+                        VALUES (:name, :description, :color, :icon, 1, :created_at, NULL)
+                    """),
+                    [dict(row) for row in defaults]
+                )
+        category_tree.ensure_built(shard_engine)
+        changefeed.stamp_unsequenced(shard_engine)
+        duplicates.backfill(shard_engine)
+        rollups.ensure_built(shard_engine)
+        running_stats.ensure_built(shard_engine)
+    # Курси з файлу (повторне завантаження без змін нічого не перераховує)
+    if fx.RATES_FILE:
+        fx.load_file(shard_router.engines)
+
+
+def route_session(db, user_id):
+    """Прив'язати сесію запиту до шарду автентифікованого користувача"""
+    if shard_router.enabled and isinstance(db, RoutingSession):
+        db.shard_engine = shard_router.engine_for(user_id)
+    return db
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import re
+import unicodedata
+
+from sqlalchemy import select, update, func, bindparam
+
+import changes
+import fx
+from models import Expense
+
+# Виявлення дублікатів при внесенні витрат. Відбиток — хеш (дата, сума,
+# валюта, нормалізований опис); разом з user_id він покритий індексом, тож перевірка
+# пачки витрат — один запит IN, а не попарне порівняння з історією.
+#
+# Політики: reject — дублікат не записується (409), merge — повертається
+# наявна витрата, flag — витрата записується з duplicate_of. Однакова кава
+# двічі за день буває і насправді, тож за замовчуванням лише позначаємо.
+POLICIES = ("reject", "merge", "flag")
+DEFAULT_POLICY = os.getenv("SPENDIO_DUPLICATE_POLICY", "flag")
+
+FINGERPRINT_FIELDS = ("date", "amount", "description", "currency")
+BACKFILL_BATCH = 5000
+
+_punctuation = re.compile(r"[^\w\s]+")
+_spaces = re.compile(r"\s+")
+
+
+def normalize_description(description):
+    """Опис без регістру, розділових знаків і зайвих пробілів ("АТБ,  Київ!" → "атб київ")"""
+    text = unicodedata.normalize("NFKC", description or "").casefold()
+    return _spaces.sub(" ", _punctuation.sub(" ", text)).strip()
+
+
+def fingerprint(date, amount, description, currency=None):
+    if date is None or amount is None:
+        return None
+    key = f"{str(date)[:10]}|{round(float(amount), 2):.2f}|{normalize_description(description)}"
+    # Базова валюта (і NULL) не входить у ключ — відбитки старих витрат лишаються чинними
+    if not fx.is_base(currency):
+        key = f"{key}|{currency}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+@changes.on_flush
+def _stamp_fingerprints(session, changeset):
+    for change in changeset:
+        if change.table != "expenses" or change.kind == "delete":
+            continue
+        if change.kind == "update" and not any(change.changed(field) for field in FINGERPRINT_FIELDS):
+            continue
+        expense = change.obj
+        expense.fingerprint = fingerprint(expense.date, expense.amount, expense.description, expense.currency)
+
+
+_existing = select(Expense.fingerprint, func.min(Expense.id)).where(
+    Expense.user_id == bindparam("user_id"),
+    Expense.fingerprint.in_(bindparam("fingerprints", expanding=True))
+).group_by(Expense.fingerprint)
+
+
+def find(db, user_id, items):
+    """Для кожної нової витрати — id оригіналу або None
+
+    items — послідовність (date, amount, description, currency). Дублікати шукаються
+    серед уже записаних витрат одним запитом і всередині самої пачки
+    (повтор рядка у виписці посилається на перше входження, -1 - індекс).
+    """
+    prints = [fingerprint(*item) for item in items]
+    wanted = sorted({value for value in prints if value is not None})
+    existing = dict(db.execute(_existing, {"user_id": user_id, "fingerprints": wanted}).all()) if wanted else {}
+
+    result = []
+    first_in_batch = {}
+    for index, value in enumerate(prints):
+        if value is None:
+            result.append(None)
+        elif value in existing:
+            result.append(existing[value])
+        elif value in first_in_batch:
+            result.append(-1 - first_in_batch[value])
+        else:
+            first_in_batch[value] = index
+            result.append(None)
+    return result
+
+
+def resolve_policy(policy):
+    policy = policy or DEFAULT_POLICY
+    if policy not in POLICIES:
+        raise ValueError(f"Невідома політика дублікатів: {policy}")
+    return policy
+
+
+def backfill(bind, batch=BACKFILL_BATCH):
+    """Порахувати відбитки для витрат, записаних до появи колонки"""
+    stamped = 0
+    pending = select(Expense.id, Expense.date, Expense.amount, Expense.description, Expense.currency).where(
+        Expense.fingerprint.is_(None), Expense.date.is_not(None), Expense.amount.is_not(None)
+    ).limit(batch)
+    stamp = update(Expense).where(Expense.id == bindparam("expense_id")).values(fingerprint=bindparam("value"))
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(pending).all()
+            if not rows:
+                return stamped
+            conn.execute(stamp, [
+                {"expense_id": row.id, "value": fingerprint(row.date, row.amount, row.description, row.currency)}
+                for row in rows
+            ])
+        stamped += len(rows)
+
+
+def duplicate_groups(conn, user_id=None):
+    """Групи однакових відбитків: (user_id, id оригіналу, [id дублікатів])"""
+    stmt = select(
+        Expense.user_id, Expense.fingerprint, func.min(Expense.id), func.group_concat(Expense.id)
+    ).where(Expense.fingerprint.is_not(None)).group_by(Expense.user_id, Expense.fingerprint).having(func.count() > 1)
+    if user_id is not None:
+        stmt = stmt.where(Expense.user_id == user_id)
+    groups = []
+    for owner, _, original, ids in conn.execute(stmt):
+        groups.append((owner, original, sorted(int(value) for value in ids.split(",") if int(value) != original)))
+    return groups
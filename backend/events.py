@@ -0,0 +1,239 @@
+import abc
+import asyncio
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import MetaData, Table, Column, Integer, Float, Text, create_engine, select, insert, delete, func
+
+import changes
+import serialization
+import versions
+
+# Брокер подій: "local" (в межах процесу) або URL SQLite-файлу, спільного
+# для кількох воркерів, напр. sqlite:///./events.db
+BROKER_URL = os.getenv("SPENDIO_EVENT_BROKER", "local")
+# Скільки подій чекає в черзі одного підписника, старші відкидаються
+SUBSCRIBER_QUEUE = 100
+
+
+class Subscription:
+    """Черга подій одного SSE-з'єднання (asyncio, наповнюється з будь-якого потоку)"""
+
+    def __init__(self, broker, user_id, loop):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+
+    def push(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # цикл подій уже закрито
+            self.close()
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """Наступна подія або None, якщо за timeout секунд нічого не прийшло"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def drain(self):
+        """Події, що вже чекають у черзі (для злиття в одне повідомлення)"""
+        pending = []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        return pending
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker(abc.ABC):
+    """Інтерфейс брокера: publish(user_id, event) / subscribe(user_id)"""
+
+    @abc.abstractmethod
+    def publish(self, user_id, event):
+        """Надіслати подію всім підписникам користувача"""
+
+    @abc.abstractmethod
+    def subscribe(self, user_id):
+        """Нова Subscription користувача в поточному циклі подій"""
+
+    @abc.abstractmethod
+    def unsubscribe(self, subscription):
+        """Прибрати підписку; повторний виклик нічого не робить"""
+
+    def stats(self):
+        return {}
+
+
+class LocalBroker(Broker):
+    """Pub/sub у межах одного процесу"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def publish(self, user_id, event):
+        self.published += 1
+        self._deliver(user_id, event)
+
+    def _deliver(self, user_id, event):
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for subscription in targets:
+            subscription.push(event)
+        self.delivered += len(targets)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def stats(self):
+        return {
+            "broker": type(self).__name__,
+            "subscribers": self.subscriber_count,
+            "published": self.published,
+            "delivered": self.delivered
+        }
+
+
+class SQLiteBroker(LocalBroker):
+    """Спільний брокер для кількох воркерів на окремому файлі SQLite
+
+    publish записує подію в таблицю, а один потік на процес читає нові
+    рядки і роздає їх локальним підписникам. Поки підписників немає,
+    потік не робить жодного запиту.
+    """
+
+    def __init__(self, url, poll_interval=0.5, retention_seconds=300):
+        super().__init__()
+        self.engine = create_engine(url, connect_args={"check_same_thread": False})
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        metadata = MetaData()
+        self.table = Table(
+            "events", metadata,
+            Column("id", Integer, primary_key=True),
+            Column("user_id", Integer, nullable=False),
+            Column("payload", Text, nullable=False),
+            Column("created_at", Float, nullable=False)
+        )
+        metadata.create_all(self.engine)
+        self._last_id = None
+        self._thread = None
+        self._wakeup = threading.Event()
+
+    def publish(self, user_id, event):
+        self.published += 1
+        with self.engine.begin() as conn:
+            conn.execute(insert(self.table).values(
+                user_id=user_id,
+                payload=serialization.dumps(event).decode(),
+                created_at=time.time()
+            ))
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll, name="sse-broker", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return subscription
+
+    def _poll(self):
+        last_cleanup = 0.0
+        while True:
+            if not self.subscriber_count:
+                # Без підписників чекаємо без запитів; після пробудження
+                # читаємо лише нові події
+                self._wakeup.clear()
+                if not self.subscriber_count:
+                    self._last_id = None
+                    self._wakeup.wait()
+            try:
+                with self.engine.connect() as conn:
+                    if self._last_id is None:
+                        self._last_id = conn.execute(select(func.max(self.table.c.id))).scalar() or 0
+                    rows = conn.execute(
+                        select(self.table.c.id, self.table.c.user_id, self.table.c.payload)
+                        .where(self.table.c.id > self._last_id)
+                        .order_by(self.table.c.id)
+                    ).all()
+                for row in rows:
+                    self._last_id = row.id
+                    self._deliver(row.user_id, json.loads(row.payload))
+
+                now = time.time()
+                if now - last_cleanup > self.retention_seconds:
+                    with self.engine.begin() as conn:
+                        conn.execute(delete(self.table).where(self.table.c.created_at < now - self.retention_seconds))
+                    last_cleanup = now
+            except Exception as e:
+                print(f"Event broker poll error: {e}")
+            time.sleep(self.poll_interval)
+
+
+def create_broker(url):
+    if url == "local":
+        return LocalBroker()
+    return SQLiteBroker(url)
+
+
+broker = create_broker(BROKER_URL)
+
+
+@changes.on_commit
+def _publish_changes(changeset):
+    collections = {}
+    for change in changeset:
+        collection = versions.TRACKED_TABLES.get(change.table)
+        if collection is not None and change.user_id is not None:
+            collections.setdefault(change.user_id, set()).add(collection)
+    for user_id, names in collections.items():
+        try:
+            broker.publish(user_id, {"type": "change", "collections": sorted(names)})
+        except Exception as e:
+            print(f"Event publish error: {e}")
+
+
+def merge(events):
+    """Злиття подій, що накопичились, в одне повідомлення"""
+    collections = set()
+    for event in events:
+        collections.update(event.get("collections", ()))
+    return {"type": "change", "collections": sorted(collections)}
+
+
+def format_event(event):
+    return b"event: " + event["type"].encode() + b"\ndata: " + serialization.dumps(event) + b"\n\n"
+
+
+def stats():
+    return broker.stats()
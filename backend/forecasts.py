@@ -0,0 +1,280 @@
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import select, func, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import jobs
+import recurring
+from models import DailyRollup, ForecastModel
+
+# Модель прогнозу денних витрат: лінійний тренд × тижнева сезонність.
+# У базі зберігаються достатні статистики по всіх днях від першої витрати
+# (n, Σt, Σt², Σy, Σty, Σy², суми і кількості по днях тижня) і вже обчислені
+# параметри. Нові дні додаються до статистик з денних підсумків, повне
+# перенавчання потрібне лише коли змінилися вже враховані дні.
+
+MAX_FORECAST_DAYS = 366
+# Коефіцієнт для 95% інтервалу прогнозу
+INTERVAL_Z = 1.96
+
+# n, Σt, Σt², Σy, Σty, Σy², суми по днях тижня (7), кількості днів тижня (7)
+_STATE_SIZE = 6 + 7 + 7
+
+_stats = {"served": 0, "incremental_refits": 0, "full_refits": 0}
+_stats_lock = threading.Lock()
+
+_daily_totals = select(
+    DailyRollup.day,
+    func.sum(DailyRollup.total).label("total"),
+    func.sum(DailyRollup.count).label("count")
+).where(
+    DailyRollup.user_id == bindparam("user_id"),
+    DailyRollup.day >= bindparam("start"),
+    DailyRollup.day <= bindparam("end")
+).group_by(DailyRollup.day)
+
+# Контроль історії до fitted_through включно: сума, кількість і Σt·y (ловить
+# перенесення витрати на іншу дату, що не змінює ні суми, ні кількості)
+_history_totals = select(
+    func.min(DailyRollup.day),
+    func.coalesce(func.sum(DailyRollup.total), 0.0),
+    func.coalesce(func.sum(DailyRollup.count), 0),
+    func.coalesce(func.sum((func.julianday(DailyRollup.day) - func.julianday(bindparam("origin"))) * DailyRollup.total), 0.0)
+).where(
+    DailyRollup.user_id == bindparam("user_id"),
+    DailyRollup.day <= bindparam("end")
+)
+
+_stored = select(*ForecastModel.__table__.c).where(ForecastModel.user_id == bindparam("user_id"))
+
+
+def weekdays(ordinals):
+    """День тижня (0 — понеділок) для порядкових номерів днів від 1970-01-01"""
+    return (ordinals + 3) % 7
+
+
+class Fit:
+    """Достатні статистики і параметри моделі одного користувача"""
+
+    __slots__ = ("origin", "fitted_through", "expense_count", "state",
+                 "intercept", "slope", "residual_variance", "weekday_factors")
+
+    def __init__(self, origin, fitted_through=None, expense_count=0, state=None):
+        self.origin = origin
+        self.fitted_through = fitted_through or origin - timedelta(days=1)
+        self.expense_count = expense_count
+        self.state = np.zeros(_STATE_SIZE) if state is None else state
+        self.solve()
+
+    @classmethod
+    def from_row(cls, row):
+        fit = cls.__new__(cls)
+        fit.origin = date.fromisoformat(row.origin)
+        fit.fitted_through = date.fromisoformat(row.fitted_through)
+        fit.expense_count = row.expense_count
+        fit.state = np.frombuffer(row.state, dtype="<f8").copy()
+        fit.intercept = row.intercept
+        fit.slope = row.slope
+        fit.residual_variance = row.residual_variance
+        fit.weekday_factors = np.frombuffer(row.weekday_factors, dtype="<f8").copy()
+        return fit
+
+    def add_days(self, days, totals, through):
+        """Додати до статистик дні fitted_through+1 .. through (дні без витрат — нулі)"""
+        first = np.datetime64(self.fitted_through + timedelta(days=1), "D")
+        size = (through - self.fitted_through).days
+        if size <= 0:
+            return
+        y = np.zeros(size)
+        if len(days):
+            index = (np.asarray(days, dtype="datetime64[D]") - first).astype(np.int64)
+            np.add.at(y, index, np.asarray(totals, dtype=float))
+        ordinals = first.astype(np.int64) + np.arange(size)
+        t = (ordinals - np.datetime64(self.origin, "D").astype(np.int64)).astype(float)
+        w = weekdays(ordinals)
+
+        self.state[:6] += [size, t.sum(), (t * t).sum(), y.sum(), (t * y).sum(), (y * y).sum()]
+        self.state[6:13] += np.bincount(w, weights=y, minlength=7)
+        self.state[13:20] += np.bincount(w, minlength=7)
+        self.fitted_through = through
+        self.solve()
+
+    def solve(self):
+        n, st, stt, sy, sty, syy = self.state[:6]
+        weekday_sums, weekday_counts = self.state[6:13], self.state[13:20]
+        if n == 0:
+            self.intercept = self.slope = self.residual_variance = 0.0
+            self.weekday_factors = np.ones(7)
+            return
+
+        spread = stt - st * st / n
+        self.slope = float((sty - st * sy / n) / spread) if spread > 0 else 0.0
+        self.intercept = float((sy - self.slope * st) / n)
+
+        mean = sy / n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weekday_means = np.where(weekday_counts > 0, weekday_sums / weekday_counts, mean)
+        self.weekday_factors = weekday_means / mean if mean > 0 else np.ones(7)
+
+        # Залишок лінійної регресії (тотожність МНК) мінус дисперсія, пояснена
+        # днями тижня; наближення, що не потребує проходу по всіх днях
+        residual = syy - self.intercept * sy - self.slope * sty
+        seasonal = float((weekday_counts * (weekday_means - mean) ** 2).sum())
+        self.residual_variance = max(float(residual) - seasonal, 0.0) / max(n - 2, 1)
+
+    def predict(self, start, days):
+        ordinals = np.datetime64(start, "D").astype(np.int64) + np.arange(days)
+        t = ordinals - np.datetime64(self.origin, "D").astype(np.int64)
+        values = np.maximum((self.intercept + self.slope * t) * self.weekday_factors[weekdays(ordinals)], 0.0)
+        return ordinals.astype("datetime64[D]"), values
+
+
+def _save(db, user_id, fit):
+    values = {
+        "user_id": user_id,
+        "origin": fit.origin.isoformat(),
+        "fitted_through": fit.fitted_through.isoformat(),
+        "expense_count": int(fit.expense_count),
+        "state": fit.state.astype("<f8").tobytes(),
+        "intercept": fit.intercept,
+        "slope": fit.slope,
+        "residual_variance": fit.residual_variance,
+        "weekday_factors": np.asarray(fit.weekday_factors, dtype="<f8").tobytes()
+    }
+    stmt = sqlite_insert(ForecastModel).values(**values)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={**{name: stmt.excluded[name] for name in values if name != "user_id"}, "updated_at": func.now()}
+    ))
+
+
+def _record(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def refit(db, user_id, today=None):
+    """Актуальна модель користувача: дозбирати нові дні або перенавчити з нуля"""
+    today = today or date.today()
+    # Сьогоднішній день ще не завершений, тож модель навчається до вчора
+    through = today - timedelta(days=1)
+    row = db.execute(_stored, {"user_id": user_id}).first()
+    fit = Fit.from_row(row) if row is not None else None
+
+    # Порожня модель просто перенавчається, щоб початок відліку був першою витратою
+    if fit is not None and fit.expense_count:
+        _, total, count, weighted = db.execute(_history_totals, {
+            "user_id": user_id, "end": fit.fitted_through.isoformat(), "origin": fit.origin.isoformat()
+        }).one()
+        unchanged = (
+            count == fit.expense_count
+            and abs(total - fit.state[3]) < 0.005
+            and abs(weighted - fit.state[4]) < 0.005 * max(1.0, fit.state[0])
+        )
+        if unchanged and fit.fitted_through >= through:
+            return fit
+        if unchanged:
+            _add_range(db, user_id, fit, through)
+            _save(db, user_id, fit)
+            _record("incremental_refits")
+            return fit
+
+    first_day = db.execute(_history_totals, {"user_id": user_id, "end": through.isoformat(), "origin": None}).first()[0]
+    fit = Fit(date.fromisoformat(first_day) if first_day else through + timedelta(days=1))
+    _add_range(db, user_id, fit, through)
+    _save(db, user_id, fit)
+    _record("full_refits")
+    return fit
+
+
+def _add_range(db, user_id, fit, through):
+    start = fit.fitted_through + timedelta(days=1)
+    if start > through:
+        return
+    rows = db.execute(
+        _daily_totals, {"user_id": user_id, "start": start.isoformat(), "end": through.isoformat()}
+    ).all()
+    fit.add_days([row.day for row in rows], [row.total for row in rows], through)
+    fit.expense_count += sum(row.count for row in rows)
+
+
+def forecast(db, user_id, days=30, today=None):
+    """Прогноз витрат на days днів вперед з довірчим інтервалом"""
+    today = today or date.today()
+    fit = refit(db, user_id, today)
+    db.commit()
+    _record("served")
+
+    dates, values = fit.predict(today, days)
+    margin = INTERVAL_Z * math.sqrt(fit.residual_variance)
+    # Відомі наперед регулярні витрати: модель вже врахувала їх минулі
+    # входження в тренді, тож вони показуються окремо, а не додаються
+    occurrences = recurring.upcoming(db, user_id, today, today + timedelta(days=days - 1))
+    scheduled = {}
+    for item in occurrences:
+        scheduled[item["date"]] = scheduled.get(item["date"], 0.0) + item["amount"]
+    return {
+        "start": today.isoformat(),
+        "days": days,
+        "daily": [
+            {"date": str(day), "forecast": round(float(value), 2),
+             "lower": round(max(float(value) - margin, 0.0), 2), "upper": round(float(value) + margin, 2),
+             "scheduled": round(scheduled.get(str(day), 0.0), 2)}
+            for day, value in zip(dates, values)
+        ],
+        "total": round(float(values.sum()), 2),
+        "scheduled_total": recurring.scheduled_total(occurrences),
+        "model": {
+            "fitted_through": fit.fitted_through.isoformat(),
+            "days_observed": int(fit.state[0]),
+            "daily_trend": round(fit.slope, 4),
+            "weekday_factors": np.round(fit.weekday_factors, 3).tolist(),
+            "residual_std": round(math.sqrt(fit.residual_variance), 2)
+        }
+    }
+
+
+@jobs.register("forecast", triggers=("expenses",))
+def _refit_job(db, user_id):
+    refit(db, user_id)
+
+
+def _refit_chunk(user_ids):
+    # Виконується в окремому процесі: власні з'єднання, успадковані від
+    # батьківського процесу, використовувати не можна
+    from database import SessionLocal, engine, shard_router, route_session
+
+    engine.dispose()
+    for shard_engine in shard_router.engines:
+        shard_engine.dispose()
+    fitted = 0
+    for user_id in user_ids:
+        db = route_session(SessionLocal(), user_id)
+        try:
+            refit(db, user_id)
+            db.commit()
+            fitted += 1
+        finally:
+            db.close()
+    return fitted
+
+
+def refit_all(user_ids, workers=None, chunk_size=200):
+    """Перенавчити моделі багатьох користувачів паралельно на всіх ядрах"""
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, min(chunk_size, math.ceil(len(user_ids) / workers)))
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        return sum(_refit_chunk(chunk) for chunk in chunks)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(_refit_chunk, chunks))
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
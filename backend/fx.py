@@ -0,0 +1,216 @@
+import csv
+import os
+import threading
+from datetime import date
+
+import numpy as np
+from sqlalchemy import select, update, case, func, literal, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import versions
+from models import Expense, FxRate, QuantileSketch
+
+# Курси валют для витрат у валюті, відмінній від базової. Курси завантажуються
+# з локального файлу (без зовнішніх сервісів) у таблицю fx_rates кожної бази.
+# Витрата конвертується за останнім курсом на її дату (до першого відомого
+# курсу — за найранішим). Денні підсумки, статистика й ескізи зберігаються
+# вже в базовій валюті; після зміни курсів зачеплені дні перераховуються.
+BASE_CURRENCY = os.getenv("SPENDIO_BASE_CURRENCY", "UAH")
+RATES_FILE = os.getenv("SPENDIO_FX_RATES_FILE")
+CURRENCY_PATTERN = "^[A-Z]{3}$"
+
+# Версія курсів зберігається серед версій колекцій під спільним user_id
+_VERSION_KEY = (versions.DEFAULTS_USER, "fx_rates")
+# Витрата без дати конвертується за останнім курсом
+_LATEST_DAY = "9999-12-31"
+
+_tables = {}
+_tables_lock = threading.Lock()
+_stats = {"conversions": 0, "table_loads": 0, "rates_loaded": 0, "rebuilt_users": 0}
+
+_all_rates = select(FxRate.currency, FxRate.day, FxRate.rate).order_by(FxRate.currency, FxRate.day)
+
+
+class UnknownCurrency(ValueError):
+    pass
+
+
+def is_base(currency):
+    return not currency or currency == BASE_CURRENCY
+
+
+def value_changed(change):
+    """Чи могла змінитися сума витрати в базовій валюті (Change з модуля changes)"""
+    if change.changed("amount") or change.changed("currency"):
+        return True
+    # Дата впливає на курс лише для іноземної валюти
+    return change.changed("date") and not is_base(change.obj.currency)
+
+
+class RateTable:
+    """Незмінний знімок курсів: для кожної валюти — відсортовані дні і курси"""
+
+    __slots__ = ("version", "days", "rates")
+
+    def __init__(self, version, rows):
+        self.version = version
+        grouped = {}
+        for currency, day, rate in rows:
+            grouped.setdefault(currency, ([], []))
+            grouped[currency][0].append(day)
+            grouped[currency][1].append(rate)
+        self.days = {currency: np.array(days, dtype="datetime64[D]") for currency, (days, _) in grouped.items()}
+        self.rates = {currency: np.array(rates, dtype=np.float64) for currency, (_, rates) in grouped.items()}
+
+    def __contains__(self, currency):
+        return is_base(currency) or currency in self.rates
+
+    def convert(self, amounts, currencies, days):
+        """Суми в базовій валюті; currencies і days — паралельні масиви (None = база / без дати)"""
+        result = np.asarray(amounts, dtype=np.float64).copy()
+        codes = np.array([currency or BASE_CURRENCY for currency in currencies], dtype=object)
+        foreign = set(codes.tolist()) - {BASE_CURRENCY}
+        if not foreign:
+            return result
+        moments = np.array([str(day)[:10] if day else _LATEST_DAY for day in days], dtype="datetime64[D]")
+        for currency in foreign:
+            if currency not in self.rates:
+                raise UnknownCurrency(f"Немає курсу для валюти {currency}")
+            mask = codes == currency
+            # Останній курс не пізніше дати витрати; раніше першого курсу — перший
+            index = np.searchsorted(self.days[currency], moments[mask], side="right") - 1
+            result[mask] *= self.rates[currency][np.maximum(index, 0)]
+        return result
+
+
+def table(db):
+    """Курси бази сесії db з кешу процесу (перечитуються після зміни версії курсів)"""
+    bind = db.get_bind(mapper=FxRate.__mapper__)
+    version = versions.current(db, *_VERSION_KEY)
+    with _tables_lock:
+        cached = _tables.get(bind)
+    if cached is not None and cached.version == version:
+        return cached
+    loaded = RateTable(version, db.execute(_all_rates).all())
+    _stats["table_loads"] += 1
+    with _tables_lock:
+        _tables[bind] = loaded
+    return loaded
+
+
+def to_base(db, amounts, currencies, days):
+    """Конвертувати суми в базову валюту; без іноземних валют — без звернень до бази"""
+    if all(is_base(currency) for currency in currencies):
+        return [float(amount) for amount in amounts]
+    _stats["conversions"] += len(amounts)
+    return table(db).convert(amounts, currencies, days).tolist()
+
+
+def is_known(db, currency):
+    return is_base(currency) or currency in table(db)
+
+
+def base_amount():
+    """SQL-вираз суми витрати в базовій валюті (для перерахунків одним запитом)"""
+    currency = func.coalesce(func.nullif(Expense.currency, ""), literal(BASE_CURRENCY))
+    day = func.coalesce(func.substr(Expense.date, 1, 10), literal(_LATEST_DAY))
+    as_of = select(FxRate.rate).where(
+        FxRate.currency == Expense.currency, FxRate.day <= day
+    ).order_by(FxRate.day.desc()).limit(1).scalar_subquery()
+    earliest = select(FxRate.rate).where(
+        FxRate.currency == Expense.currency
+    ).order_by(FxRate.day).limit(1).scalar_subquery()
+    return case((currency == BASE_CURRENCY, Expense.amount), else_=Expense.amount * func.coalesce(as_of, earliest))
+
+
+def read_rates_file(path):
+    """Рядки (currency, day, rate) з CSV з колонками currency,date,rate
+
+    rate — скільки одиниць базової валюти коштує одна одиниця currency.
+    """
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for line, record in enumerate(csv.DictReader(f), start=2):
+            try:
+                currency = record["currency"].strip().upper()
+                day = date.fromisoformat(record["date"].strip()[:10]).isoformat()
+                rate = float(record["rate"])
+            except (KeyError, AttributeError, ValueError) as e:
+                raise ValueError(f"{path}:{line}: некоректний рядок курсу ({e})") from None
+            if len(currency) != 3 or not currency.isalpha() or rate <= 0:
+                raise ValueError(f"{path}:{line}: некоректна валюта або курс")
+            if currency != BASE_CURRENCY:
+                rows.append((currency, day, rate))
+    return rows
+
+
+def load_rates(bind, rows):
+    """Записати курси в базу і перерахувати похідні дані зачеплених користувачів
+
+    Записуються лише нові або змінені курси, тож повторне завантаження того
+    самого файлу нічого не перераховує. Повертає кількість зачеплених користувачів.
+    """
+    import rollups
+    import running_stats
+
+    rates = {(currency, day): rate for currency, day, rate in rows}
+    if not rates:
+        return 0
+    with bind.begin() as conn:
+        existing = {
+            (row.currency, row.day): row.rate for row in conn.execute(
+                select(FxRate.currency, FxRate.day, FxRate.rate)
+                .where(FxRate.currency.in_({currency for currency, _ in rates}))
+            )
+        }
+        changed = sorted(key for key, rate in rates.items() if existing.get(key) != rate)
+        if not changed:
+            return 0
+
+        stmt = sqlite_insert(FxRate)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["currency", "day"], set_={"rate": stmt.excluded.rate}
+        ), [{"currency": currency, "day": day, "rate": rates[(currency, day)]} for currency, day in changed])
+        _stats["rates_loaded"] += len(changed)
+
+        # Зміна курсу діє з його дня; зміна найранішого курсу — на всю історію валюти
+        earliest = {}
+        for currency, day in existing:
+            earliest[currency] = min(day, earliest.get(currency, day))
+        since = {}
+        for currency, day in changed:
+            since[currency] = min(day, since.get(currency, day))
+        since = {
+            currency: "" if currency not in earliest or day <= earliest[currency] else day
+            for currency, day in since.items()
+        }
+
+        affected = conn.execute(select(Expense.user_id).where(
+            Expense.user_id.is_not(None),
+            or_(*(
+                (Expense.currency == currency) & (func.substr(Expense.date, 1, 10) >= day)
+                for currency, day in since.items()
+            ))
+        ).distinct()).scalars().all()
+        first_day = min(since.values())
+        for user_id in affected:
+            rollups.rebuild(conn, user_id, since=first_day or None)
+            running_stats.rebuild(conn, user_id)
+        if affected:
+            # t-digest не вміє замінити значення — ескізи перебудуються при читанні
+            conn.execute(update(QuantileSketch).where(QuantileSketch.user_id.in_(affected)).values(dirty=True))
+        versions.bump(conn, {(user_id, "expenses") for user_id in affected} | {_VERSION_KEY})
+    _stats["rebuilt_users"] += len(affected)
+    return len(affected)
+
+
+def load_file(binds, path=RATES_FILE):
+    """Завантажити файл курсів у кожну базу; повертає кількість зачеплених користувачів"""
+    rows = read_rates_file(path)
+    return sum(load_rates(bind, rows) for bind in binds)
+
+
+def stats():
+    with _tables_lock:
+        cached = len(_tables)
+    return {**_stats, "base_currency": BASE_CURRENCY, "cached_tables": cached}
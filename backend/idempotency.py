@@ -0,0 +1,238 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from jose import JWTError, jwt
+from starlette.datastructures import Headers
+
+import serialization
+
+# Методи, для яких діє Idempotency-Key (повтори GET/PUT/DELETE і так безпечні)
+IDEMPOTENT_METHODS = ("POST", "PATCH")
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    """LRU збережених відповідей з терміном життя, обмежене за байтами"""
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, ttl_seconds=24 * 3600, max_entry_bytes=256 * 1024):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_entry_bytes = max_entry_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.replays = 0
+        self.conflicts = 0
+        self.mismatches = 0
+
+    def begin(self, key, fingerprint):
+        """Почати обробку запиту з ключем
+
+        Повертає ("replay", entry), ("mismatch", None), ("in_flight", None)
+        або ("new", None) — тоді після відповіді треба викликати finish().
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry["expires"] <= now:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                if entry["fingerprint"] != fingerprint:
+                    self.mismatches += 1
+                    return "mismatch", None
+                self._items.move_to_end(key)
+                self.replays += 1
+                return "replay", entry
+            if key in self._in_flight:
+                self.conflicts += 1
+                return "in_flight", None
+            self._in_flight.add(key)
+            return "new", None
+
+    def finish(self, key, fingerprint, status, headers, body):
+        """Зберегти успішну відповідь (або просто зняти позначку обробки)"""
+        size = len(body) + sum(len(name) + len(value) for name, value in headers) + 128
+        with self._lock:
+            self._in_flight.discard(key)
+            if not 200 <= status < 300 or size > self.max_entry_bytes:
+                return
+            self._remove(key)
+            self._items[key] = {
+                "fingerprint": fingerprint,
+                "status": status,
+                "headers": headers,
+                "body": body,
+                "size": size,
+                "expires": time.monotonic() + self.ttl_seconds
+            }
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._items))
+                self._remove(oldest)
+
+    def abort(self, key):
+        with self._lock:
+            self._in_flight.discard(key)
+
+    def _remove(self, key):
+        entry = self._items.pop(key, None)
+        if entry is not None:
+            self._size -= entry["size"]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._size,
+                "in_flight": len(self._in_flight),
+                "replays": self.replays,
+                "conflicts": self.conflicts,
+                "mismatches": self.mismatches
+            }
+
+
+def _user_from_token(headers):
+    """Ідентифікатор користувача з Bearer-токена (без запиту до БД)"""
+    from api.auth import SECRET_KEY, ALGORITHM
+
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("user_id")
+
+
+class IdempotencyMiddleware:
+    """ASGI-підтримка заголовка Idempotency-Key для POST/PATCH
+
+    Ключ діє в межах (користувач з токена, ключ, метод, шлях). Повтор із
+    тим самим тілом отримує збережену відповідь без повторного виконання
+    (з заголовком Idempotent-Replayed), з іншим тілом — 422, паралельний
+    повтор, поки оригінал ще обробляється, — 409. Зберігаються лише 2xx.
+    """
+
+    def __init__(self, app, max_bytes=8 * 1024 * 1024, ttl_seconds=24 * 3600):
+        self.app = app
+        self.store = IdempotencyStore(max_bytes, ttl_seconds)
+        global _active
+        _active = self
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in IDEMPOTENT_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get("idempotency-key")
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await _send_error(send, 400, "Invalid Idempotency-Key header")
+            return
+
+        user_id = _user_from_token(headers)
+        if user_id is None:
+            # Без валідного токена ендпоінт однаково відповість 401
+            await self.app(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        key = (user_id, idempotency_key, scope["method"], scope["path"])
+
+        outcome, entry = self.store.begin(key, fingerprint)
+        if outcome == "replay":
+            await send({
+                "type": "http.response.start",
+                "status": entry["status"],
+                "headers": entry["headers"] + [(b"idempotent-replayed", b"true")]
+            })
+            await send({"type": "http.response.body", "body": entry["body"]})
+            return
+        if outcome == "mismatch":
+            await _send_error(send, 422, "Idempotency-Key was already used with a different request body")
+            return
+        if outcome == "in_flight":
+            await _send_error(send, 409, "A request with this Idempotency-Key is still in progress",
+                              [(b"retry-after", b"1")])
+            return
+
+        recorder = _ResponseRecorder(send)
+        try:
+            await self.app(scope, _replay_body(body, receive), recorder)
+        except BaseException:
+            self.store.abort(key)
+            raise
+        self.store.finish(key, fingerprint, recorder.status, recorder.headers, b"".join(recorder.chunks))
+
+
+_active = None
+
+
+def stats():
+    """Метрики активного екземпляра middleware (для /api/health/metrics)"""
+    return _active.store.stats() if _active is not None else None
+
+
+class _ResponseRecorder:
+
+    def __init__(self, send):
+        self.send = send
+        self.status = 500
+        self.headers = []
+        self.chunks = []
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            self.headers = list(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            self.chunks.append(message.get("body", b""))
+        await self.send(message)
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+def _replay_body(body, receive):
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+
+async def _send_error(send, status, detail, extra_headers=()):
+    body = serialization.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *extra_headers
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
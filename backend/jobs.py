@@ -0,0 +1,318 @@
+import os
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select, update, delete, func, and_, exists
+from sqlalchemy.orm import aliased
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import changes
+from database import engine, SessionLocal, route_session
+from models import Job
+
+logger = logging.getLogger(__name__)
+
+# Фонові завдання: похідні дані (ескізи, статистика, рекомендації) рахуються
+# поза запитами. Черга зберігається в таблиці jobs головної бази, тож
+# переживає перезапуск. Записи одного користувача за JOB_DELAY_SECONDS
+# злипаються в одне завдання кожного виду.
+# SPENDIO_JOB_RUNNER=0 — процес не запускає диспетчер (тести, кілька копій API
+# з одним окремим воркером); без нього похідні дані рахуються при читанні
+JOB_RUNNER_ENABLED = os.getenv("SPENDIO_JOB_RUNNER", "1") != "0"
+JOB_WORKERS = int(os.getenv("SPENDIO_JOB_WORKERS", "2"))
+JOB_DELAY_SECONDS = float(os.getenv("SPENDIO_JOB_DELAY_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("SPENDIO_JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = 1.0
+# Завдання в статусі running довше за оренду вважаються покинутими (процес впав)
+JOB_LEASE_SECONDS = 300
+JOB_RETENTION_SECONDS = 3600
+
+_handlers = {}
+_triggers = {}
+_periodic = {}
+
+
+def register(kind, triggers=()):
+    """Зареєструвати обробник fn(db, user_id) для завдань виду kind
+
+    triggers — таблиці, після коміту змін у яких завдання ставиться в
+    чергу автоматично для кожного зачепленого користувача.
+    """
+    def decorator(fn):
+        _handlers[kind] = fn
+        for table in triggers:
+            _triggers.setdefault(table, set()).add(kind)
+        return fn
+    return decorator
+
+
+def periodic(name, seconds):
+    """Зареєструвати fn(), яку диспетчер викликає раз на seconds секунд (пакетні обходи)"""
+    def decorator(fn):
+        _periodic[name] = (fn, seconds)
+        return fn
+    return decorator
+
+
+class JobRunner:
+    """Диспетчер фонових завдань з обмеженою кількістю воркерів
+
+    Один потік-диспетчер атомарно забирає готові завдання (UPDATE ...
+    RETURNING) і передає їх у пул. Завдання того самого виду і користувача
+    не виконуються паралельно. Невдалі спроби повторюються з
+    експоненційною затримкою до max_attempts разів.
+    """
+
+    def __init__(self, bind, workers=JOB_WORKERS, delay=JOB_DELAY_SECONDS, max_attempts=JOB_MAX_ATTEMPTS,
+                 poll_seconds=JOB_POLL_SECONDS, session_factory=SessionLocal):
+        self.bind = bind
+        self.workers = workers
+        self.delay = delay
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.session_factory = session_factory
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pool = None
+        self._running = 0
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._durations = deque(maxlen=1000)
+        self._periodic_runs = {}
+        self.enqueued = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def started(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.started:
+            return
+        self._stopping.clear()
+        self._recover()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job-worker")
+        self._thread = threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        if not self.started:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._pool.shutdown(wait=True)
+        self._thread = None
+
+    def enqueue(self, jobs, delay=None):
+        """Поставити завдання [(kind, user_id), ...] у чергу; наявні очікувані злипаються"""
+        jobs = sorted(set(jobs))
+        if not jobs:
+            return 0
+        now = time.time()
+        run_after = now + (self.delay if delay is None else delay)
+        stmt = sqlite_insert(Job).on_conflict_do_nothing(
+            index_elements=["kind", "user_id"], index_where=Job.status == "pending"
+        )
+        with self.bind.begin() as conn:
+            inserted = sum(
+                conn.execute(stmt.values(kind=kind, user_id=user_id, enqueued_at=now, run_after=run_after)).rowcount
+                for kind, user_id in jobs
+            )
+        self.enqueued += inserted
+        self.coalesced += len(jobs) - inserted
+        if inserted and self.started:
+            self._wakeup.set()
+        return inserted
+
+    def run_pending(self):
+        """Синхронно виконати всі готові завдання (CLI, тести)"""
+        processed = 0
+        while True:
+            claimed = self._claim(self.workers)
+            if not claimed:
+                return processed
+            for job in claimed:
+                self._execute(job)
+                processed += 1
+
+    def _recover(self):
+        # Завдання, що «зависли» в running після падіння процесу, повертаються в чергу
+        cutoff = time.time() - JOB_LEASE_SECONDS
+        with self.bind.begin() as conn:
+            stale = conn.execute(
+                select(Job.id, Job.kind, Job.user_id).where(Job.status == "running", Job.started_at < cutoff)
+            ).all()
+        for job in stale:
+            self._reschedule(job.id, time.time())
+
+    def _claim(self, limit):
+        now = time.time()
+        running = aliased(Job)
+        busy = exists().where(and_(
+            running.status == "running", running.kind == Job.kind, running.user_id == Job.user_id
+        ))
+        ready = (
+            select(Job.id)
+            .where(Job.status == "pending", Job.run_after <= now, ~busy)
+            .order_by(Job.run_after)
+            .limit(limit)
+            .scalar_subquery()
+        )
+        with self.bind.begin() as conn:
+            return conn.execute(
+                update(Job)
+                .where(Job.id.in_(ready))
+                .values(status="running", started_at=now, attempts=Job.attempts + 1)
+                .returning(Job.id, Job.kind, Job.user_id, Job.attempts, Job.enqueued_at)
+            ).all()
+
+    def _dispatch(self):
+        last_cleanup = 0.0
+        while not self._stopping.is_set():
+            try:
+                if time.monotonic() - last_cleanup > JOB_RETENTION_SECONDS / 10:
+                    self._cleanup()
+                    last_cleanup = time.monotonic()
+                self._run_periodic()
+                free = self._free_slots()
+                claimed = self._claim(free) if free else []
+                for job in claimed:
+                    with self._lock:
+                        self._running += 1
+                    self._pool.submit(self._run_in_pool, job)
+            except Exception:
+                logger.exception("Помилка диспетчера фонових завдань")
+                claimed = []
+            if not claimed:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+
+    def _run_periodic(self):
+        for name, (fn, seconds) in list(_periodic.items()):
+            last = self._periodic_runs.get(name)
+            if last is not None and time.monotonic() - last < seconds:
+                continue
+            self._periodic_runs[name] = time.monotonic()
+            try:
+                fn()
+            except Exception:
+                logger.exception("Помилка періодичного завдання %s", name)
+
+    def _free_slots(self):
+        with self._lock:
+            return self.workers - self._running
+
+    def _run_in_pool(self, job):
+        try:
+            self._execute(job)
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._wakeup.set()
+
+    def _execute(self, job):
+        started = time.time()
+        handler = _handlers.get(job.kind)
+        db = self.session_factory()
+        try:
+            # Користувач, що саме переноситься в інший шард, — завдання повториться пізніше
+            route_session(db, job.user_id)
+            if handler is None:
+                raise LookupError(f"Невідомий вид завдання: {job.kind}")
+            handler(db, job.user_id)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self._fail(job, e)
+            return
+        finally:
+            db.close()
+
+        finished = time.time()
+        with self.bind.begin() as conn:
+            conn.execute(update(Job).where(Job.id == job.id).values(status="done", finished_at=finished, error=None))
+        self.completed += 1
+        self._durations.append(finished - started)
+        self._latencies.append(finished - job.enqueued_at)
+
+    def _fail(self, job, error):
+        if job.attempts < self.max_attempts and job.kind in _handlers:
+            self.retried += 1
+            self._reschedule(job.id, time.time() + 2 ** job.attempts, error=repr(error))
+            return
+        logger.warning("Фонове завдання %s для користувача %s не вдалося: %r", job.kind, job.user_id, error)
+        self.failed += 1
+        with self.bind.begin() as conn:
+            conn.execute(
+                update(Job).where(Job.id == job.id).values(status="failed", finished_at=time.time(), error=repr(error))
+            )
+
+    def _reschedule(self, job_id, run_after, error=None):
+        try:
+            with self.bind.begin() as conn:
+                conn.execute(update(Job).where(Job.id == job_id).values(status="pending", run_after=run_after, error=error))
+        except IntegrityError:
+            # Для цього користувача вже чекає новіше завдання — воно і виконає роботу
+            with self.bind.begin() as conn:
+                conn.execute(delete(Job).where(Job.id == job_id))
+
+    def _cleanup(self):
+        with self.bind.begin() as conn:
+            conn.execute(delete(Job).where(Job.status == "done", Job.finished_at < time.time() - JOB_RETENTION_SECONDS))
+
+    def stats(self):
+        with self.bind.connect() as conn:
+            depth = dict(conn.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+        latencies = sorted(self._latencies)
+        durations = sorted(self._durations)
+
+        def percentile(values, q):
+            return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1) if values else 0.0
+
+        return {
+            "started": self.started,
+            "workers": self.workers,
+            "pending": depth.get("pending", 0),
+            "running": depth.get("running", 0),
+            "failed_total": depth.get("failed", 0),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "latency_ms": {"p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99)},
+            "duration_ms": {"p50": percentile(durations, 0.5), "p99": percentile(durations, 0.99)}
+        }
+
+
+runner = JobRunner(engine)
+
+
+@changes.on_commit
+def _enqueue_for_changes(changeset):
+    # Без запущеного диспетчера (CLI, скрипти) похідні дані рахуються при читанні
+    if not runner.started:
+        return
+    pending = {
+        (kind, change.user_id)
+        for change in changeset if change.user_id is not None
+        for kind in _triggers.get(change.table, ())
+    }
+    if pending:
+        try:
+            runner.enqueue(pending)
+        except Exception:
+            logger.exception("Не вдалося поставити фонові завдання в чергу")
+
+
+def stats():
+    return runner.stats()
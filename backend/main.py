@@ -1,14 +1,35 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends
+from fastapi.datastructures import Default
 from fastapi.middleware.cors import CORSMiddleware
-from database import get_db, engine, Base
-from api import auth, expenses, health, categories, budgets, goals, analytics
+from database import get_db, engine, Base, init_shards, UserMoving
+from api import auth, expenses, health, categories, budgets, goals, analytics, sync, events, recurring
 from models import User, Expense, Category, Budget, Goal
+from serialization import FastJSONResponse
+from compression import CompressionMiddleware
+from idempotency import IdempotencyMiddleware
+import jobs
+
+init_shards()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Фонові завдання (ескізи, статистика, рекомендації) живуть разом із процесом
+    if jobs.JOB_RUNNER_ENABLED:
+        jobs.runner.start()
+    yield
+    jobs.runner.stop()
 
-Base.metadata.create_all(bind=engine)
 
+# Default(...) лишає FastAPI його швидку pydantic-серіалізацію для маршрутів з
+# response_model, а все інше (dict, списки, datetime) серіалізує orjson
 app = FastAPI(title="Spendio API", 
               description="API для додатку обліку витрат",
-              version="1.0.0")
+              version="1.0.0",
+              default_response_class=Default(FastJSONResponse),
+              lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,14 +39,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Повтори POST/PATCH з тим самим Idempotency-Key отримують збережену відповідь
+app.add_middleware(IdempotencyMiddleware)
+
+# Стиснення великих JSON-відповідей (експорт витрат, річні прогнози)
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(expenses.router, prefix="/api/expenses", tags=["expenses"])
 app.include_router(categories.router, prefix="/api/categories", tags=["categories"])
 app.include_router(budgets.router, prefix="/api/budgets", tags=["budgets"])
 app.include_router(goals.router, prefix="/api/goals", tags=["goals"])
-app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
+# Аналітика бачить регулярні витрати, що вже настали (матеріалізуються раз на день)
+app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"],
+                   dependencies=[Depends(recurring.materialize_recurring)])
+app.include_router(recurring.router, prefix="/api/recurring", tags=["recurring"])
+app.include_router(sync.router, prefix="/api/sync", tags=["sync"])
+app.include_router(events.router, prefix="/api/events", tags=["events"])
 app.include_router(health.router, prefix="/api", tags=["health"])
 
+# Перенос користувача між шардами триває секунди — клієнт повторює запит
+@app.exception_handler(UserMoving)
+async def user_moving_handler(request, exc):
+    return FastJSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "5"})
+
 @app.get("/")
 def read_root():
     return {"message": "Ласкаво просимо до Spendio API!"}
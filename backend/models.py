@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -31,9 +31,14 @@ class Category(Base):
     is_default = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
+    change_seq = Column(Integer)
+    # Батьківська категорія ("Транспорт" для "Таксі"); NULL — верхній рівень
+    parent_id = Column(Integer, ForeignKey("categories.id"), index=True)
     
     user = relationship("User", back_populates="categories")
     expenses = relationship("Expense", back_populates="category_obj")
+    
+    __table_args__ = (Index("ix_categories_user_change_seq", "user_id", "change_seq"),)
 
 class Expense(Base):
     __tablename__ = "expenses"
@@ -47,9 +52,23 @@ class Expense(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
+    change_seq = Column(Integer)
+    # Відбиток (дата, сума, нормалізований опис) для пошуку дублікатів імпорту
+    fingerprint = Column(String)
+    duplicate_of = Column(Integer, ForeignKey("expenses.id"))
+    # Валюта суми (ISO 4217); NULL — базова валюта (див. fx.BASE_CURRENCY)
+    currency = Column(String)
+    # Витрата, матеріалізована з регулярного правила (одна на правило і дату)
+    recurring_rule_id = Column(Integer, ForeignKey("recurring_rules.id"))
     
     user = relationship("User", back_populates="expenses")
     category_obj = relationship("Category", back_populates="expenses")
+    
+    __table_args__ = (
+        Index("ix_expenses_user_change_seq", "user_id", "change_seq"),
+        Index("ix_expenses_user_fingerprint", "user_id", "fingerprint"),
+        Index("ux_expenses_recurring_occurrence", "recurring_rule_id", "date", unique=True),
+    )
 
 class Budget(Base):
     __tablename__ = "budgets"
@@ -57,6 +76,7 @@ class Budget(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     amount = Column(Float)
+    # Застаріла колонка: витрачене рахується з денних підсумків за поточним вікном (queries.BUDGET_COLUMNS)
     spent = Column(Float, default=0.0)
     period = Column(String)
     start_date = Column(String)
@@ -66,8 +86,16 @@ class Budget(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
+    change_seq = Column(Integer)
+    # Від цього дня відлічуються вікна періоду (31-ше число лишається кінцем місяця)
+    anchor_date = Column(String)
+    # Перенесення невитраченого залишку в наступне вікно і перенесена сума поточного
+    carry_over = Column(Boolean, default=False)
+    carried_over = Column(Float, default=0.0)
     
     user = relationship("User", back_populates="budgets")
+    
+    __table_args__ = (Index("ix_budgets_user_change_seq", "user_id", "change_seq"),)
 
 class Goal(Base):
     __tablename__ = "goals"
@@ -82,5 +110,141 @@ class Goal(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
+    change_seq = Column(Integer)
+    
+    user = relationship("User", back_populates="goals")
+    
+    __table_args__ = (Index("ix_goals_user_change_seq", "user_id", "change_seq"),) 
+
+class UserShard(Base):
+    __tablename__ = "user_shards"
+    
+    user_id = Column(Integer, primary_key=True)
+    shard = Column(Integer, nullable=False, index=True)
+    assigned_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Дані користувача саме переносяться: запити до нього відхиляються
+    moving = Column(Boolean, default=False)
+
+
+class CollectionVersion(Base):
+    __tablename__ = "collection_versions"
+    
+    user_id = Column(Integer, primary_key=True)
+    collection = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+
+class ChangeSequence(Base):
+    __tablename__ = "change_sequence"
+    
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    entity = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    user_id = Column(Integer)
+    change_seq = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (Index("ix_tombstones_user_change_seq", "user_id", "change_seq"),)
+
+class DailyRollup(Base):
+    __tablename__ = "daily_rollups"
+    
+    user_id = Column(Integer, primary_key=True)
+    day = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
+    total_sq = Column(Float, nullable=False, default=0.0)
+
+class QuantileSketch(Base):
+    __tablename__ = "quantile_sketches"
+    
+    user_id = Column(Integer, primary_key=True)
+    category = Column(String, primary_key=True)
+    digest = Column(LargeBinary, nullable=False, default=b"")
+    count = Column(Integer, nullable=False, default=0)
+    dirty = Column(Boolean, nullable=False, default=False)
+
+class RunningStat(Base):
+    __tablename__ = "running_stats"
+    
+    user_id = Column(Integer, primary_key=True)
+    category = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)
+    minimum = Column(Float)
+    maximum = Column(Float)
+    extremes_stale = Column(Boolean, nullable=False, default=False)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    enqueued_at = Column(Float, nullable=False)
+    run_after = Column(Float, nullable=False)
+    started_at = Column(Float)
+    finished_at = Column(Float)
+    error = Column(Text)
+    
+    # Не більше одного очікуваного завдання на (вид, користувач) — повторні злипаються
+    __table_args__ = (
+        Index("ux_jobs_pending", "kind", "user_id", unique=True, sqlite_where=(status == "pending")),
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+class ForecastModel(Base):
+    __tablename__ = "forecast_models"
+    
+    user_id = Column(Integer, primary_key=True)
+    origin = Column(String, nullable=False)
+    fitted_through = Column(String, nullable=False)
+    expense_count = Column(Integer, nullable=False, default=0)
+    state = Column(LargeBinary, nullable=False)
+    intercept = Column(Float, nullable=False, default=0.0)
+    slope = Column(Float, nullable=False, default=0.0)
+    residual_variance = Column(Float, nullable=False, default=0.0)
+    weekday_factors = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class RecurringRule(Base):
+    __tablename__ = "recurring_rules"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    amount = Column(Float, nullable=False)
+    description = Column(String)
+    category = Column(String)
+    # Правило повторення у форматі RRULE (RFC 5545) без DTSTART
+    rule = Column(String, nullable=False)
+    start_date = Column(String, nullable=False)
+    end_date = Column(String)
+    # Останній день, до якого включно витрати вже записані в expenses
+    materialized_through = Column(String)
+    is_active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class FxRate(Base):
+    __tablename__ = "fx_rates"
+    
+    currency = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)
+    # Одиниць базової валюти за одиницю currency
+    rate = Column(Float, nullable=False)
+
+class CategoryClosure(Base):
+    __tablename__ = "category_closure"
     
-    user = relationship("User", back_populates="goals") 
\ No newline at end of file
+    # Усі пари предок → нащадок (включно з парою категорії з собою, depth = 0)
+    ancestor_id = Column(Integer, primary_key=True)
+    descendant_id = Column(Integer, primary_key=True, index=True)
+    depth = Column(Integer, nullable=False, default=0)
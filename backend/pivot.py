@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, bindparam
+
+import timeseries
+from models import DailyRollup
+
+# Виміри зведеної таблиці: категорія або відрізок часу (як у timeseries)
+PERIODS = ("week", "month", "quarter", "year")
+DIMENSIONS = ("category",) + PERIODS
+
+_cells = select(DailyRollup.day, DailyRollup.category, DailyRollup.total).where(
+    DailyRollup.user_id == bindparam("user_id"),
+    DailyRollup.day >= bindparam("start"),
+    DailyRollup.day <= bindparam("end")
+)
+
+
+def build(db, user_id, rows="category", cols="month", start=None, end=None):
+    """Зведена таблиця rows × cols з підсумками і змінами між сусідніми періодами
+
+    Усі дані читаються одним запитом з денних підсумків, групування і
+    розгортання робить pandas. Періоди без витрат заповнюються нулями.
+    """
+    if rows == cols:
+        raise ValueError("rows і cols мають бути різними вимірами")
+    start, end = timeseries.resolve_range(db, user_id, start, end)
+
+    frame = pd.DataFrame(
+        db.execute(_cells, {"user_id": user_id, "start": start.isoformat(), "end": end.isoformat()}).all(),
+        columns=["day", "category", "total"]
+    )
+    days = frame["day"].to_numpy(dtype="datetime64[D]")
+    keys = {dim: _keys(frame, days, dim) for dim in (rows, cols)}
+
+    table = pd.Series(frame["total"].to_numpy(dtype=float)).groupby(
+        [keys[rows], keys[cols]]
+    ).sum().unstack(fill_value=0.0)
+    table = _fill_periods(table, rows, cols, start, end)
+
+    values = table.to_numpy(dtype=float)
+    row_totals = values.sum(axis=1)
+    col_totals = values.sum(axis=0)
+    result = {
+        "rows": rows,
+        "cols": cols,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "row_labels": _labels(table.index, rows),
+        "col_labels": _labels(table.columns, cols),
+        "values": np.round(values, 2).tolist(),
+        "row_totals": np.round(row_totals, 2).tolist(),
+        "col_totals": np.round(col_totals, 2).tolist(),
+        "grand_total": round(float(values.sum()), 2),
+        "deltas": None,
+        "total_deltas": None,
+        "delta_axis": None
+    }
+
+    # Зміни до попереднього періоду вздовж осі часу (для cols=month — місяць до місяця),
+    # матриця deltas має ту саму форму, що й values
+    if cols in PERIODS:
+        result["deltas"] = [_with_gap(row) for row in np.diff(values, axis=1)]
+        result["total_deltas"] = _with_gap(np.diff(col_totals))
+        result["delta_axis"] = "cols"
+    elif rows in PERIODS:
+        result["deltas"] = [[None] * values.shape[1]] + np.round(np.diff(values, axis=0), 2).tolist()
+        result["total_deltas"] = _with_gap(np.diff(row_totals))
+        result["delta_axis"] = "rows"
+    return result
+
+
+def _keys(frame, days, dim):
+    if dim == "category":
+        return frame["category"].to_numpy(dtype=object)
+    return timeseries.bucket_ordinals(days, dim)
+
+
+def _fill_periods(table, rows, cols, start, end):
+    for axis, dim in ((0, rows), (1, cols)):
+        if dim in PERIODS:
+            first, last = timeseries.bucket_ordinals(np.array([start, end], dtype="datetime64[D]"), dim)
+            if last - first + 1 > timeseries.MAX_BUCKETS:
+                raise ValueError(f"Забагато періодів, максимум {timeseries.MAX_BUCKETS}")
+            table = table.reindex(np.arange(first, last + 1), axis=axis, fill_value=0.0)
+        else:
+            table = table.sort_index(axis=axis)
+    return table
+
+
+def _labels(index, dim):
+    if dim == "category":
+        return [str(label) for label in index]
+    return timeseries.bucket_labels(np.asarray(index, dtype=np.int64), dim)
+
+
+def _with_gap(deltas):
+    # Перший період не має попереднього — null
+    return [None] + np.round(deltas, 2).tolist()
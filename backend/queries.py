@@ -0,0 +1,134 @@
+from sqlalchemy import select, bindparam, lambda_stmt, case, func, literal, and_, or_
+
+from models import Expense, Category, Budget, DailyRollup, Goal, Tombstone
+
+# Гарячі запити роутерів, побудовані один раз з прив'язаними параметрами.
+# SQLAlchemy кешує їх скомпільований SQL, тож на запит лишається лише
+# підстановка значень замість побудови й компіляції ланцюжка query().filter().
+
+expense_by_id = select(Expense).where(
+    Expense.id == bindparam("expense_id"),
+    Expense.user_id == bindparam("user_id")
+)
+
+budget_by_id = select(Budget).where(
+    Budget.id == bindparam("budget_id"),
+    Budget.user_id == bindparam("user_id")
+)
+
+goal_by_id = select(Goal).where(
+    Goal.id == bindparam("goal_id"),
+    Goal.user_id == bindparam("user_id")
+)
+
+
+# Колонки відповідей списків для швидкого шляху (serialization.rows_response):
+# лише поля схем *Response, обчислювані поля рахує SQLite.
+
+EXPENSE_COLUMNS = (
+    Expense.id, Expense.amount, Expense.description, Expense.category, Expense.date, Expense.user_id,
+    Expense.duplicate_of, Expense.recurring_rule_id, Expense.currency
+)
+
+CATEGORY_COLUMNS = (
+    Category.id, Category.name, Category.description, Category.color, Category.icon, Category.is_default,
+    Category.parent_id
+)
+
+_budget_category = select(Category.name).where(Category.id == Budget.category_id).scalar_subquery()
+
+
+def budget_spent_between(start, end):
+    """Корельований підзапит: витрати бюджету (його категорії або всі) у [start, end] з денних підсумків"""
+    return select(func.coalesce(func.sum(DailyRollup.total), 0.0)).where(
+        DailyRollup.user_id == Budget.user_id,
+        DailyRollup.day >= start,
+        DailyRollup.day <= end,
+        or_(Budget.category_id.is_(None), DailyRollup.category == _budget_category)
+    ).scalar_subquery()
+
+
+# Витрачене не зберігається в бюджеті: воно завжди рахується за поточним вікном
+_budget_spent = budget_spent_between(func.substr(Budget.start_date, 1, 10), func.substr(Budget.end_date, 1, 10))
+_budget_limit = Budget.amount + func.coalesce(Budget.carried_over, 0.0)
+
+BUDGET_COLUMNS = (
+    Budget.id, Budget.name, Budget.amount, _budget_spent.label("spent"), Budget.period,
+    Budget.start_date, Budget.end_date, Budget.category_id, Budget.is_active,
+    func.coalesce(Budget.carry_over, False).label("carry_over"),
+    func.coalesce(Budget.carried_over, 0.0).label("carried_over"),
+    func.max(literal(0.0), _budget_limit - _budget_spent).label("remaining"),
+    case((Budget.amount > 0, _budget_spent * 100.0 / _budget_limit), else_=literal(0.0)).label("percentage_used")
+)
+
+budget_row_by_id = select(*BUDGET_COLUMNS).where(
+    Budget.id == bindparam("budget_id"),
+    Budget.user_id == bindparam("user_id")
+)
+
+GOAL_COLUMNS = (
+    Goal.id, Goal.title, Goal.description, Goal.target_amount, Goal.current_amount,
+    Goal.target_date, Goal.is_achieved,
+    case((Goal.target_amount > 0, Goal.current_amount * 100.0 / Goal.target_amount), else_=literal(0.0)).label("progress_percentage"),
+    func.max(literal(0.0), Goal.target_amount - Goal.current_amount).label("remaining_amount")
+)
+
+def expense_rows(user_id, category=None, start_date=None, end_date=None, skip=0, limit=100):
+    """Список витрат з необов'язковими фільтрами (лямбда-запит кешується за формою)"""
+    stmt = lambda_stmt(lambda: select(*EXPENSE_COLUMNS).where(Expense.user_id == user_id))
+    if category:
+        stmt += lambda s: s.where(Expense.category == category)
+    if start_date:
+        stmt += lambda s: s.where(Expense.date >= start_date)
+    if end_date:
+        stmt += lambda s: s.where(Expense.date <= end_date)
+    stmt += lambda s: s.order_by(Expense.date.desc()).offset(skip).limit(limit)
+    return stmt
+
+
+def category_rows(user_id, include_default=True):
+    stmt = lambda_stmt(lambda: select(*CATEGORY_COLUMNS))
+    if include_default:
+        stmt += lambda s: s.where((Category.user_id == user_id) | (Category.is_default == True))
+    else:
+        stmt += lambda s: s.where(Category.user_id == user_id)
+    stmt += lambda s: s.order_by(Category.is_default.desc(), Category.name)
+    return stmt
+
+
+def budget_rows(user_id, active_only=True):
+    stmt = lambda_stmt(lambda: select(*BUDGET_COLUMNS).where(Budget.user_id == user_id))
+    if active_only:
+        stmt += lambda s: s.where(Budget.is_active == True)
+    stmt += lambda s: s.order_by(Budget.created_at.desc())
+    return stmt
+
+
+def goal_rows(user_id, achieved_only=None):
+    stmt = lambda_stmt(lambda: select(*GOAL_COLUMNS).where(Goal.user_id == user_id))
+    if achieved_only is not None:
+        stmt += lambda s: s.where(Goal.is_achieved == achieved_only)
+    stmt += lambda s: s.order_by(Goal.is_achieved, Goal.target_date)
+    return stmt
+
+
+# Дельта-синхронізація: рядки зі change_seq у (since, upto] в порядку номерів.
+# Умови записані так, щоб SQLite брав індекс (user_id, change_seq) для кожної
+# гілки OR — вартість пропорційна кількості змін, а не розміру історії.
+
+def _changed(model, columns, shared=False):
+    in_range = and_(model.change_seq > bindparam("since"), model.change_seq <= bindparam("upto"))
+    condition = and_(model.user_id == bindparam("user_id"), in_range)
+    if shared:
+        condition = or_(condition, and_(model.user_id.is_(None), in_range))
+    return select(*columns, model.change_seq).where(condition).order_by(model.change_seq).limit(bindparam("limit"))
+
+
+changed_rows = {
+    "expenses": _changed(Expense, EXPENSE_COLUMNS),
+    "categories": _changed(Category, CATEGORY_COLUMNS, shared=True),
+    "budgets": _changed(Budget, BUDGET_COLUMNS),
+    "goals": _changed(Goal, GOAL_COLUMNS)
+}
+
+deleted_rows = _changed(Tombstone, (Tombstone.entity, Tombstone.entity_id), shared=True)
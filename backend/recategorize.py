@@ -0,0 +1,133 @@
+from sqlalchemy import select, update, func, literal, and_, or_
+
+import changefeed
+import changes
+import fx
+import rollups
+import running_stats
+import versions
+from models import Budget, Expense, QuantileSketch
+
+# Масова зміна категорії витрат (злиття категорій, перекатегоризація за
+# фільтром) одним UPDATE у транзакції запиту. Core-запит оминає обробники
+# flush, тож похідні дані оновлюються тут же дельтами з одного агрегатного
+# запиту по перенесених витратах: денні підсумки і статистика;
+# ескізи позначаються застарілими. Кількість запитів не залежить від
+# кількості витрат. Завантажені в сесію об'єкти не синхронізуються — коміт
+# однаково їх прострочує.
+
+_CORE = {"synchronize_session": False}
+
+_stats = {"operations": 0, "expenses_moved": 0}
+
+
+def expense_filter(user_id, categories=None, start_date=None, end_date=None, description=None,
+                   min_amount=None, max_amount=None):
+    """Умова WHERE для витрат користувача за фільтрами (None — без обмеження)"""
+    condition = [Expense.user_id == user_id]
+    if categories is not None:
+        named = [category for category in categories if category]
+        uncategorized = len(named) != len(categories)
+        condition.append(or_(
+            Expense.category.in_(named),
+            *([Expense.category.is_(None), Expense.category == ""] if uncategorized else [])
+        ))
+    if start_date:
+        condition.append(Expense.date >= start_date)
+    if end_date:
+        # Дата може мати час: межа включає весь день end_date
+        condition.append(func.substr(Expense.date, 1, 10) <= end_date[:10])
+    if description:
+        condition.append(Expense.description.ilike(f"%{description}%"))
+    if min_amount is not None:
+        condition.append(Expense.amount >= min_amount)
+    if max_amount is not None:
+        condition.append(Expense.amount <= max_amount)
+    return and_(*condition)
+
+
+def move(session, user_id, condition, target, target_id=None, repoint_budgets_from=None):
+    """Перенести витрати за умовою condition у категорію target; повертає їх кількість
+
+    repoint_budgets_from — id категорії, бюджети якої переходять на target_id
+    (злиття). Витрачене бюджетів рахується з денних підсумків, тож окремо не
+    оновлюється. Транзакцію комітить викликач.
+    """
+    condition = and_(condition, or_(Expense.category.is_(None), Expense.category != target))
+    amount = fx.base_amount()
+    day = func.substr(Expense.date, 1, 10)
+    category = func.coalesce(Expense.category, literal(""))
+    per_day = session.execute(
+        select(day.label("day"), category.label("category"), func.count(Expense.id).label("count"),
+               func.sum(amount).label("total"), func.sum(amount * amount).label("total_sq"),
+               func.min(amount).label("minimum"), func.max(amount).label("maximum"))
+        .where(condition, Expense.amount.is_not(None))
+        .group_by(day, category)
+    ).all()
+    moved_count = sum(row.count for row in per_day)
+    repointed = session.scalars(
+        select(Budget.id).where(Budget.user_id == user_id, Budget.category_id == repoint_budgets_from)
+    ).all() if repoint_budgets_from is not None else []
+    if not moved_count and not repointed:
+        return 0
+
+    seq = changefeed.allocate(session, moved_count + len(repointed))
+    if repointed:
+        numbered = select(
+            Budget.id, (func.row_number().over(order_by=Budget.id) - 1).label("offset")
+        ).where(Budget.id.in_(repointed)).subquery()
+        session.execute(
+            update(Budget).where(Budget.id == numbered.c.id)
+            .values(category_id=target_id, change_seq=seq + numbered.c.offset),
+            execution_options=_CORE
+        )
+        seq += len(repointed)
+    if moved_count:
+        _move_expenses(session, user_id, condition, per_day, target, target_id, seq)
+
+    tables = (["expenses"] if moved_count else []) + (["budgets"] if repointed else [])
+    versions.bump(session, {(user_id, versions.TRACKED_TABLES[table]) for table in tables})
+    for table in tables:
+        changes.record_bulk(session, table, [user_id])
+    _stats["operations"] += 1
+    _stats["expenses_moved"] += moved_count
+    return moved_count
+
+
+def _move_expenses(session, user_id, condition, per_day, target, target_id, seq):
+    """UPDATE витрат і дельти похідних даних з агрегатів per_day"""
+    # Кожна витрата отримує власний номер змін (пагінація /api/sync за номерами)
+    numbered = select(
+        Expense.id, (func.row_number().over(order_by=Expense.id) - 1).label("offset")
+    ).where(condition, Expense.amount.is_not(None)).subquery()
+    values = {"category": target, "change_seq": seq + numbered.c.offset}
+    if target_id is not None:
+        values["category_id"] = target_id
+    session.execute(update(Expense).where(Expense.id == numbered.c.id).values(**values), execution_options=_CORE)
+
+    deltas = {}
+    moved = {}
+    for row in per_day:
+        # Витрати без дати не входять у денні підсумки
+        if row.day is not None:
+            for key, sign in (((user_id, row.day, row.category), -1), ((user_id, row.day, target), 1)):
+                delta = deltas.setdefault(key, [0.0, 0, 0.0])
+                delta[0] += sign * row.total
+                delta[1] += sign * row.count
+                delta[2] += sign * row.total_sq
+        count, total, total_sq, low, high = moved.get(row.category, (0, 0.0, 0.0, row.minimum, row.maximum))
+        moved[row.category] = (count + row.count, total + row.total, total_sq + row.total_sq,
+                               min(low, row.minimum), max(high, row.maximum))
+    rollups.apply(session, deltas)
+    running_stats.move(session, user_id, moved, target)
+    # t-digest не вміє видаляти значення — ескізи перебудуються з історії
+    session.execute(
+        update(QuantileSketch)
+        .where(QuantileSketch.user_id == user_id, QuantileSketch.category.in_(set(moved) | {target}))
+        .values(dirty=True),
+        execution_options=_CORE
+    )
+
+
+def stats():
+    return dict(_stats)
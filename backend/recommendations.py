@@ -0,0 +1,202 @@
+import math
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select, func, bindparam
+
+import fx
+import jobs
+import queries
+import recurring
+import versions
+from models import Expense, Category, Budget, DailyRollup
+
+# Кеш результатів на користувача; ключ — версії колекцій і дата, тож будь-який
+# запис (або новий день) робить збережений результат неактуальним
+MAX_CACHED_USERS = 10000
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+_monthly_totals = select(
+    func.substr(DailyRollup.day, 1, 7).label("month"),
+    func.sum(DailyRollup.total).label("total")
+).where(
+    DailyRollup.user_id == bindparam("user_id")
+).group_by("month").order_by("month")
+
+_top_category = select(
+    DailyRollup.category,
+    func.sum(DailyRollup.total).label("total")
+).where(
+    DailyRollup.user_id == bindparam("user_id")
+).group_by(DailyRollup.category).order_by(func.sum(DailyRollup.total).desc()).limit(1)
+
+_moments = select(
+    func.sum(DailyRollup.count),
+    func.sum(DailyRollup.total),
+    func.sum(DailyRollup.total_sq)
+).where(DailyRollup.user_id == bindparam("user_id"))
+
+# Поріг рахується з підсумків у базовій валюті — і суми порівнюються в ній же
+_above_threshold = select(func.count(Expense.id)).where(
+    Expense.user_id == bindparam("user_id"),
+    fx.base_amount() > bindparam("threshold")
+)
+
+# Ліміт поточного вікна з перенесеним залишком і витрачене в ньому (як у списку бюджетів)
+_active_budgets = select(
+    Budget.name, (Budget.amount + func.coalesce(Budget.carried_over, 0.0)).label("amount"),
+    Budget.start_date, Budget.end_date, Category.name.label("category"),
+    queries.budget_spent_between(func.substr(Budget.start_date, 1, 10), func.substr(Budget.end_date, 1, 10)).label("spent")
+).outerjoin(Category, Category.id == Budget.category_id).where(
+    Budget.user_id == bindparam("user_id"),
+    Budget.is_active == True
+)
+
+
+def get(db, user_id, today=None):
+    """Рекомендації користувача з кешу або обчислені з денних підсумків"""
+    today = today or date.today()
+    key = (
+        versions.current(db, user_id, "expenses"),
+        versions.current(db, user_id, "budgets"),
+        versions.current(db, user_id, "categories"),
+        versions.current(db, user_id, "recurring"),
+        today
+    )
+    with _cache_lock:
+        cached = _cache.get(user_id)
+        if cached is not None and cached[0] == key:
+            _cache.move_to_end(user_id)
+            return cached[1]
+
+    result = compute(db, user_id, today)
+    with _cache_lock:
+        _cache[user_id] = (key, result)
+        _cache.move_to_end(user_id)
+        while len(_cache) > MAX_CACHED_USERS:
+            _cache.popitem(last=False)
+    return result
+
+
+@jobs.register("recommendations", triggers=("expenses", "budgets", "categories"))
+def _warm_cache(db, user_id):
+    # Після запису рекомендації перераховуються у фоні, а не в наступному запиті
+    get(db, user_id)
+
+
+def compute(db, user_id, today):
+    params = {"user_id": user_id}
+    recommendations = []
+
+    trend = spending_trend(db.execute(_monthly_totals, params).all())
+    if trend["direction"] == "зростання":
+        recommendations.append({
+            "type": "warning",
+            "title": "Зростання витрат",
+            "message": f"Ваші витрати мають тенденцію до зростання. Прогнозується {trend['next_month']} ₴ за наступний місяць.",
+            "icon": "📈"
+        })
+
+    top = db.execute(_top_category, params).first()
+    if top is not None and top.total > 0:
+        recommendations.append({
+            "type": "info",
+            "title": "Найбільші витрати",
+            "message": f"Категорія \"{top.category}\" займає найбільшу частину ваших витрат ({round(top.total, 2)} ₴).",
+            "icon": "💰"
+        })
+
+    anomalies = anomaly_count(db, user_id)
+    if anomalies > 0:
+        recommendations.append({
+            "type": "alert",
+            "title": "Незвичайні витрати",
+            "message": f"Знайдено {anomalies} витрат, що значно перевищують ваш звичайний рівень.",
+            "icon": "⚠️"
+        })
+
+    recommendations.extend(budget_risks(db, user_id, today))
+    return recommendations
+
+
+def spending_trend(monthly):
+    """Лінійний тренд місячних сум (як calculateMonthlyTrend у фронтенді)"""
+    amounts = np.array([row.total for row in monthly], dtype=float)
+    if len(amounts) < 2:
+        return {"direction": "стабільно", "slope": 0.0, "next_month": None}
+
+    slope, intercept = np.polyfit(np.arange(len(amounts)), amounts, 1)
+    direction = "стабільно"
+    if slope > amounts[0] * 0.05:
+        direction = "зростання"
+    elif slope < -amounts[0] * 0.05:
+        direction = "спадання"
+    next_month = max(0.0, intercept + slope * len(amounts))
+    return {"direction": direction, "slope": float(slope), "next_month": round(float(next_month))}
+
+
+def anomaly_count(db, user_id):
+    """Кількість витрат понад середнє + 2σ (σ з сум і сум квадратів підсумків)"""
+    count, total, total_sq = db.execute(_moments, {"user_id": user_id}).one()
+    if not count or count < 10:
+        return 0
+    mean = total / count
+    std = math.sqrt(max(0.0, total_sq / count - mean * mean))
+    if std == 0:
+        return 0
+    return db.execute(_above_threshold, {"user_id": user_id, "threshold": mean + 2 * std}).scalar()
+
+
+def budget_risks(db, user_id, today):
+    """Перевищені бюджети і ті, що будуть перевищені за поточного темпу"""
+    risks = []
+    budgets = db.execute(_active_budgets, {"user_id": user_id}).all()
+    ends = [end for end in (_parse_day(budget.end_date) for budget in budgets) if end is not None]
+    # Регулярні витрати до кінця бюджетів — вже відома частина майбутніх витрат
+    scheduled = recurring.upcoming(db, user_id, today + timedelta(days=1), max(ends)) if ends else []
+    for budget in budgets:
+        start, end = _parse_day(budget.start_date), _parse_day(budget.end_date)
+        if start is None or end is None or not budget.amount:
+            continue
+
+        spent = budget.spent
+
+        period_days = (end - start).days + 1
+        elapsed_days = min(max((today - start).days + 1, 0), period_days)
+        projected = spent * period_days / elapsed_days if elapsed_days else spent
+        projected = max(projected, spent + recurring.scheduled_total(
+            scheduled, start.isoformat(), end.isoformat(), budget.category
+        ))
+
+        if spent >= budget.amount:
+            risks.append({
+                "type": "alert",
+                "title": "Бюджет перевищено",
+                "message": f"Бюджет \"{budget.name}\" перевищено: витрачено {round(spent, 2)} з {budget.amount} ₴.",
+                "icon": "🚨"
+            })
+        elif spent >= budget.amount * 0.9 or projected > budget.amount:
+            risks.append({
+                "type": "warning",
+                "title": "Ризик перевищення бюджету",
+                "message": f"За поточного темпу бюджет \"{budget.name}\" буде перевищено "
+                           f"(витрачено {round(spent, 2)} з {budget.amount} ₴).",
+                "icon": "⏳"
+            })
+    return risks
+
+
+def _parse_day(value):
+    try:
+        return datetime.fromisoformat(str(value)[:10]).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def stats():
+    with _cache_lock:
+        return {"cached_users": len(_cache)}
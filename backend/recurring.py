@@ -0,0 +1,235 @@
+import threading
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+from dateutil.rrule import rrulestr, YEARLY, MONTHLY, WEEKLY, DAILY
+from sqlalchemy import select, or_, bindparam
+from sqlalchemy.exc import IntegrityError
+
+import changes
+import jobs
+from models import Expense, RecurringRule
+
+# Регулярні витрати (оренда, підписки) зберігаються одним правилом RRULE.
+# Конкретні рядки expenses з'являються лише для днів, що вже настали:
+# ліниво при першому читанні за день або пакетним обходом диспетчера.
+# Майбутні входження обчислюються з правила на льоту — бюджети і прогноз
+# бачать їх без років наперед записаних рядків.
+FREQUENCIES = ("daily", "weekly", "monthly", "yearly", "custom")
+# Частіше ніж раз на день правила не повторюються (витрати мають лише дату)
+ALLOWED_FREQUENCIES = {YEARLY, MONTHLY, WEEKLY, DAILY}
+MAX_UPCOMING_DAYS = 366
+SWEEP_INTERVAL_SECONDS = 3600
+
+_materialized = {}
+_materialized_lock = threading.Lock()
+_stats = {"materialized": 0, "lazy_runs": 0, "sweeps": 0, "conflicts": 0}
+
+# Правила, у яких можуть бути ще не записані входження до through включно
+_due = (
+    RecurringRule.is_active == True,
+    RecurringRule.start_date <= bindparam("through"),
+    or_(RecurringRule.materialized_through.is_(None), RecurringRule.materialized_through < bindparam("through")),
+    or_(RecurringRule.end_date.is_(None), RecurringRule.materialized_through.is_(None),
+        RecurringRule.end_date > RecurringRule.materialized_through)
+)
+
+_due_rules = select(RecurringRule).where(RecurringRule.user_id == bindparam("user_id"), *_due).order_by(RecurringRule.id)
+
+_users_with_due_rules = select(RecurringRule.user_id).where(*_due).distinct()
+
+_active_rules = select(
+    RecurringRule.id, RecurringRule.amount, RecurringRule.description, RecurringRule.category,
+    RecurringRule.rule, RecurringRule.start_date, RecurringRule.end_date, RecurringRule.materialized_through
+).where(
+    RecurringRule.user_id == bindparam("user_id"),
+    RecurringRule.is_active == True,
+    RecurringRule.start_date <= bindparam("end"),
+    or_(RecurringRule.end_date.is_(None), RecurringRule.end_date >= bindparam("start"))
+).order_by(RecurringRule.id)
+
+
+def build_rule(frequency, start, interval=1, rrule=None):
+    """Рядок RRULE для частоти або перевірений власний рядок (ValueError, якщо некоректний)"""
+    if frequency == "custom":
+        if not rrule:
+            raise ValueError("Для частоти custom потрібне правило RRULE")
+        rule = rrule.strip()
+        if rule.upper().startswith("RRULE:"):
+            rule = rule[len("RRULE:"):]
+        if "DTSTART" in rule.upper():
+            raise ValueError("Початок правила задається полем start_date")
+    elif frequency == "monthly" and start.day > 28:
+        # 31-го числа: останній день коротших місяців, а не пропуск місяця
+        days = ",".join(str(day) for day in range(28, start.day + 1))
+        rule = f"FREQ=MONTHLY;INTERVAL={interval};BYMONTHDAY={days};BYSETPOS=-1"
+    elif frequency in FREQUENCIES:
+        rule = f"FREQ={frequency.upper()};INTERVAL={interval}"
+    else:
+        raise ValueError(f"Невідома частота: {frequency}")
+
+    parsed = _parse(rule, start.isoformat())
+    # rrulestr повертає rruleset для кількох правил — підтримується лише одне
+    if getattr(parsed, "_freq", None) not in ALLOWED_FREQUENCIES:
+        raise ValueError("Потрібне одне правило, що повторюється не частіше ніж раз на день")
+    return rule
+
+
+@lru_cache(maxsize=4096)
+def _parse(rule, start_date):
+    try:
+        return rrulestr(rule, dtstart=datetime.combine(date.fromisoformat(start_date), time()))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Некоректне правило RRULE: {e}") from None
+
+
+def occurrences(rule, start_date, end_date, start, end):
+    """Дати входжень правила в межах [start, end] (з урахуванням end_date правила)"""
+    if end_date is not None:
+        end = min(end, date.fromisoformat(end_date))
+    if start > end:
+        return []
+    parsed = _parse(rule, start_date)
+    return [
+        moment.date() for moment in
+        parsed.between(datetime.combine(start, time()), datetime.combine(end, time()), inc=True)
+    ]
+
+
+def next_occurrence(rule, after):
+    """Перше входження правила (ORM-об'єкт або рядок запиту) після дати after"""
+    moment = _parse(rule.rule, rule.start_date).after(datetime.combine(after, time()))
+    if moment is None or (rule.end_date is not None and moment.date() > date.fromisoformat(rule.end_date)):
+        return None
+    return moment.date()
+
+
+def _after(day):
+    return date.fromisoformat(day) + timedelta(days=1) if day else None
+
+
+def materialize(db, user_id, through=None):
+    """Записати в expenses входження правил користувача до through включно
+
+    Повертає кількість нових витрат. Рядки додаються через ORM, тож денні
+    підсумки, статистика і версії оновлюються звичайними обробниками flush.
+    Унікальний індекс (правило, дата) не дає двом процесам записати те
+    саме входження двічі.
+    """
+    through = through or date.today()
+    rules = db.scalars(_due_rules, {"user_id": user_id, "through": through.isoformat()}).all()
+    if not rules:
+        return 0
+
+    created = 0
+    for rule in rules:
+        start = max(date.fromisoformat(rule.start_date), _after(rule.materialized_through) or date.min)
+        for day in occurrences(rule.rule, rule.start_date, rule.end_date, start, through):
+            db.add(Expense(
+                amount=rule.amount,
+                description=rule.description,
+                category=rule.category,
+                date=day.isoformat(),
+                user_id=user_id,
+                recurring_rule_id=rule.id
+            ))
+            created += 1
+        rule.materialized_through = through.isoformat()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Паралельний запит уже матеріалізував ці дні
+        db.rollback()
+        _stats["conflicts"] += 1
+        return 0
+    _stats["materialized"] += created
+    return created
+
+
+def ensure_materialized(db, user_id, today=None):
+    """Ліниво матеріалізувати входження до сьогодні — не частіше разу на день
+
+    Після першого виклику за день (або зміни правил) наступні запити
+    користувача не роблять жодного звернення до бази.
+    """
+    today = today or date.today()
+    with _materialized_lock:
+        if _materialized.get(user_id) == today:
+            return 0
+    created = materialize(db, user_id, today)
+    _stats["lazy_runs"] += 1
+    with _materialized_lock:
+        _materialized[user_id] = today
+    return created
+
+
+@changes.on_commit
+def _forget_materialized(changeset):
+    # Нове чи змінене правило може мати входження в минулому
+    users = {change.user_id for change in changeset if change.table == "recurring_rules"}
+    if users:
+        with _materialized_lock:
+            for user_id in users:
+                _materialized.pop(user_id, None)
+
+
+def materialize_due(bind, today=None):
+    """Пакетно матеріалізувати правила всіх користувачів однієї бази"""
+    from database import SessionLocal
+
+    today = today or date.today()
+    db = SessionLocal(bind=bind)
+    try:
+        user_ids = db.scalars(_users_with_due_rules, {"through": today.isoformat()}).all()
+        created = sum(materialize(db, user_id, today) for user_id in user_ids)
+    finally:
+        db.close()
+    with _materialized_lock:
+        for user_id in user_ids:
+            _materialized[user_id] = today
+    return created
+
+
+@jobs.periodic("recurring", SWEEP_INTERVAL_SECONDS)
+def _sweep():
+    from database import shard_router
+
+    for shard_engine in shard_router.engines:
+        materialize_due(shard_engine)
+    _stats["sweeps"] += 1
+
+
+def upcoming(db, user_id, start, end):
+    """Ще не записані входження правил у [start, end], відсортовані за датою"""
+    rows = db.execute(_active_rules, {
+        "user_id": user_id, "start": start.isoformat(), "end": end.isoformat()
+    }).all()
+    result = []
+    for row in rows:
+        # Дні до materialized_through включно вже є в expenses
+        first = max(start, _after(row.materialized_through) or start)
+        for day in occurrences(row.rule, row.start_date, row.end_date, first, end):
+            result.append({
+                "rule_id": row.id,
+                "date": day.isoformat(),
+                "amount": row.amount,
+                "description": row.description,
+                "category": row.category
+            })
+    result.sort(key=lambda item: (item["date"], item["rule_id"]))
+    return result
+
+
+def scheduled_total(occurrences, start=None, end=None, category=None):
+    """Сума входжень у [start, end] (і лише категорії category, якщо задана)"""
+    return round(sum(
+        item["amount"] for item in occurrences
+        if (start is None or item["date"] >= start) and (end is None or item["date"] <= end)
+        and (category is None or item["category"] == category)
+    ), 2)
+
+
+def stats():
+    with _materialized_lock:
+        tracked = len(_materialized)
+    return {**_stats, "tracked_users": tracked, "parsed_rules": _parse.cache_info().currsize}
@@ -0,0 +1,115 @@
+from sqlalchemy import select, delete, func, literal
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import changes
+import fx
+from models import Expense, DailyRollup
+
+# Денні підсумки витрат (користувач, день, категорія): сума, кількість і сума
+# квадратів. Оновлюються в тій самій транзакції, що й витрати, тож аналітика
+# читає кілька сотень рядків підсумків замість усієї історії. Суми
+# зберігаються в базовій валюті (див. fx).
+
+ROLLUP_FIELDS = ("amount", "currency", "date", "category", "user_id")
+
+changes.track_history(*(getattr(Expense, field) for field in ROLLUP_FIELDS))
+
+
+def day_of(value):
+    return str(value)[:10] if value else None
+
+
+def _collect(entries, user_id, day, category, amount, currency, sign):
+    if user_id is None or day is None or amount is None:
+        return
+    entries.append((user_id, day, category or "", amount, currency, sign))
+
+
+@changes.on_flush
+def _maintain_rollups(session, changeset):
+    entries = []
+    for change in changeset:
+        if change.table != "expenses":
+            continue
+        if change.kind == "update" and not any(change.changed(field) for field in ROLLUP_FIELDS):
+            continue
+        if change.kind in ("update", "delete"):
+            _collect(entries, change.old("user_id"), day_of(change.old("date")), change.old("category"),
+                     change.old("amount"), change.old("currency"), -1)
+        if change.kind in ("insert", "update"):
+            expense = change.obj
+            _collect(entries, expense.user_id, day_of(expense.date), expense.category,
+                     expense.amount, expense.currency, 1)
+    if not entries:
+        return
+
+    amounts = fx.to_base(session, [entry[3] for entry in entries], [entry[4] for entry in entries],
+                         [entry[1] for entry in entries])
+    deltas = {}
+    for (user_id, day, category, _, _, sign), amount in zip(entries, amounts):
+        delta = deltas.setdefault((user_id, day, category), [0.0, 0, 0.0])
+        delta[0] += sign * amount
+        delta[1] += sign
+        delta[2] += sign * amount * amount
+    apply(session, deltas)
+
+
+def apply(session, deltas):
+    """Додати дельти {(user_id, day, category): [total, count, total_sq]} до підсумків"""
+    deltas = {key: value for key, value in deltas.items() if value[1] != 0 or value[0] != 0}
+    if not deltas:
+        return
+    stmt = sqlite_insert(DailyRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day", "category"],
+        set_={
+            "total": DailyRollup.total + stmt.excluded.total,
+            "count": DailyRollup.count + stmt.excluded.count,
+            "total_sq": DailyRollup.total_sq + stmt.excluded.total_sq
+        }
+    )
+    session.execute(stmt, [
+        {"user_id": user_id, "day": day, "category": category,
+         "total": total, "count": count, "total_sq": total_sq}
+        for (user_id, day, category), (total, count, total_sq) in sorted(deltas.items())
+    ])
+    if any(count < 0 for _, count, _ in deltas.values()):
+        session.execute(delete(DailyRollup).where(
+            DailyRollup.user_id.in_({user_id for user_id, _, _ in deltas}),
+            DailyRollup.count <= 0
+        ))
+
+
+def rebuild(conn, user_id=None, since=None):
+    """Перерахувати підсумки з таблиці витрат (усіх або одного користувача, з дня since)"""
+    cleanup = delete(DailyRollup)
+    amount = fx.base_amount()
+    source = select(
+        Expense.user_id,
+        func.substr(Expense.date, 1, 10),
+        func.coalesce(Expense.category, literal("")),
+        func.sum(amount),
+        func.count(Expense.id),
+        func.sum(amount * amount)
+    ).where(Expense.user_id.is_not(None), Expense.date.is_not(None), Expense.amount.is_not(None))
+    if user_id is not None:
+        cleanup = cleanup.where(DailyRollup.user_id == user_id)
+        source = source.where(Expense.user_id == user_id)
+    if since is not None:
+        cleanup = cleanup.where(DailyRollup.day >= since)
+        source = source.where(func.substr(Expense.date, 1, 10) >= since)
+    source = source.group_by(Expense.user_id, func.substr(Expense.date, 1, 10), func.coalesce(Expense.category, literal("")))
+
+    conn.execute(cleanup)
+    conn.execute(DailyRollup.__table__.insert().from_select(
+        ["user_id", "day", "category", "total", "count", "total_sq"], source
+    ))
+
+
+def ensure_built(bind):
+    """Побудувати підсумки для бази, де витрати з'явились раніше за таблицю підсумків"""
+    with bind.begin() as conn:
+        has_rollups = conn.execute(select(DailyRollup.user_id).limit(1)).first() is not None
+        has_expenses = conn.execute(select(Expense.id).limit(1)).first() is not None
+        if has_expenses and not has_rollups:
+            rebuild(conn)
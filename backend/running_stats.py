@@ -0,0 +1,301 @@
+import math
+
+from sqlalchemy import select, update, delete, func, literal, bindparam, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import changes
+import fx
+import jobs
+from models import Expense, RunningStat
+
+# Поточна статистика сум витрат (кількість, середнє, M2, мінімум, максимум)
+# для кожної пари (користувач, категорія) і для користувача загалом (ALL).
+# Оновлюється алгоритмом Велфорда в транзакції запису: додавання зливає
+# нові значення, видалення і зміна — обернене злиття. Мінімум і максимум
+# відняти неможливо, тож після видалення крайнього значення вони
+# позначаються застарілими і перераховуються фоновим завданням "statistics"
+# (до того читання рахує їх запитом, нічого не записуючи). Суми — в базовій
+# валюті (див. fx).
+
+# Ключ загальної статистики не може бути назвою категорії: назви з NUL
+# відхиляються валідацією (CATEGORY_PATTERN)
+ALL = "\x00"
+CATEGORY_PATTERN = r"^[^\x00]*$"
+STAT_FIELDS = ("amount", "currency", "date", "category", "user_id")
+
+changes.track_history(*(getattr(Expense, field) for field in STAT_FIELDS))
+
+_STAT_COLUMNS = ("count", "mean", "m2", "minimum", "maximum", "extremes_stale")
+
+_stats_for_keys = select(
+    RunningStat.user_id, RunningStat.category, *(getattr(RunningStat, name) for name in _STAT_COLUMNS)
+).where(tuple_(RunningStat.user_id, RunningStat.category).in_(bindparam("keys", expanding=True)))
+
+
+def _moments(values):
+    count = len(values)
+    mean = sum(values) / count
+    return count, mean, sum((value - mean) ** 2 for value in values)
+
+
+def moments_of(count, total, total_sq):
+    """(count, mean, m2) з агрегатів SQL: кількості, суми і суми квадратів"""
+    mean = total / count
+    return count, mean, max(total_sq - total * mean, 0.0)
+
+
+def combine(state, values):
+    """Злити значення values у стан (count, mean, m2) — паралельний варіант Велфорда"""
+    return combine_moments(state, _moments(values))
+
+
+def combine_moments(state, moments):
+    count_a, mean_a, m2_a = state
+    count_b, mean_b, m2_b = moments
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / count
+    return count, mean, m2_a + m2_b + delta * delta * count_a * count_b / count
+
+
+def remove(state, values):
+    """Обернене злиття: прибрати values зі стану (count, mean, m2)"""
+    return remove_moments(state, _moments(values))
+
+
+def remove_moments(state, moments):
+    count_a, mean_a, m2_a = state
+    count_b, mean_b, m2_b = moments
+    count = count_a - count_b
+    if count <= 0:
+        return 0, 0.0, 0.0
+    mean = (count_a * mean_a - count_b * mean_b) / count
+    delta = mean_b - mean
+    # Похибка округлення не повинна давати від'ємну дисперсію
+    return count, mean, max(m2_a - m2_b - delta * delta * count * count_b / count_a, 0.0)
+
+
+def _collect(entries, user_id, category, amount, currency, day, groups):
+    if user_id is None or amount is None:
+        return
+    entries.append((user_id, category or "", amount, currency, day, groups))
+
+
+@changes.on_flush
+def _maintain_stats(session, changeset):
+    added, removed = {}, {}
+    entries = []
+    for change in changeset:
+        if change.table != "expenses":
+            continue
+        if change.kind == "update" and not (fx.value_changed(change) or change.changed("category")
+                                            or change.changed("user_id")):
+            continue
+        if change.kind in ("update", "delete"):
+            _collect(entries, change.old("user_id"), change.old("category"), change.old("amount"),
+                     change.old("currency"), change.old("date"), removed)
+        if change.kind in ("insert", "update"):
+            expense = change.obj
+            _collect(entries, expense.user_id, expense.category, expense.amount,
+                     expense.currency, expense.date, added)
+
+    amounts = fx.to_base(session, [entry[2] for entry in entries], [entry[3] for entry in entries],
+                         [entry[4] for entry in entries])
+    for (user_id, category, _, _, _, groups), amount in zip(entries, amounts):
+        groups.setdefault((user_id, category), []).append(amount)
+        groups.setdefault((user_id, ALL), []).append(amount)
+
+    keys = sorted(set(added) | set(removed))
+    if not keys:
+        return
+    existing = {(row.user_id, row.category): row for row in session.execute(_stats_for_keys, {"keys": keys})}
+
+    rows = []
+    for key in keys:
+        row = existing.get(key)
+        state = (row.count, row.mean, row.m2) if row else (0, 0.0, 0.0)
+        minimum, maximum = (row.minimum, row.maximum) if row else (None, None)
+        stale = row.extremes_stale if row else False
+
+        values = removed.get(key)
+        if values and state[0]:
+            state = remove(state, values)
+            if state[0] == 0:
+                minimum = maximum = None
+                stale = False
+            elif minimum is None or min(values) <= minimum or max(values) >= maximum:
+                stale = True
+        values = added.get(key)
+        if values:
+            state = combine(state, values)
+            minimum = min(values) if minimum is None else min(minimum, min(values))
+            maximum = max(values) if maximum is None else max(maximum, max(values))
+        rows.append({
+            "user_id": key[0], "category": key[1], "count": state[0], "mean": state[1], "m2": state[2],
+            "minimum": minimum, "maximum": maximum, "extremes_stale": stale
+        })
+
+    stmt = sqlite_insert(RunningStat)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "category"],
+        set_={name: stmt.excluded[name] for name in _STAT_COLUMNS}
+    ), rows)
+    if any(row["count"] == 0 for row in rows):
+        session.execute(delete(RunningStat).where(
+            RunningStat.user_id.in_({row["user_id"] for row in rows}),
+            RunningStat.count <= 0
+        ))
+
+
+def move(session, user_id, moved, target):
+    """Перенести витрати між категоріями без перерахунку з історії
+
+    moved — {стара категорія: (count, total, total_sq, minimum, maximum)}
+    перенесених у target сум; статистика ALL не змінюється.
+    """
+    keys = sorted({(user_id, category) for category in moved} | {(user_id, target)})
+    existing = {(row.user_id, row.category): row for row in session.execute(_stats_for_keys, {"keys": keys})}
+
+    rows = []
+    for key in keys:
+        row = existing.get(key)
+        state = (row.count, row.mean, row.m2) if row else (0, 0.0, 0.0)
+        minimum, maximum = (row.minimum, row.maximum) if row else (None, None)
+        stale = row.extremes_stale if row else False
+        if key[1] == target:
+            for count, total, total_sq, low, high in moved.values():
+                state = combine_moments(state, moments_of(count, total, total_sq))
+                minimum = low if minimum is None else min(minimum, low)
+                maximum = high if maximum is None else max(maximum, high)
+        elif state[0]:
+            count, total, total_sq, low, high = moved[key[1]]
+            state = remove_moments(state, moments_of(count, total, total_sq))
+            if state[0] == 0:
+                minimum = maximum = None
+                stale = False
+            elif minimum is None or low <= minimum or high >= maximum:
+                stale = True
+        rows.append({
+            "user_id": key[0], "category": key[1], "count": state[0], "mean": state[1], "m2": state[2],
+            "minimum": minimum, "maximum": maximum, "extremes_stale": stale
+        })
+
+    stmt = sqlite_insert(RunningStat)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "category"],
+        set_={name: stmt.excluded[name] for name in _STAT_COLUMNS}
+    ), rows)
+    if any(row["count"] == 0 for row in rows):
+        session.execute(delete(RunningStat).where(RunningStat.user_id == user_id, RunningStat.count <= 0))
+
+
+def _category_filter(category):
+    if category == ALL:
+        return literal(True)
+    if category:
+        return Expense.category == category
+    return Expense.category.is_(None) | (Expense.category == "")
+
+
+def _extremes(db, user_id, category):
+    amount = fx.base_amount()
+    return tuple(db.execute(
+        select(func.min(amount), func.max(amount))
+        .where(Expense.user_id == user_id, Expense.amount.is_not(None), _category_filter(category))
+    ).one())
+
+
+def describe(row, minimum=None, maximum=None):
+    variance = row.m2 / (row.count - 1) if row.count > 1 else 0.0
+    stddev = math.sqrt(variance)
+    return {
+        "count": row.count,
+        "mean": round(row.mean, 2),
+        "variance": round(variance, 2),
+        "stddev": round(stddev, 2),
+        # Волатильність — коефіцієнт варіації (σ / середнє)
+        "volatility": round(stddev / row.mean, 4) if row.mean else None,
+        "min": minimum if minimum is not None else row.minimum,
+        "max": maximum if maximum is not None else row.maximum
+    }
+
+
+def zscore(summary, amount):
+    """Стандартизоване відхилення суми від середнього категорії"""
+    if not summary["stddev"]:
+        return None
+    return round((amount - summary["mean"]) / summary["stddev"], 2)
+
+
+_user_stats = select(RunningStat).where(RunningStat.user_id == bindparam("user_id"))
+
+
+def summary(db, user_id, category=None):
+    """Статистика {категорія: опис}, ALL — по всіх витратах користувача"""
+    rows = db.execute(_user_stats, {"user_id": user_id}).scalars().all()
+    if category is not None:
+        rows = [row for row in rows if row.category in (category, ALL)]
+
+    result = {}
+    for row in rows:
+        extremes = _extremes(db, user_id, row.category) if row.extremes_stale else (None, None)
+        result[row.category] = describe(row, *extremes)
+    return result
+
+
+def refresh_extremes(db, user_id):
+    """Перерахувати застарілі мінімуми й максимуми користувача; комітить викликач"""
+    stale = db.execute(
+        select(RunningStat.category).where(RunningStat.user_id == user_id, RunningStat.extremes_stale == True)
+    ).scalars().all()
+    for category in stale:
+        minimum, maximum = _extremes(db, user_id, category)
+        db.execute(
+            update(RunningStat)
+            .where(RunningStat.user_id == user_id, RunningStat.category == category)
+            .values(minimum=minimum, maximum=maximum, extremes_stale=False)
+        )
+    return len(stale)
+
+
+@jobs.register("statistics", triggers=("expenses",))
+def _refresh_extremes_job(db, user_id):
+    refresh_extremes(db, user_id)
+
+
+def rebuild(conn, user_id=None):
+    """Перерахувати статистику з таблиці витрат (усієї або одного користувача)"""
+    cleanup = delete(RunningStat)
+    condition = [Expense.user_id.is_not(None), Expense.amount.is_not(None)]
+    if user_id is not None:
+        cleanup = cleanup.where(RunningStat.user_id == user_id)
+        condition.append(Expense.user_id == user_id)
+    conn.execute(cleanup)
+
+    amount = fx.base_amount()
+    count = func.count(Expense.amount)
+    total = func.sum(amount)
+    aggregates = (
+        count,
+        func.avg(amount),
+        func.max(func.sum(amount * amount) - total * total / count, 0.0),
+        func.min(amount),
+        func.max(amount)
+    )
+    columns = ["user_id", "category", "count", "mean", "m2", "minimum", "maximum"]
+    category = func.coalesce(Expense.category, literal(""))
+    conn.execute(RunningStat.__table__.insert().from_select(
+        columns, select(Expense.user_id, category, *aggregates).where(*condition).group_by(Expense.user_id, category)
+    ))
+    conn.execute(RunningStat.__table__.insert().from_select(
+        columns, select(Expense.user_id, literal(ALL), *aggregates).where(*condition).group_by(Expense.user_id)
+    ))
+
+
+def ensure_built(bind):
+    """Побудувати статистику для бази, де витрати з'явились раніше за таблицю"""
+    with bind.begin() as conn:
+        has_stats = conn.execute(select(RunningStat.user_id).limit(1)).first() is not None
+        has_expenses = conn.execute(select(Expense.id).limit(1)).first() is not None
+        if has_expenses and not has_stats:
+            rebuild(conn)
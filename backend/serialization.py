@@ -0,0 +1,70 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson необов'язковий, без нього працює стандартний json
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _default(obj):
+    """Типи, які не серіалізуються напряму (для orjson і для json)"""
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if hasattr(obj, "__table__"):
+        # ORM-об'єкт: лише колонки таблиці, без зв'язків
+        return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+    if hasattr(obj, "_asdict"):
+        return obj._asdict()
+    if np is not None and isinstance(obj, np.generic):
+        return obj.item()
+    if np is not None and isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps(content):
+    """Серіалізація в JSON-байти (orjson, якщо встановлений)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON-відповідь застосунку: orjson з fallback на стандартний json
+
+    Нативно серіалізує datetime, float, numpy, pydantic-моделі та
+    ORM-об'єкти, тож ендпоінти можуть повертати її без jsonable_encoder.
+    """
+
+    def render(self, content):
+        return dumps(content)
+
+
+def rows_response(result, status_code=200, headers=None):
+    """JSON-відповідь напряму з Core-рядків, без ORM-об'єктів і pydantic-моделей
+
+    Ключі об'єктів беруться з назв колонок результату, тож форма відповіді
+    визначається самим select() (див. queries.*_rows).
+    """
+    keys = list(result.keys())
+    return FastJSONResponse([dict(zip(keys, row)) for row in result], status_code=status_code, headers=headers)
@@ -0,0 +1,299 @@
+import math
+import struct
+
+import numpy as np
+from sqlalchemy import select, update, bindparam, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import changes
+import fx
+import jobs
+from models import Expense, QuantileSketch, DailyRollup
+
+# Стиснення t-digest: не більше ~COMPRESSION / 2 центроїдів на ескіз
+COMPRESSION = 200
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90, 95, 99)
+
+_HEADER = struct.Struct("<BHdd")
+_FORMAT_VERSION = 1
+
+_stats = {"updates": 0, "invalidations": 0, "rebuilds": 0, "scans": 0}
+
+
+class TDigest:
+    """Ескіз квантилів (merging t-digest), що зливається з іншими ескізами
+
+    Центроїди групуються за функцією масштабу k1 = δ/2π · asin(2q − 1):
+    на хвостах центроїди дрібні (точні p1/p99), у центрі — великі.
+    """
+
+    __slots__ = ("compression", "means", "weights", "minimum", "maximum")
+
+    def __init__(self, compression=COMPRESSION, means=None, weights=None, minimum=math.inf, maximum=-math.inf):
+        self.compression = compression
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_values(cls, values, compression=COMPRESSION):
+        digest = cls(compression)
+        digest.update(values)
+        return digest
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return self
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+
+    def merge(self, other):
+        if not len(other.weights):
+            return self
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return self
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="mergesort")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        if len(means) <= self.compression / 2:
+            # Малі ескізи зберігаються точно (кожне значення — окремий центроїд)
+            self.means, self.weights = means, weights
+            return
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1))
+        groups = np.floor(k - k.min()).astype(np.int64)
+        _, groups = np.unique(groups, return_inverse=True)
+        merged_weights = np.bincount(groups, weights=weights)
+        self.means = np.bincount(groups, weights=means * weights) / merged_weights
+        self.weights = merged_weights
+
+    def quantiles(self, qs):
+        """Значення квантилів qs (0..1) інтерполяцією між центрами центроїдів"""
+        qs = np.asarray(qs, dtype=np.float64)
+        if not len(self.weights):
+            return np.full(qs.shape, np.nan)
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xs = np.concatenate([[0.0], centers, [total]])
+        ys = np.concatenate([[self.minimum], self.means, [self.maximum]])
+        return np.interp(qs * total, xs, ys)
+
+    def to_bytes(self):
+        header = _HEADER.pack(_FORMAT_VERSION, self.compression, self.minimum, self.maximum)
+        return header + self.means.astype("<f8").tobytes() + self.weights.astype("<f4").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, compression, minimum, maximum = _HEADER.unpack_from(data)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"Невідома версія ескізу: {version}")
+        size = (len(data) - _HEADER.size) // 12
+        means = np.frombuffer(data, dtype="<f8", count=size, offset=_HEADER.size)
+        weights = np.frombuffer(data, dtype="<f4", count=size, offset=_HEADER.size + size * 8)
+        return cls(compression, means.copy(), weights.astype(np.float64), minimum, maximum)
+
+
+_sketch_columns = (QuantileSketch.user_id, QuantileSketch.category, QuantileSketch.digest, QuantileSketch.dirty)
+
+_sketches_for_keys = select(*_sketch_columns).where(
+    tuple_(QuantileSketch.user_id, QuantileSketch.category).in_(bindparam("keys", expanding=True))
+)
+
+
+@changes.on_flush
+def _maintain_sketches(session, changeset):
+    inserted = []
+    stale = set()
+    for change in changeset:
+        if change.table != "expenses":
+            continue
+        if change.kind == "update" and not (fx.value_changed(change) or change.changed("category")
+                                            or change.changed("user_id")):
+            continue
+        if change.kind in ("update", "delete") and change.old("user_id") is not None:
+            # t-digest не вміє видаляти значення — ескіз перебудується з історії
+            stale.add((change.old("user_id"), change.old("category") or ""))
+        if change.kind in ("insert", "update"):
+            expense = change.obj
+            if expense.user_id is not None and expense.amount is not None:
+                inserted.append(expense)
+
+    added = {}
+    amounts = fx.to_base(session, [expense.amount for expense in inserted],
+                         [expense.currency for expense in inserted], [expense.date for expense in inserted])
+    for expense, amount in zip(inserted, amounts):
+        added.setdefault((expense.user_id, expense.category or ""), []).append(amount)
+
+    if stale:
+        session.execute(
+            update(QuantileSketch)
+            .where(tuple_(QuantileSketch.user_id, QuantileSketch.category).in_(sorted(stale)))
+            .values(dirty=True)
+        )
+        _stats["invalidations"] += len(stale)
+    if added:
+        existing = {
+            (row.user_id, row.category): row
+            for row in session.execute(_sketches_for_keys, {"keys": sorted(added)})
+        }
+        for key, values in sorted(added.items()):
+            row = existing.get(key)
+            if row is None or row.dirty:
+                # Ескізу ще немає або він застарів — його перебудує фонове завдання
+                if row is None:
+                    _save(session, key, None, dirty=True)
+                continue
+            digest = TDigest.from_bytes(row.digest).update(values)
+            _save(session, key, digest)
+            _stats["updates"] += 1
+
+
+def _save(session, key, digest, dirty=False):
+    user_id, category = key
+    values = {
+        "user_id": user_id,
+        "category": category,
+        "digest": digest.to_bytes() if digest is not None else b"",
+        "count": int(round(digest.count)) if digest is not None else 0,
+        "dirty": dirty
+    }
+    stmt = sqlite_insert(QuantileSketch).values(**values)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "category"],
+        set_={name: stmt.excluded[name] for name in ("digest", "count", "dirty")}
+    ))
+
+
+_category_amounts = select(fx.base_amount()).where(
+    Expense.user_id == bindparam("user_id"),
+    Expense.category == bindparam("category"),
+    Expense.amount.is_not(None)
+)
+
+_uncategorized_amounts = select(fx.base_amount()).where(
+    Expense.user_id == bindparam("user_id"),
+    (Expense.category.is_(None)) | (Expense.category == ""),
+    Expense.amount.is_not(None)
+)
+
+
+def _from_history(db, user_id, category):
+    stmt = _category_amounts if category else _uncategorized_amounts
+    return TDigest.from_values(db.execute(stmt, {"user_id": user_id, "category": category}).scalars().all())
+
+
+def rebuild(session, user_id, category):
+    """Побудувати ескіз (user_id, category) заново з таблиці витрат"""
+    digest = _from_history(session, user_id, category)
+    _save(session, (user_id, category), digest)
+    _stats["rebuilds"] += 1
+    return digest
+
+
+_user_sketches = select(*_sketch_columns).where(QuantileSketch.user_id == bindparam("user_id"))
+
+_user_categories = select(DailyRollup.category).where(
+    DailyRollup.user_id == bindparam("user_id")
+).distinct()
+
+
+def digests(db, user_id, category=None):
+    """Ескізи користувача {категорія: TDigest} і множина застарілих категорій
+
+    Лише читає: застарілий ескіз віддається як є, а перебудову ставить у чергу
+    фонове завдання "sketches". Без запущеного диспетчера (CLI, тести) застарілі
+    й відсутні ескізи рахуються з історії в пам'яті, без запису.
+    """
+    rows = {row.category: row for row in db.execute(_user_sketches, {"user_id": user_id})}
+    wanted = [category] if category is not None else sorted(
+        set(rows) | set(db.execute(_user_categories, {"user_id": user_id}).scalars())
+    )
+
+    queued = jobs.runner.started
+    result = {}
+    stale = set()
+    for name in wanted:
+        row = rows.get(name)
+        if row is not None and row.digest and not row.dirty:
+            result[name] = TDigest.from_bytes(row.digest)
+            continue
+        stale.add(name)
+        if queued and row is not None and row.digest:
+            result[name] = TDigest.from_bytes(row.digest)
+        else:
+            result[name] = _from_history(db, user_id, name)
+            _stats["scans"] += 1
+    if stale and queued:
+        jobs.runner.enqueue([("sketches", user_id)])
+    return {name: digest for name, digest in result.items() if len(digest.weights)}, stale
+
+
+def refresh(db, user_id):
+    """Перебудувати застарілі й відсутні ескізи користувача; комітить викликач"""
+    rows = {row.category: row for row in db.execute(_user_sketches, {"user_id": user_id})}
+    names = set(rows) | set(db.execute(_user_categories, {"user_id": user_id}).scalars())
+    stale = [name for name in sorted(names)
+             if name not in rows or rows[name].dirty or not rows[name].digest]
+    for name in stale:
+        rebuild(db, user_id, name)
+    return len(stale)
+
+
+@jobs.register("sketches", triggers=("expenses",))
+def _refresh_sketches(db, user_id):
+    # Застарілі після видалень ескізи перебудовуються у фоні, а не при читанні
+    refresh(db, user_id)
+
+
+def describe(digest, percentiles=DEFAULT_PERCENTILES):
+    values = digest.quantiles([p / 100 for p in percentiles])
+    return {
+        "count": int(round(digest.count)),
+        "min": round(digest.minimum, 2),
+        "max": round(digest.maximum, 2),
+        "percentiles": {f"p{p:g}": round(float(value), 2) for p, value in zip(percentiles, values)}
+    }
+
+
+def distribution(db, user_id, category=None, percentiles=DEFAULT_PERCENTILES):
+    """Перцентилі витрат з ескізів: загальні (злиття) і по категоріях"""
+    per_category, stale = digests(db, user_id, category)
+    merged = TDigest()
+    for digest in per_category.values():
+        merged.merge(digest)
+    result = describe(merged, percentiles) if len(merged.weights) else {"count": 0, "percentiles": {}}
+    result["category"] = category
+    result["stale"] = bool(stale)
+    if category is None:
+        result["categories"] = [
+            {"category": name, **describe(digest, percentiles)}
+            for name, digest in sorted(per_category.items())
+        ]
+    return result
+
+
+def rebuild_all(conn, user_id=None):
+    """Перебудувати всі ескізи (або ескізи одного користувача) з історії"""
+    stmt = select(Expense.user_id, Expense.category).where(Expense.user_id.is_not(None)).distinct()
+    if user_id is not None:
+        stmt = stmt.where(Expense.user_id == user_id)
+    keys = {(uid, category or "") for uid, category in conn.execute(stmt)}
+    for uid, category in sorted(keys):
+        rebuild(conn, uid, category)
+    return len(keys)
+
+
+def stats():
+    return dict(_stats, compression=COMPRESSION)
@@ -6,6 +6,9 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+# Диспетчер фонових завдань працює з головною базою data.db, а не з test.db
+os.environ["SPENDIO_JOB_RUNNER"] = "0"
+
 from main import app
 from database import get_db, Base
 from models import User, Category, Expense, Budget, Goal
@@ -38,6 +41,15 @@ def db_session():
         db.close()
         Base.metadata.drop_all(bind=engine)
 
+@pytest.fixture
+def session(tmp_path):
+    """Окрема тимчасова база для тестів модулів без застосунку"""
+    engine = create_engine(f"sqlite:///{tmp_path}/unit.db")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    yield db
+    db.close()
+
 @pytest.fixture(scope="function")
 def client():
     with TestClient(app) as c:
@@ -89,4 +101,17 @@ def authenticated_user(client, test_user_data, db_session):
         "token": token,
         "user_id": user_id,
         "headers": {"Authorization": f"Bearer {token}"}
-    } 
\ No newline at end of file
+    }
+
+
+@pytest.fixture
+def auth_headers(client, db_session):
+    """Користувач, створений напряму в БД, і заголовки з його токеном"""
+    from api.auth import create_access_token
+    
+    user = User(email="token.user@example.com", name="Token User", hashed_password="-", is_active=True)
+    db_session.add(user)
+    db_session.commit()
+    
+    token = create_access_token(data={"sub": user.email, "user_id": user.id})
+    return {"Authorization": f"Bearer {token}"}
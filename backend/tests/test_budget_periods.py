@@ -0,0 +1,120 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+
+import budget_periods
+import queries
+import rollups
+import versions
+from database import Base
+from models import Budget, Category, Expense
+
+
+def seed(db, count):
+    db.add(Category(id=1, name="Кафе", user_id=1))
+    db.add_all([
+        Expense(user_id=1, amount=40.0, category="Кафе", date="2024-01-10", description="старе вікно"),
+        Expense(user_id=1, amount=25.0, category="Кафе", date="2024-03-05", description="нове вікно"),
+        Expense(user_id=1, amount=5.0, category="Таксі", date="2024-03-06", description="інша категорія"),
+    ])
+    db.add_all(
+        Budget(name=f"Кафе {index}", amount=100.0, period="monthly", start_date="2024-01-01",
+               end_date="2024-01-31", category_id=1, carry_over=bool(index % 2), is_active=True, user_id=1)
+        for index in range(count)
+    )
+    db.add(Budget(name="Усе", amount=500.0, period="weekly", start_date="2024-02-26",
+                  end_date="2024-03-03", is_active=True, user_id=1))
+    db.commit()
+
+
+class TestWindow:
+
+    def test_window_math(self):
+        """Test period windows counted from the anchor, including month-end clamping"""
+        window = budget_periods.window
+        assert window("monthly", date(2024, 1, 1), date(2024, 3, 15)) == (date(2024, 3, 1), date(2024, 3, 31))
+        assert window("monthly", date(2024, 1, 31), date(2024, 2, 29)) == (date(2024, 2, 29), date(2024, 3, 30))
+        assert window("monthly", date(2024, 1, 31), date(2024, 3, 31)) == (date(2024, 3, 31), date(2024, 4, 29))
+        assert window("monthly", date(2024, 1, 15), date(2024, 3, 10)) == (date(2024, 2, 15), date(2024, 3, 14))
+        assert window("weekly", date(2024, 1, 1), date(2024, 1, 17)) == (date(2024, 1, 15), date(2024, 1, 21))
+        assert window("yearly", date(2023, 7, 1), date(2024, 3, 1)) == (date(2023, 7, 1), date(2024, 6, 30))
+
+
+class TestRollover:
+
+    def test_rollover_with_carry_over(self, session):
+        """Test that expired budgets move to the current window and carry unspent amounts"""
+        seed(session, 2)
+        before = versions.current(session, 1, "budgets")
+        assert budget_periods.rollover(session, date(2024, 3, 10)) == 3
+        session.commit()
+        assert versions.current(session, 1, "budgets") != before
+
+        budgets = {budget.name: budget for budget in session.scalars(select(Budget))}
+        plain, carried, weekly = budgets["Кафе 0"], budgets["Кафе 1"], budgets["Усе"]
+        assert (carried.start_date, carried.end_date, carried.anchor_date) == ("2024-03-01", "2024-03-31", "2024-01-01")
+        # Залишок рахується за минулим вікном (100 - 40), витрачене — за новим
+        assert carried.carried_over == pytest.approx(60.0) and plain.carried_over == 0.0
+        assert budget_periods.limit(carried) == pytest.approx(160.0)
+        assert (weekly.start_date, weekly.end_date) == ("2024-03-04", "2024-03-10")
+        assert len({plain.change_seq, carried.change_seq, weekly.change_seq}) == 3
+
+        rows = {row.name: row for row in session.execute(queries.budget_rows(1))}
+        assert rows["Кафе 1"].spent == pytest.approx(25.0) and rows["Кафе 1"].remaining == pytest.approx(135.0)
+        assert rows["Усе"].spent == pytest.approx(30.0)
+        assert budget_periods.rollover(session, date(2024, 3, 10)) == 0
+
+    def test_constant_query_count(self, tmp_path):
+        """Test that the number of statements does not depend on the number of expired budgets"""
+        counts = []
+        for size in (3, 200):
+            engine = create_engine(f"sqlite:///{tmp_path}/size{size}.db")
+            Base.metadata.create_all(bind=engine)
+            db = sessionmaker(bind=engine)()
+            seed(db, size)
+            statements = []
+            event.listen(engine, "before_cursor_execute", lambda *args: statements.append(1))
+            assert budget_periods.rollover(db, date(2024, 3, 10)) == size + 1
+            db.commit()
+            db.close()
+            engine.dispose()
+            counts.append(len(statements))
+        assert counts[0] == counts[1]
+
+
+class TestBudgetPeriodsApi:
+
+    def test_budget_status_current_window(self, client, auth_headers):
+        """Test that a lapsed budget is reported for the window containing today"""
+        today = date.today()
+        start = today - timedelta(days=20)
+        created = client.post("/api/budgets/", json={
+            "name": "Тиждень", "amount": 70.0, "period": "weekly", "start_date": start.isoformat(),
+            "carry_over": True
+        }, headers=auth_headers).json()
+        assert created["end_date"] == (start + timedelta(days=6)).isoformat()
+        client.post("/api/expenses/", json={
+            "amount": 30.0, "description": "обід", "category": "Їжа", "date": today.isoformat()
+        }, headers=auth_headers)
+
+        status = client.get("/api/analytics/budget-status", headers=auth_headers).json()[0]
+        window_start = start + timedelta(days=14)
+        assert (status["start_date"], status["end_date"]) == (
+            window_start.isoformat(), (window_start + timedelta(days=6)).isoformat()
+        )
+        assert status["spent"] == 30.0
+        assert status["carried_over"] == 70.0
+        assert status["remaining"] == 110.0
+
+        # Список бюджетів віддає те саме витрачене і оновлюється після нових витрат
+        listed = client.get("/api/budgets/", headers=auth_headers)
+        budget = listed.json()[0]
+        assert budget["carry_over"] is True and budget["start_date"] == window_start.isoformat()
+        assert (budget["spent"], budget["remaining"]) == (30.0, 110.0)
+        client.post("/api/expenses/", json={
+            "amount": 10.0, "description": "кава", "category": "Їжа", "date": today.isoformat()
+        }, headers=auth_headers)
+        refreshed = client.get("/api/budgets/", headers={**auth_headers, "If-None-Match": listed.headers["etag"]})
+        assert refreshed.status_code == 200 and refreshed.json()[0]["spent"] == 40.0
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+import pytest
+
+import categorizer
+
+SAMPLES = {
+    "Продукти": ["АТБ продукти", "Сільпо покупки", "хліб і молоко", "овочі на ринку"],
+    "Транспорт": ["таксі Uklon", "метро картка", "бензин WOG", "Bolt поїздка"],
+    "Кафе": ["кава Aroma", "обід у кафе", "піца Челентано", "вечеря в ресторані"],
+}
+
+
+def labelled(repeat=4):
+    return [(f"{text} {i}", category) for i in range(repeat)
+            for category, texts in SAMPLES.items() for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def model_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(categorizer, "MODEL_DIR", str(tmp_path))
+    return tmp_path
+
+
+class TestFeatures:
+
+    @pytest.mark.parametrize("text", ["таксі додому", "a", "", "Кава  з   КРУАСАНОМ!", "ab"])
+    def test_matches_hashing_vectorizer(self, text):
+        """Test that the fast single-description path reproduces sklearn's features"""
+        indices, values = categorizer.features(text)
+        dense = np.zeros(categorizer.N_FEATURES)
+        dense[indices] = values
+
+        assert np.allclose(dense, categorizer.vectorize([text]).toarray()[0])
+
+    def test_probabilities_match_predict_proba(self):
+        """Test that manual scoring equals predict_proba of the stored model"""
+        descriptions, categories = zip(*labelled())
+        categorizer.save(categorizer.fit(descriptions, categories))
+        model = categorizer.load()
+
+        assert isinstance(model.coef_, np.memmap)
+        for text in ("таксі в аеропорт", "кава"):
+            expected = model.predict_proba(categorizer.vectorize([text]))[0]
+            assert np.allclose(categorizer.probabilities(model, text), expected)
+
+    def test_reload_after_retrain(self, model_dir):
+        """Test that a newer model file replaces the cached one"""
+        descriptions, categories = zip(*labelled())
+        categorizer.save(categorizer.fit(descriptions, categories))
+        first = categorizer.load()
+        categorizer.save(categorizer.fit(descriptions[:24], categories[:24]))
+
+        assert categorizer.load() is not first
+        assert not [name for name in os.listdir(model_dir) if name.endswith(".tmp")]
+
+
+class TestRetraining:
+
+    def add(self, db, items, user_id=1):
+        from models import Expense
+        db.add_all(Expense(user_id=user_id, amount=1.0, description=text, category=category, date="2024-03-01")
+                   for text, category in items)
+        db.commit()
+
+    def test_retrain_only_when_due(self, db_session, monkeypatch):
+        """Test that background retraining waits for enough new labelled rows or an old model"""
+        monkeypatch.setattr(categorizer, "RETRAIN_NEW_ROWS", 10)
+        items = labelled(3)
+        self.add(db_session, items[:categorizer.MIN_USER_SAMPLES - 1])
+        assert not categorizer.due(db_session, 1)
+        self.add(db_session, items[categorizer.MIN_USER_SAMPLES - 1:])
+        assert categorizer.due(db_session, 1)
+        categorizer.train(db_session, 1)
+        assert not categorizer.due(db_session, 1)
+
+        self.add(db_session, labelled(1)[:9])
+        assert not categorizer.due(db_session, 1)
+        assert categorizer.due(db_session, 1, now=categorizer.time.time() + categorizer.RETRAIN_INTERVAL_SECONDS)
+        self.add(db_session, labelled(1)[:1])
+        assert categorizer.due(db_session, 1)
+
+
+class TestCategorizationEndpoints:
+
+    def test_suggest_without_model(self, client, auth_headers):
+        """Test the fallback when no model is trained yet"""
+        data = client.get("/api/expenses/suggest-category?description=кава", headers=auth_headers).json()
+
+        assert data["category"] == categorizer.FALLBACK_CATEGORY
+        assert data["model"] is None
+        assert set(data) == {"category", "confidence", "alternatives", "model", "elapsed_ms"}
+
+    def test_bulk_import_and_suggest(self, client, auth_headers, db_session):
+        """Test training from imported expenses and batch categorization of a new import"""
+        items = [{"amount": 10.0, "description": text, "category": category, "date": "2024-03-01"}
+                 for text, category in labelled()]
+        response = client.post("/api/expenses/bulk", json=items, headers=auth_headers)
+        assert response.status_code == 201
+        assert response.json()["created"] == len(items)
+
+        user_id = client.get("/api/auth/me", headers=auth_headers).json()["id"]
+        assert categorizer.train(db_session, user_id) == len(items)
+
+        data = client.get("/api/expenses/suggest-category?description=таксі на вокзал", headers=auth_headers).json()
+        assert data["category"] == "Транспорт"
+        assert data["model"] == "user"
+        assert len(data["alternatives"]) == 2
+
+        response = client.post("/api/expenses/bulk", json=[
+            {"amount": 5.0, "description": "кава з собою", "date": "2024-03-02"},
+            {"amount": 7.0, "description": "АТБ хліб", "category": "Продукти", "date": "2024-03-02"},
+        ], headers=auth_headers)
+        assert response.json()["auto_categorized"] == 1
+        expense_id = response.json()["ids"][0]
+        assert client.get(f"/api/expenses/{expense_id}", headers=auth_headers).json()["category"] == "Кафе"
+
+    def test_bulk_limit(self, client, auth_headers, monkeypatch):
+        """Test that oversized imports are rejected"""
+        import api.expenses
+        monkeypatch.setattr(api.expenses, "MAX_BULK_EXPENSES", 1)
+        items = [{"amount": 1.0, "description": "x", "category": "Інше", "date": "2024-03-01"}] * 2
+
+        assert client.post("/api/expenses/bulk", json=items, headers=auth_headers).status_code == 413
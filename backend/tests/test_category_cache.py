@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import event
+
+import category_cache
+from models import Category
+
+
+@pytest.fixture
+def session(session):
+    session.add_all([
+        Category(name="Продукти", is_default=True),
+        Category(name="Транспорт", is_default=True),
+        Category(name="Продукти", user_id=1, is_default=False),
+        Category(name="Хобі", user_id=2, is_default=False),
+    ])
+    session.commit()
+    return session
+
+
+def statements(db):
+    executed = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda conn, cursor, sql, *args: executed.append(sql))
+    return executed
+
+
+class TestCategoryCache:
+
+    def test_lookups(self, session):
+        """Test visibility, ownership and name resolution with own categories shadowing defaults"""
+        first, second = category_cache.get(session, 1), category_cache.get(session, 2)
+        own = first.own_id("Продукти")
+        assert own is not None and first.resolve("Продукти") == own
+        assert second.resolve("Продукти") == first.defaults.by_name["Продукти"]
+        assert first.resolve("Хобі") is None
+
+        hobby = second.own_id("Хобі")
+        assert second.owned(hobby) is not None
+        assert first.visible(hobby) is None
+        default_id = first.resolve("Транспорт")
+        assert first.visible(default_id) is not None and first.owned(default_id) is None
+
+        assert [row.name for row in first.rows()] == ["Продукти", "Транспорт", "Продукти"]
+        assert [row.name for row in first.rows(include_default=False)] == ["Продукти"]
+        # Знімок стандартних категорій спільний для всіх користувачів
+        assert first.defaults is second.defaults
+
+    def test_hits_skip_category_table(self, session):
+        """Test that a cached lookup only reads the collection version"""
+        category_cache.get(session, 1)
+        executed = statements(session)
+        category_cache.get(session, 1).resolve("Продукти")
+        assert len(executed) == 1 and "collection_versions" in executed[0]
+
+    def test_write_invalidates(self, session):
+        """Test that a committed category write is visible on the next lookup"""
+        assert category_cache.get(session, 1).own_id("Кафе") is None
+        session.add(Category(name="Кафе", user_id=1, is_default=False))
+        session.commit()
+        assert category_cache.get(session, 1).own_id("Кафе") is not None
+
+        # Незакомічений запис не потрапляє в кеш процесу
+        session.add(Category(name="Кіно", user_id=1, is_default=False))
+        session.flush()
+        assert category_cache.get(session, 1).own_id("Кіно") is not None
+        session.rollback()
+        assert category_cache.get(session, 1).own_id("Кіно") is None
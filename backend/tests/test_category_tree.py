@@ -0,0 +1,125 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+import category_tree
+from models import Category, CategoryClosure, Expense
+
+
+def closure(db):
+    return set(db.execute(
+        select(CategoryClosure.ancestor_id, CategoryClosure.descendant_id, CategoryClosure.depth)
+    ).all())
+
+
+def add_category(db, name, parent=None, user_id=1):
+    category = Category(name=name, user_id=user_id, is_default=False, parent_id=parent.id if parent else None)
+    db.add(category)
+    db.commit()
+    return category
+
+
+class TestClosure:
+
+    def test_create_move_delete(self, session):
+        """Test that closure rows follow creates, subtree moves and deletes"""
+        food = add_category(session, "Їжа")
+        cafe = add_category(session, "Кафе", food)
+        coffee = add_category(session, "Кава", cafe)
+        home = add_category(session, "Дім")
+        assert (food.id, coffee.id, 2) in closure(session)
+
+        cafe.parent_id = home.id
+        session.commit()
+        rows = closure(session)
+        assert (home.id, coffee.id, 2) in rows and (home.id, cafe.id, 1) in rows
+        assert not any(ancestor == food.id and descendant != food.id for ancestor, descendant, _ in rows)
+
+        # Перенесення всередину власного піддерева
+        home.parent_id = coffee.id
+        with pytest.raises(ValueError):
+            session.commit()
+        session.rollback()
+
+        session.delete(coffee)
+        session.commit()
+        assert not any(coffee.id in (ancestor, descendant) for ancestor, descendant, _ in closure(session))
+
+    def test_rebuild_matches_incremental(self, session):
+        """Test that a rebuild from parent_id reproduces incrementally maintained rows"""
+        root = add_category(session, "Корінь")
+        parents = [root]
+        for level in range(4):
+            parents.append(add_category(session, f"Рівень {level}", parents[-1]))
+        add_category(session, "Сусід", parents[2])
+        # Батько й дитина в одному flush
+        batch = Category(name="Пакет", user_id=1, is_default=False)
+        session.add(batch)
+        session.flush()
+        session.add(Category(name="Пакет дитина", user_id=1, is_default=False, parent_id=batch.id))
+        session.commit()
+        incremental = closure(session)
+
+        with session.get_bind().begin() as conn:
+            category_tree.rebuild(conn)
+        assert closure(session) == incremental
+
+
+class TestSubtreeTotals:
+
+    def test_totals_roll_up(self, session):
+        """Test that spending in descendants is counted in every ancestor"""
+        food = add_category(session, "Їжа")
+        cafe = add_category(session, "Кафе", food)
+        add_category(session, "Кава", cafe)
+        add_category(session, "Дім")
+        session.add_all([
+            Expense(user_id=1, amount=amount, category=category, date="2024-05-01", description="x")
+            for amount, category in [(10.0, "Їжа"), (20.0, "Кафе"), (30.0, "Кава"), (40.0, "Дім"), (5.0, "Інше")]
+        ])
+        session.commit()
+
+        top = {row["category"]: row["total"] for row in category_tree.subtree_totals(session, 1, "2024-01-01")}
+        # "Інше" не має категорії — окремий рядок без категорії
+        assert top == {"Їжа": 60.0, "Дім": 40.0, category_tree.UNCATEGORIZED: 5.0}
+
+        children = category_tree.subtree_totals(session, 1, "2024-01-01", food.id)
+        assert {(row["category"], row["total"], row["direct"]) for row in children} == {
+            ("Їжа", 10.0, True), ("Кафе", 50.0, False)
+        }
+
+
+class TestCategoryTreeApi:
+
+    def test_hierarchy_endpoints(self, client, auth_headers):
+        """Test parent validation and the rollup mode of expenses-by-category"""
+        parent = client.post("/api/categories/", json={"name": "Транспорт"}, headers=auth_headers).json()
+        child = client.post(
+            "/api/categories/", json={"name": "Таксі", "parent_id": parent["id"]}, headers=auth_headers
+        ).json()
+        assert child["parent_id"] == parent["id"]
+
+        cycle = client.put(
+            f"/api/categories/{parent['id']}", json={"name": "Транспорт", "parent_id": child["id"]},
+            headers=auth_headers
+        )
+        assert cycle.status_code == 400
+        missing = client.post("/api/categories/", json={"name": "X", "parent_id": 99999}, headers=auth_headers)
+        assert missing.status_code == 404
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        for amount, category in [(100.0, "Таксі"), (50.0, "Транспорт")]:
+            client.post("/api/expenses/", json={
+                "amount": amount, "description": "поїздка", "category": category, "date": today
+            }, headers=auth_headers)
+
+        flat = client.get("/api/analytics/expenses-by-category", headers=auth_headers).json()
+        assert {row["category"]: row["total"] for row in flat} == {"Таксі": 100.0, "Транспорт": 50.0}
+        rolled = client.get("/api/analytics/expenses-by-category?rollup=true", headers=auth_headers).json()
+        assert [(row["category"], row["total"], row["percentage"]) for row in rolled] == [("Транспорт", 150.0, 100.0)]
+
+        # Видалення батька піднімає дітей на його рівень
+        client.delete(f"/api/categories/{parent['id']}", headers=auth_headers)
+        rolled = client.get("/api/analytics/expenses-by-category?rollup=true", headers=auth_headers).json()
+        assert {row["category"]: row["total"] for row in rolled} == {"Таксі": 100.0, category_tree.UNCATEGORIZED: 50.0}
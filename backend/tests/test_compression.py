@@ -0,0 +1,122 @@
+import gzip
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+import compression
+from compression import CompressionMiddleware, negotiate, available_codecs
+
+BIG = [{"id": i, "description": "Покупка в АТБ", "amount": 100.5} for i in range(500)]
+
+
+@pytest.fixture
+def compressed_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=512)
+
+    @app.get("/big")
+    def big():
+        return BIG
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/tagged")
+    def tagged():
+        return JSONResponse(BIG, headers={"ETag": '"v1"'})
+
+    @app.get("/stream")
+    def stream():
+        def chunks():
+            for i in range(50):
+                yield (f'{{"chunk": {i}, "padding": "' + "x" * 100 + '"}\n').encode()
+        return StreamingResponse(chunks(), media_type="application/json")
+
+    with TestClient(app) as client:
+        yield client
+
+
+class TestNegotiation:
+
+    def test_prefers_highest_quality(self):
+        """Test that q-values decide between supported encodings"""
+        codecs = [compression.GzipCodec()]
+
+        assert negotiate("gzip;q=0.5, identity", codecs).name == "gzip"
+        assert negotiate("gzip;q=0", codecs) is None
+        assert negotiate("", codecs) is None
+        assert negotiate("*", codecs).name == "gzip"
+
+    def test_server_order_breaks_ties(self):
+        """Test that the strongest available codec wins on equal quality"""
+        codecs = available_codecs()
+
+        assert negotiate("gzip, br, zstd", codecs).name == codecs[0].name
+
+
+class TestCompressionMiddleware:
+
+    def test_large_json_is_gzipped(self, compressed_client):
+        """Test gzip for a response above the threshold"""
+        response = compressed_client.get("/big", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json() == BIG
+        assert int(response.headers["content-length"]) < len(response.content)
+
+    def test_small_response_is_not_compressed(self, compressed_client):
+        """Test that responses below minimum_size pass through"""
+        response = compressed_client.get("/small", headers={"Accept-Encoding": "gzip"})
+
+        assert "content-encoding" not in response.headers
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json() == {"ok": True}
+
+    def test_vary_without_compression(self, compressed_client):
+        """Test that identity and HEAD responses still vary on Accept-Encoding"""
+        identity = compressed_client.get("/big", headers={"Accept-Encoding": "identity"})
+        head = compressed_client.head("/big", headers={"Accept-Encoding": "gzip"})
+
+        assert "content-encoding" not in identity.headers
+        assert identity.json() == BIG
+        assert "Accept-Encoding" in identity.headers["vary"]
+        assert "Accept-Encoding" in head.headers["vary"]
+
+    def test_streaming_response(self, compressed_client):
+        """Test chunked compression of a StreamingResponse"""
+        response = compressed_client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert response.text.count("chunk") == 50
+
+    def test_etag_is_weakened_and_cached(self, compressed_client):
+        """Test that ETag'd bodies are compressed once per codec"""
+        hits_before = compression.stats()["etag_cache_hits"]
+        first = compressed_client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+        second = compressed_client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+
+        assert first.headers["etag"] == 'W/"v1"'
+        assert first.content == second.content
+        assert compression.stats()["etag_cache_hits"] == hits_before + 1
+
+    @pytest.mark.parametrize("encoding", ["br", "zstd"])
+    def test_optional_codecs(self, compressed_client, encoding):
+        """Test brotli and zstd when their packages are installed"""
+        if encoding not in [codec.name for codec in available_codecs()]:
+            pytest.skip(f"{encoding} codec is not installed")
+
+        response = compressed_client.get("/big", headers={"Accept-Encoding": encoding})
+
+        assert response.headers["content-encoding"] == encoding
+        assert response.json() == BIG
+
+    def test_gzip_stream_is_valid(self):
+        """Test that streamed gzip chunks decode as one gzip member"""
+        compress, finish = compression.GzipCodec().stream()
+        data = compress(b"abc" * 100) + compress(b"def" * 100) + finish()
+
+        assert gzip.decompress(data) == b"abc" * 100 + b"def" * 100
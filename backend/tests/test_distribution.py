@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+import jobs
+import sketches
+from models import Job, QuantileSketch
+from sketches import TDigest
+
+
+def add_expense(client, headers, amount, category, day="2024-05-01"):
+    return client.post(
+        "/api/expenses/",
+        json={"amount": amount, "description": "x", "category": category, "date": day},
+        headers=headers
+    ).json()
+
+
+class TestTDigest:
+
+    def test_small_digest_is_exact(self):
+        """Test that a digest below the compression limit keeps every value"""
+        digest = TDigest.from_values(np.arange(1, 11, dtype=float))
+
+        assert len(digest.weights) == 10
+        assert digest.quantiles([0.5])[0] == pytest.approx(5.5)
+        assert digest.quantiles([0.0, 1.0]).tolist() == [1.0, 10.0]
+
+    def test_accuracy_and_merge(self):
+        """Test percentile accuracy on a skewed sample and after merging parts"""
+        values = np.random.default_rng(7).gamma(2.0, 150.0, 50000)
+        whole = TDigest.from_values(values)
+        merged = TDigest()
+        for part in np.array_split(values, 10):
+            merged.merge(TDigest.from_values(part))
+
+        expected = np.percentile(values, [50, 90, 99])
+        for digest in (whole, merged):
+            assert len(digest.weights) <= digest.compression
+            assert np.allclose(digest.quantiles([0.5, 0.9, 0.99]), expected, rtol=0.02)
+
+    def test_serialization_roundtrip(self):
+        """Test the compact binary form"""
+        digest = TDigest.from_values(np.random.default_rng(1).normal(100, 10, 5000))
+        data = digest.to_bytes()
+        restored = TDigest.from_bytes(data)
+
+        assert len(data) < 2000
+        assert restored.count == pytest.approx(5000)
+        assert np.allclose(restored.quantiles([0.1, 0.5, 0.9]), digest.quantiles([0.1, 0.5, 0.9]))
+
+
+class TestDistribution:
+
+    def test_percentiles_per_category(self, client, auth_headers):
+        """Test median and p90 per category and for all expenses"""
+        for amount in range(1, 11):
+            add_expense(client, auth_headers, float(amount), "food")
+        add_expense(client, auth_headers, 500.0, "rent")
+
+        data = client.get("/api/analytics/distribution?percentiles=50,90", headers=auth_headers).json()
+
+        assert data["count"] == 11
+        assert data["max"] == 500.0
+        food = next(item for item in data["categories"] if item["category"] == "food")
+        assert food["count"] == 10
+        assert food["percentiles"] == {"p50": 5.5, "p90": 9.5}
+
+    def test_updates_after_writes(self, client, auth_headers):
+        """Test that inserts, updates and deletes are reflected in the sketch"""
+        first = add_expense(client, auth_headers, 10.0, "food")
+        client.get("/api/analytics/distribution?category=food", headers=auth_headers)
+        add_expense(client, auth_headers, 30.0, "food")
+
+        data = client.get("/api/analytics/distribution?category=food&percentiles=50", headers=auth_headers).json()
+        assert data["count"] == 2
+        assert data["percentiles"]["p50"] == 20.0
+
+        client.delete(f"/api/expenses/{first['id']}", headers=auth_headers)
+        data = client.get("/api/analytics/distribution?category=food&percentiles=50", headers=auth_headers).json()
+        assert data["count"] == 1
+        assert data["percentiles"]["p50"] == 30.0
+
+    def test_read_does_not_rebuild(self, client, auth_headers, db_session, monkeypatch):
+        """Test that a stale sketch is served from history without writes and rebuilt by the job"""
+        first = add_expense(client, auth_headers, 10.0, "food")
+        add_expense(client, auth_headers, 30.0, "food")
+        user_id = first["user_id"]
+        assert sketches.refresh(db_session, user_id) == 1
+        db_session.commit()
+        client.delete(f"/api/expenses/{first['id']}", headers=auth_headers)
+        dirty = select(QuantileSketch.dirty).where(QuantileSketch.user_id == user_id, QuantileSketch.category == "food")
+
+        data = client.get("/api/analytics/distribution?category=food", headers=auth_headers).json()
+        assert (data["count"], data["stale"]) == (1, True)
+        assert db_session.scalar(dirty) is True
+
+        # З диспетчером читання віддає останній ескіз і лише ставить перебудову в чергу
+        monkeypatch.setattr(jobs, "runner", jobs.JobRunner(db_session.get_bind()))
+        monkeypatch.setattr(jobs.JobRunner, "started", True)
+        per_category, stale = sketches.digests(db_session, user_id, "food")
+        assert per_category["food"].count == 2 and stale == {"food"}
+        assert db_session.scalars(select(Job.kind).where(Job.user_id == user_id)).all() == ["sketches"]
+
+        assert sketches.refresh(db_session, user_id) == 1
+        db_session.commit()
+        assert db_session.scalar(dirty) is False
+        assert sketches.digests(db_session, user_id, "food")[1] == set()
+
+    def test_invalid_percentiles(self, client, auth_headers):
+        """Test that percentiles outside 0..100 are rejected"""
+        response = client.get("/api/analytics/distribution?percentiles=50,150", headers=auth_headers)
+
+        assert response.status_code == 400
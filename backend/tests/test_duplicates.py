@@ -0,0 +1,105 @@
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+import duplicates
+import fx
+from database import Base
+from models import Expense
+
+
+def expense(description="АТБ продукти", amount=120.5, day="2024-04-01", category="Продукти"):
+    return {"amount": amount, "description": description, "category": category, "date": day}
+
+
+class TestFingerprint:
+
+    def test_normalization(self):
+        """Test that case, punctuation and spacing do not change the fingerprint"""
+        assert duplicates.fingerprint("2024-04-01", 120.5, "АТБ,  продукти!") == \
+            duplicates.fingerprint("2024-04-01T10:00:00", 120.50, "атб продукти")
+        assert duplicates.fingerprint("2024-04-01", 120.5, "АТБ") != duplicates.fingerprint("2024-04-02", 120.5, "АТБ")
+        assert duplicates.fingerprint(None, 1.0, "x") is None
+
+    def test_currency_in_key(self):
+        """Test that the same amount in another currency is not a duplicate, and NULL means the base currency"""
+        base = duplicates.fingerprint("2024-04-01", 100.0, "Кава")
+        assert duplicates.fingerprint("2024-04-01", 100.0, "Кава", "USD") != base
+        assert duplicates.fingerprint("2024-04-01", 100.0, "Кава", fx.BASE_CURRENCY) == base
+
+    def test_find_in_history_and_batch(self, tmp_path):
+        """Test one-query lookup against stored rows and repeats inside the batch"""
+        engine = create_engine(f"sqlite:///{tmp_path}/dups.db")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        stored = Expense(user_id=1, **expense())
+        db.add(stored)
+        db.commit()
+
+        found = duplicates.find(db, 1, [
+            ("2024-04-01", 120.5, "атб продукти"),
+            ("2024-04-02", 10.0, "кава"),
+            ("2024-04-02", 10.0, "Кава"),
+        ])
+        assert found == [stored.id, None, -2]
+        assert duplicates.find(db, 2, [("2024-04-01", 120.5, "атб продукти")]) == [None]
+        db.close()
+
+
+class TestDuplicatePolicies:
+
+    def test_single_insert_policies(self, client, auth_headers):
+        """Test flag (default), reject and merge for a single expense"""
+        first = client.post("/api/expenses/", json=expense(), headers=auth_headers).json()
+        assert first["duplicate_of"] is None
+
+        flagged = client.post("/api/expenses/", json=expense("атб, ПРОДУКТИ"), headers=auth_headers)
+        assert flagged.status_code == 201
+        assert flagged.json()["duplicate_of"] == first["id"]
+
+        rejected = client.post("/api/expenses/?on_duplicate=reject", json=expense(), headers=auth_headers)
+        assert rejected.status_code == 409
+        assert rejected.json()["detail"]["duplicate_of"] == first["id"]
+
+        merged = client.post("/api/expenses/?on_duplicate=merge", json=expense(), headers=auth_headers)
+        assert merged.status_code == 200
+        assert merged.json()["id"] == first["id"]
+        assert len(client.get("/api/expenses/", headers=auth_headers).json()) == 2
+
+    def test_bulk_policies(self, client, auth_headers):
+        """Test overlapping statement imports"""
+        january = [expense(day="2024-01-30"), expense("Таксі", 80.0, "2024-01-31", "Транспорт")]
+        first = client.post("/api/expenses/bulk", json=january, headers=auth_headers).json()
+
+        overlap = january + [expense("Кава", 45.0, "2024-02-01", "Кафе")] * 2
+        rejected = client.post("/api/expenses/bulk?on_duplicate=reject", json=overlap, headers=auth_headers)
+        assert rejected.status_code == 409
+        assert rejected.json()["detail"]["duplicates"] == [0, 1, 3]
+
+        merged = client.post("/api/expenses/bulk?on_duplicate=merge", json=overlap, headers=auth_headers).json()
+        assert merged["created"] == 1
+        assert merged["ids"][:2] == first["ids"]
+        assert merged["ids"][3] == merged["ids"][2]
+
+        flagged = client.post("/api/expenses/bulk", json=[expense("Кава", 45.0, "2024-02-01", "Кафе")],
+                              headers=auth_headers).json()
+        assert flagged["duplicates"] == 1
+        stored = client.get(f"/api/expenses/{flagged['ids'][0]}", headers=auth_headers).json()
+        assert stored["duplicate_of"] == merged["ids"][2]
+
+
+class TestDedupCommand:
+
+    def test_groups_and_backfill(self, tmp_path):
+        """Test backfilling fingerprints for old rows and grouping duplicates"""
+        engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(Expense.__table__.insert(), [
+                {"user_id": 1, **expense()}, {"user_id": 1, **expense("атб продукти")},
+                {"user_id": 1, **expense("Кава", 45.0)}, {"user_id": 2, **expense()},
+            ])
+
+        assert duplicates.backfill(engine, batch=2) == 4
+        with engine.connect() as conn:
+            assert duplicates.duplicate_groups(conn) == [(1, 1, [2])]
+            assert conn.execute(select(Expense.id).where(Expense.fingerprint.is_(None))).all() == []
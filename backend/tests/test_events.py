@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import pytest
+
+import events
+from api import events as events_api
+from models import Expense
+
+
+@pytest.fixture
+def local_broker(monkeypatch):
+    broker = events.LocalBroker()
+    monkeypatch.setattr(events, "broker", broker)
+    return broker
+
+
+class TestBrokers:
+
+    def test_local_publish_from_other_thread(self, local_broker):
+        """Test delivery to an asyncio subscriber from a worker thread"""
+        async def scenario():
+            subscription = local_broker.subscribe(7)
+            thread = threading.Thread(target=local_broker.publish, args=(7, {"type": "change", "collections": ["goals"]}))
+            thread.start()
+            event = await subscription.get(1)
+            other = local_broker.subscribe(8)
+            assert await other.get(0.05) is None
+            subscription.close()
+            other.close()
+            return event
+
+        assert asyncio.run(scenario())["collections"] == ["goals"]
+        assert local_broker.subscriber_count == 0
+
+    def test_commit_publishes_changed_collections(self, local_broker, db_session):
+        """Test that committed expense writes notify the owner"""
+        async def scenario():
+            subscription = local_broker.subscribe(42)
+            db_session.add(Expense(amount=5.0, description="x", category="food", date="2024-01-02", user_id=42))
+            db_session.commit()
+            event = await subscription.get(1)
+            subscription.close()
+            return event
+
+        assert asyncio.run(scenario()) == {"type": "change", "collections": ["expenses"]}
+
+    def test_sqlite_broker_is_shared_between_workers(self, tmp_path):
+        """Test that a subscriber on one broker sees events published by another"""
+        url = f"sqlite:///{tmp_path}/events.db"
+        publisher = events.SQLiteBroker(url, poll_interval=0.01)
+        listener = events.SQLiteBroker(url, poll_interval=0.01)
+
+        async def scenario():
+            subscription = listener.subscribe(3)
+            await asyncio.sleep(0.1)
+            publisher.publish(3, {"type": "change", "collections": ["budgets"]})
+            event = await subscription.get(2)
+            subscription.close()
+            return event
+
+        assert asyncio.run(scenario())["collections"] == ["budgets"]
+
+    def test_merge_and_format(self):
+        """Test that queued events collapse into one SSE message"""
+        merged = events.merge([
+            {"type": "change", "collections": ["expenses"]},
+            {"type": "change", "collections": ["budgets", "expenses"]}
+        ])
+
+        assert merged["collections"] == ["budgets", "expenses"]
+        assert events.format_event(merged).startswith(b"event: change\ndata: {")
+
+
+class TestEventStream:
+
+    def test_requires_token(self, client):
+        """Test that the stream is not available anonymously"""
+        assert client.get("/api/events/").status_code == 401
+
+    def test_query_token_only_for_stream(self, client, auth_headers):
+        """Test that other routes do not accept a query-string token"""
+        token = auth_headers["Authorization"].split()[1]
+
+        assert client.get(f"/api/auth/me?token={token}").status_code == 401
+
+    def test_stream_delivers_change(self, client, auth_headers, local_broker, monkeypatch):
+        """Test an SSE stream with a query-string token"""
+        monkeypatch.setattr(events_api, "MAX_STREAM_SECONDS", 1)
+        token = auth_headers["Authorization"].split()[1]
+        user_id = client.get("/api/auth/me", headers=auth_headers).json()["id"]
+
+        # TestClient віддає тіло після завершення потоку, тож подія публікується з таймера
+        timer = threading.Timer(0.3, local_broker.publish, (user_id, {"type": "change", "collections": ["expenses"]}))
+        timer.start()
+        response = client.get(f"/api/events/?token={token}")
+        timer.join()
+        lines = [line for line in response.text.split("\n") if line]
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert lines[0].startswith("retry:")
+        assert lines[1] == "event: change"
+        assert lines[2] == 'data: {"type":"change","collections":["expenses"]}'
+        assert local_broker.subscriber_count == 0
@@ -0,0 +1,97 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import forecasts
+
+
+def daily_series(days, origin=date(2024, 1, 1)):
+    dates = [origin + timedelta(days=i) for i in range(days)]
+    ordinals = np.array([d.toordinal() for d in dates])
+    factors = np.array([1.0, 1.0, 1.0, 1.0, 1.2, 1.5, 0.3])
+    values = (50 + 0.5 * np.arange(days)) * factors[[d.weekday() for d in dates]]
+    return dates, values, ordinals
+
+
+class TestFit:
+
+    def test_incremental_equals_full(self):
+        """Test that adding days in chunks gives the same state as one pass"""
+        dates, values, _ = daily_series(120)
+        days = [d.isoformat() for d in dates]
+        full = forecasts.Fit(dates[0])
+        full.add_days(days, values, dates[-1])
+
+        chunked = forecasts.Fit(dates[0])
+        chunked.add_days(days[:40], values[:40], dates[39])
+        chunked.add_days(days[40:], values[40:], dates[-1])
+
+        assert np.allclose(full.state, chunked.state)
+        assert chunked.slope == pytest.approx(full.slope)
+
+    def test_recovers_trend_and_weekdays(self):
+        """Test that weekday factors and a positive trend are recovered"""
+        dates, values, _ = daily_series(364)
+        fit = forecasts.Fit(dates[0])
+        fit.add_days([d.isoformat() for d in dates], values, dates[-1])
+
+        assert fit.slope > 0
+        assert fit.weekday_factors[5] > fit.weekday_factors[0] > fit.weekday_factors[6]
+        _, predicted = fit.predict(dates[-1] + timedelta(days=1), 7)
+        assert predicted.sum() == pytest.approx(np.sum(values[-7:]), rel=0.15)
+
+    def test_missing_days_are_zero(self):
+        """Test that days without expenses count as zero spend"""
+        fit = forecasts.Fit(date(2024, 1, 1))
+        fit.add_days(["2024-01-01", "2024-01-10"], [10.0, 30.0], date(2024, 1, 10))
+
+        assert fit.state[0] == 10
+        assert fit.state[3] == 40.0
+
+
+class TestSpendingForecast:
+
+    def add_expense(self, client, headers, amount, day):
+        return client.post(
+            "/api/expenses/",
+            json={"amount": amount, "description": "x", "category": "food", "date": day.isoformat()},
+            headers=headers
+        ).json()
+
+    def test_forecast_and_refits(self, client, auth_headers):
+        """Test serving, incremental reuse and full refit after a backdated write"""
+        today = date.today()
+        for offset in range(1, 29):
+            self.add_expense(client, auth_headers, 20.0 + offset % 7, today - timedelta(days=offset))
+
+        before = forecasts.stats()
+        data = client.get("/api/analytics/spending-forecast?days=7", headers=auth_headers).json()
+        assert len(data["daily"]) == 7
+        assert data["daily"][0]["date"] == today.isoformat()
+        assert data["total"] > 0
+        assert data["model"]["fitted_through"] == (today - timedelta(days=1)).isoformat()
+        assert data["model"]["days_observed"] == 28
+
+        client.get("/api/analytics/spending-forecast?days=7", headers=auth_headers)
+        assert forecasts.stats()["full_refits"] == before["full_refits"] + 1
+
+        expense = self.add_expense(client, auth_headers, 500.0, today - timedelta(days=10))
+        data = client.get("/api/analytics/spending-forecast?days=7", headers=auth_headers).json()
+        assert forecasts.stats()["full_refits"] == before["full_refits"] + 2
+        assert data["model"]["residual_std"] > 0
+
+        client.put(
+            f"/api/expenses/{expense['id']}",
+            json={"amount": 500.0, "description": "x", "category": "food",
+                  "date": (today - timedelta(days=3)).isoformat()},
+            headers=auth_headers
+        )
+        client.get("/api/analytics/spending-forecast?days=7", headers=auth_headers)
+        assert forecasts.stats()["full_refits"] == before["full_refits"] + 3
+
+    def test_days_limit(self, client, auth_headers):
+        """Test that the horizon is bounded"""
+        response = client.get("/api/analytics/spending-forecast?days=1000", headers=auth_headers)
+
+        assert response.status_code == 422
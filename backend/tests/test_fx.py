@@ -0,0 +1,127 @@
+import pytest
+from sqlalchemy import select, func
+
+import fx
+import running_stats
+import versions
+from models import Expense, DailyRollup
+
+RATES = [("USD", "2024-01-01", 40.0), ("USD", "2024-02-01", 42.0), ("EUR", "2024-01-01", 44.0)]
+
+
+def rollup_totals(db, user_id=1):
+    return dict(db.execute(
+        select(DailyRollup.day, func.sum(DailyRollup.total)).where(DailyRollup.user_id == user_id)
+        .group_by(DailyRollup.day)
+    ).all())
+
+
+class TestRateTable:
+
+    def test_as_of_conversion(self):
+        """Test that each amount uses the latest rate on its date"""
+        table = fx.RateTable("1", sorted(RATES))
+        converted = table.convert(
+            [10.0, 10.0, 10.0, 10.0, 10.0, 100.0],
+            ["USD", "USD", "USD", "EUR", None, "UAH"],
+            ["2024-01-15", "2024-02-01T09:00:00", "2023-06-01", "2024-03-01", "2024-03-01", None]
+        )
+        # До першого курсу — найраніший курс
+        assert converted.tolist() == [400.0, 420.0, 400.0, 440.0, 10.0, 100.0]
+        with pytest.raises(fx.UnknownCurrency):
+            table.convert([1.0], ["GBP"], ["2024-01-01"])
+
+    def test_sql_matches_numpy(self, session):
+        """Test that the SQL expression used by rebuilds agrees with the in-process conversion"""
+        fx.load_rates(session.get_bind(), RATES)
+        rows = [("USD", "2023-12-31"), ("USD", "2024-01-31"), ("USD", "2024-05-05"), ("EUR", None), (None, "2024-01-01")]
+        session.add_all(Expense(user_id=1, amount=3.5, currency=currency, date=day) for currency, day in rows)
+        session.commit()
+
+        stored = session.execute(select(Expense.currency, Expense.date, fx.base_amount()).order_by(Expense.id)).all()
+        expected = fx.table(session).convert([3.5] * len(rows), [row[0] for row in rows], [row[1] for row in rows])
+        assert [row[2] for row in stored] == pytest.approx(expected.tolist())
+
+
+class TestConvertedRollups:
+
+    def test_rollups_and_statistics_in_base_currency(self, session):
+        """Test that writes in foreign currencies land in rollups converted"""
+        fx.load_rates(session.get_bind(), RATES)
+        session.add_all([
+            Expense(user_id=1, amount=10.0, currency="USD", date="2024-01-10", category="Подорожі"),
+            Expense(user_id=1, amount=10.0, currency="USD", date="2024-02-10", category="Подорожі"),
+            Expense(user_id=1, amount=100.0, date="2024-02-10", category="Подорожі"),
+        ])
+        session.commit()
+        assert rollup_totals(session) == {"2024-01-10": 400.0, "2024-02-10": 520.0}
+        assert running_stats.summary(session, 1)[running_stats.ALL]["max"] == 420.0
+
+        expense = session.scalars(select(Expense).where(Expense.date == "2024-01-10")).one()
+        expense.date = "2024-02-11"
+        session.commit()
+        assert rollup_totals(session) == {"2024-02-10": 520.0, "2024-02-11": 420.0}
+
+        session.delete(expense)
+        session.commit()
+        assert rollup_totals(session) == {"2024-02-10": 520.0}
+
+    def test_rate_change_rebuilds_affected_days(self, session):
+        """Test that a changed rate recomputes only affected users and bumps their versions"""
+        bind = session.get_bind()
+        fx.load_rates(bind, RATES)
+        session.add_all([
+            Expense(user_id=1, amount=10.0, currency="USD", date="2024-01-10"),
+            Expense(user_id=1, amount=10.0, currency="USD", date="2024-03-10"),
+            Expense(user_id=2, amount=10.0, currency="EUR", date="2024-03-10"),
+        ])
+        session.commit()
+        before = versions.current(session, 1, "expenses")
+        other = versions.current(session, 2, "expenses")
+
+        assert fx.load_rates(bind, RATES) == 0
+        assert fx.load_rates(bind, [("USD", "2024-03-01", 45.0)]) == 1
+        session.expire_all()
+        assert rollup_totals(session) == {"2024-01-10": 400.0, "2024-03-10": 450.0}
+        assert versions.current(session, 1, "expenses") != before
+        assert versions.current(session, 2, "expenses") == other
+
+        # Новий курс для валюти, що вже має курси, з дня раніше найранішого — уся історія
+        fx.load_rates(bind, [("USD", "2023-01-01", 30.0)])
+        session.expire_all()
+        assert rollup_totals(session) == {"2024-01-10": 400.0, "2024-03-10": 450.0}
+        assert running_stats.summary(session, 1)[running_stats.ALL]["max"] == 450.0
+
+    def test_read_rates_file(self, tmp_path):
+        """Test parsing and validation of the local rates file"""
+        path = tmp_path / "rates.csv"
+        path.write_text("currency,date,rate\nusd,2024-01-01,40.5\nUAH,2024-01-01,1\n", encoding="utf-8")
+        assert fx.read_rates_file(path) == [("USD", "2024-01-01", 40.5)]
+        path.write_text("currency,date,rate\nUSD,2024-01-01,-1\n", encoding="utf-8")
+        with pytest.raises(ValueError):
+            fx.read_rates_file(path)
+
+
+class TestCurrencyApi:
+
+    def test_expense_currency(self, client, auth_headers, db_session):
+        """Test that expenses accept known currencies and analytics report base totals"""
+        unknown = client.post("/api/expenses/", json={
+            "amount": 10.0, "description": "Кава", "category": "Кафе", "date": "2024-01-10", "currency": "GBP"
+        }, headers=auth_headers)
+        assert unknown.status_code == 400
+
+        fx.load_rates(db_session.get_bind(), RATES)
+        created = client.post("/api/expenses/", json={
+            "amount": 10.0, "description": "Кава", "category": "Кафе", "date": "2024-01-10", "currency": "USD"
+        }, headers=auth_headers)
+        assert created.status_code == 201
+        assert created.json()["currency"] == "USD"
+        client.post("/api/expenses/", json={
+            "amount": 50.0, "description": "Булка", "category": "Кафе", "date": "2024-01-10"
+        }, headers=auth_headers)
+
+        dashboard = client.get("/api/analytics/dashboard", headers=auth_headers).json()
+        assert dashboard["total_expenses"] == 450.0
+        monthly = client.get("/api/analytics/monthly-expenses", headers=auth_headers).json()
+        assert monthly == [{"month": "2024-01", "total": 450.0, "count": 2}]
@@ -0,0 +1,96 @@
+import pytest
+
+import idempotency
+from models import Expense
+
+
+class TestIdempotencyKeys:
+
+    def test_retry_replays_expense(self, client, auth_headers, db_session, test_expense_data):
+        """Test that a retried POST returns the original expense without a duplicate"""
+        headers = {**auth_headers, "Idempotency-Key": "expense-1"}
+
+        first = client.post("/api/expenses/", json=test_expense_data, headers=headers)
+        second = client.post("/api/expenses/", json=test_expense_data, headers=headers)
+
+        assert first.status_code == second.status_code == 201
+        assert second.json() == first.json()
+        assert second.headers["idempotent-replayed"] == "true"
+        assert db_session.query(Expense).count() == 1
+
+    def test_retry_does_not_double_contribution(self, client, auth_headers):
+        """Test PATCH add-money retried with the same key"""
+        goal = client.post(
+            "/api/goals/",
+            json={"title": "Trip", "target_amount": 500.0, "target_date": "2025-06-01"},
+            headers=auth_headers
+        ).json()
+        headers = {**auth_headers, "Idempotency-Key": "add-1"}
+
+        for _ in range(3):
+            response = client.patch(f"/api/goals/{goal['id']}/add-money", json={"amount": 50.0}, headers=headers)
+
+        assert response.json()["current_amount"] == 50.0
+
+    def test_different_body_is_rejected(self, client, auth_headers, test_expense_data):
+        """Test that a reused key with another payload answers 422"""
+        headers = {**auth_headers, "Idempotency-Key": "expense-2"}
+        client.post("/api/expenses/", json=test_expense_data, headers=headers)
+
+        response = client.post("/api/expenses/", json={**test_expense_data, "amount": 1.0}, headers=headers)
+
+        assert response.status_code == 422
+
+    def test_errors_are_not_stored(self, client, auth_headers, test_expense_data):
+        """Test that a failed request can be retried with the same key"""
+        headers = {**auth_headers, "Idempotency-Key": "expense-3"}
+
+        failed = client.post("/api/expenses/", json={**test_expense_data, "amount": -5}, headers=headers)
+        retried = client.post("/api/expenses/", json={**test_expense_data, "amount": -5}, headers=headers)
+        fixed = client.post("/api/expenses/", json=test_expense_data, headers=headers)
+
+        assert failed.status_code == 422
+        assert "idempotent-replayed" not in failed.headers
+        # Повтор знову проходить валідацію, а виправлене тіло з тим самим ключем створює витрату
+        assert retried.status_code == 422 and "idempotent-replayed" not in retried.headers
+        assert retried.json() == failed.json()
+        assert fixed.status_code == 201 and "idempotent-replayed" not in fixed.headers
+        listed = client.get("/api/expenses/", headers=auth_headers).json()
+        assert [item["id"] for item in listed] == [fixed.json()["id"]]
+
+    def test_keys_are_scoped_per_path(self, client, auth_headers, test_expense_data, test_budget_data):
+        """Test that the same key on another endpoint is independent"""
+        headers = {**auth_headers, "Idempotency-Key": "shared"}
+
+        client.post("/api/expenses/", json=test_expense_data, headers=headers)
+        response = client.post("/api/budgets/", json=test_budget_data, headers=headers)
+
+        assert response.status_code == 201
+        assert "idempotent-replayed" not in response.headers
+
+
+class TestIdempotencyStore:
+
+    def test_in_flight_and_byte_cap(self):
+        """Test concurrent duplicates and LRU eviction by size"""
+        store = idempotency.IdempotencyStore(max_bytes=1000, ttl_seconds=60)
+
+        assert store.begin("a", "f")[0] == "new"
+        assert store.begin("a", "f")[0] == "in_flight"
+        store.finish("a", "f", 201, [], b"x" * 400)
+        store.begin("b", "f")
+        store.finish("b", "f", 201, [], b"y" * 400)
+        store.begin("c", "f")
+        store.finish("c", "f", 201, [], b"z" * 400)
+
+        assert store.begin("a", "f")[0] == "new"
+        assert store.begin("c", "f")[0] == "replay"
+        assert store.stats()["bytes"] <= 1000
+
+    def test_entries_expire(self):
+        """Test that expired responses are not replayed"""
+        store = idempotency.IdempotencyStore(ttl_seconds=0)
+        store.begin("a", "f")
+        store.finish("a", "f", 200, [], b"{}")
+
+        assert store.begin("a", "f")[0] == "new"
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+import jobs
+from database import Base
+from models import Job
+
+
+@pytest.fixture
+def job_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/jobs.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def runner(job_engine):
+    return jobs.JobRunner(job_engine, workers=2, delay=0.0, poll_seconds=0.05,
+                          session_factory=sessionmaker(bind=job_engine))
+
+
+def job_rows(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(Job.kind, Job.user_id, Job.status, Job.attempts).order_by(Job.id)).all()
+
+
+calls = []
+
+
+@jobs.register("test-record")
+def record(db, user_id):
+    calls.append(user_id)
+
+
+failures = {"left": 0}
+
+
+@jobs.register("test-flaky")
+def flaky(db, user_id):
+    if failures["left"] > 0:
+        failures["left"] -= 1
+        raise RuntimeError("boom")
+
+
+class TestJobRunner:
+
+    def test_pending_jobs_coalesce(self, runner, job_engine):
+        """Test that repeated enqueues for one user leave a single pending job"""
+        for _ in range(10):
+            runner.enqueue([("test-record", 1)])
+        runner.enqueue([("test-record", 2)])
+
+        assert [(kind, user_id) for kind, user_id, _, _ in job_rows(job_engine)] == [("test-record", 1), ("test-record", 2)]
+        assert (runner.enqueued, runner.coalesced) == (2, 9)
+
+    def test_run_pending(self, runner, job_engine):
+        """Test synchronous execution and bookkeeping"""
+        calls.clear()
+        runner.enqueue([("test-record", 1), ("test-record", 2)])
+
+        assert runner.run_pending() == 2
+        assert sorted(calls) == [1, 2]
+        assert {status for _, _, status, _ in job_rows(job_engine)} == {"done"}
+        assert runner.stats()["completed"] == 2
+
+    def test_retries_then_fails(self, runner, job_engine):
+        """Test that a failing job is retried with backoff and then marked failed"""
+        failures["left"] = 10
+        runner.max_attempts = 2
+        runner.enqueue([("test-flaky", 1)])
+
+        runner.run_pending()
+        assert job_rows(job_engine) == [("test-flaky", 1, "pending", 1)]
+
+        with job_engine.begin() as conn:
+            conn.execute(Job.__table__.update().values(run_after=0))
+        runner.run_pending()
+        assert job_rows(job_engine) == [("test-flaky", 1, "failed", 2)]
+        assert (runner.retried, runner.failed) == (1, 1)
+
+    def test_new_job_while_running(self, runner, job_engine):
+        """Test that writes during a running job schedule exactly one more run, not in parallel"""
+        runner.enqueue([("test-record", 1)])
+        (running,) = runner._claim(2)
+        runner.enqueue([("test-record", 1)])
+        runner.enqueue([("test-record", 1)])
+
+        assert runner._claim(2) == []
+        runner._execute(running)
+        assert [status for _, _, status, _ in job_rows(job_engine)] == ["done", "pending"]
+        assert runner.run_pending() == 1
+
+    def test_background_dispatch(self, runner):
+        """Test that the started runner picks up enqueued work"""
+        done = threading.Event()
+
+        @jobs.register("test-signal")
+        def signal(db, user_id):
+            done.set()
+
+        runner.start()
+        try:
+            runner.enqueue([("test-signal", 7)])
+            assert done.wait(5)
+        finally:
+            runner.stop()
+
+        assert runner.stats()["started"] is False
+        assert runner.completed == 1
+
+
+class TestJobMetrics:
+
+    def test_metrics_include_jobs(self, client):
+        """Test that queue depth and latency are exposed, and that tests do not start the dispatcher"""
+        data = client.get("/api/health/metrics").json()
+
+        # conftest вимикає диспетчер (SPENDIO_JOB_RUNNER=0): тести не пишуть у data.db
+        assert data["jobs"]["started"] is False
+        assert "pending" in data["jobs"]
+        assert "p99" in data["jobs"]["latency_ms"]
@@ -0,0 +1,66 @@
+import pytest
+
+
+def add_expense(client, headers, amount, day, category):
+    client.post(
+        "/api/expenses/",
+        json={"amount": amount, "description": "x", "category": category, "date": day},
+        headers=headers
+    )
+
+
+@pytest.fixture
+def quarter_data(client, auth_headers):
+    add_expense(client, auth_headers, 100.0, "2024-01-10", "food")
+    add_expense(client, auth_headers, 50.0, "2024-01-20", "food")
+    add_expense(client, auth_headers, 30.0, "2024-01-05", "transport")
+    add_expense(client, auth_headers, 120.0, "2024-03-02", "food")
+
+
+class TestPivot:
+
+    def test_category_by_month(self, client, auth_headers, quarter_data):
+        """Test the matrix, totals and month-over-month deltas"""
+        data = client.get(
+            "/api/analytics/pivot?rows=category&cols=month&start=2024-01-01&end=2024-03-31",
+            headers=auth_headers
+        ).json()
+
+        assert data["row_labels"] == ["food", "transport"]
+        assert data["col_labels"] == ["2024-01", "2024-02", "2024-03"]
+        assert data["values"] == [[150.0, 0.0, 120.0], [30.0, 0.0, 0.0]]
+        assert data["row_totals"] == [270.0, 30.0]
+        assert data["col_totals"] == [180.0, 0.0, 120.0]
+        assert data["grand_total"] == 300.0
+        assert data["deltas"] == [[None, -150.0, 120.0], [None, -30.0, 0.0]]
+        assert data["total_deltas"] == [None, -180.0, 120.0]
+        assert data["delta_axis"] == "cols"
+
+    def test_transposed(self, client, auth_headers, quarter_data):
+        """Test periods as rows with deltas in the same shape as values"""
+        data = client.get(
+            "/api/analytics/pivot?rows=month&cols=category&start=2024-01-01&end=2024-02-29",
+            headers=auth_headers
+        ).json()
+
+        assert data["row_labels"] == ["2024-01", "2024-02"]
+        assert data["col_labels"] == ["food", "transport"]
+        assert data["deltas"] == [[None, None], [-150.0, -30.0]]
+        assert data["delta_axis"] == "rows"
+
+    def test_empty_range(self, client, auth_headers):
+        """Test a period without expenses"""
+        data = client.get(
+            "/api/analytics/pivot?cols=quarter&start=2024-01-01&end=2024-06-30",
+            headers=auth_headers
+        ).json()
+
+        assert data["col_labels"] == ["2024-Q1", "2024-Q2"]
+        assert data["values"] == []
+        assert data["col_totals"] == [0.0, 0.0]
+
+    def test_same_dimension_rejected(self, client, auth_headers):
+        """Test that rows and cols must differ"""
+        response = client.get("/api/analytics/pivot?rows=month&cols=month", headers=auth_headers)
+
+        assert response.status_code == 400
@@ -0,0 +1,55 @@
+import pytest
+
+import queries
+
+
+class TestCachedStatements:
+
+    def test_lambda_statement_shape_is_cached(self):
+        """Test that different parameter values share one cache key"""
+        first = queries.expense_rows(1, category="food", limit=10)
+        second = queries.expense_rows(2, category="transport", limit=50)
+
+        assert first._generate_cache_key().key == second._generate_cache_key().key
+
+    def test_filters_change_statement_shape(self):
+        """Test that optional filters produce a different cached statement"""
+        plain = queries.expense_rows(1)
+        filtered = queries.expense_rows(1, start_date="2024-01-01")
+
+        assert plain._generate_cache_key().key != filtered._generate_cache_key().key
+
+    def test_list_endpoints_use_bound_filters(self, client, auth_headers):
+        """Test list endpoints through the cached statements"""
+        for amount, category, day in [(10.0, "food", "2024-01-10"), (20.0, "transport", "2024-02-10")]:
+            client.post(
+                "/api/expenses/",
+                json={"amount": amount, "description": "x", "category": category, "date": day},
+                headers=auth_headers
+            )
+
+        response = client.get("/api/expenses/?start_date=2024-02-01", headers=auth_headers)
+        assert response.status_code == 200
+        assert [item["category"] for item in response.json()] == ["transport"]
+
+        response = client.get("/api/expenses/?category=food&limit=1", headers=auth_headers)
+        assert [item["amount"] for item in response.json()] == [10.0]
+
+        assert client.get("/api/budgets/", headers=auth_headers).status_code == 200
+        assert client.get("/api/goals/?achieved_only=false", headers=auth_headers).status_code == 200
+        assert client.get("/api/categories/", headers=auth_headers).status_code == 200
+
+    def test_lookup_by_id_is_scoped_to_user(self, client, auth_headers):
+        """Test that the prebuilt id lookup keeps the user filter"""
+        created = client.post(
+            "/api/goals/",
+            json={"title": "Bike", "target_amount": 100.0, "target_date": "2025-01-01"},
+            headers=auth_headers
+        ).json()
+
+        response = client.patch(
+            f"/api/goals/{created['id']}/add-money", json={"amount": 40.0}, headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert response.json()["current_amount"] == 40.0
+        assert client.delete("/api/goals/999999", headers=auth_headers).status_code == 404
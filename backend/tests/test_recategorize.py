@@ -0,0 +1,138 @@
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.orm import sessionmaker
+
+import recategorize
+import rollups
+import running_stats
+import versions
+from database import Base
+from models import Budget, Category, DailyRollup, Expense, QuantileSketch, RunningStat
+
+
+def seed(db, count):
+    db.add_all([Category(id=1, name="Кафе", user_id=1), Category(id=2, name="Їжа", user_id=1)])
+    db.add_all(
+        Expense(user_id=1, amount=10.0 + index, category="Кафе" if index % 2 else "Таксі",
+                date=f"2024-05-{index % 28 + 1:02d}", description=f"витрата {index}")
+        for index in range(count)
+    )
+    db.add(Expense(user_id=1, amount=7.0, category="Їжа", date="2024-05-03", description="хліб"))
+    db.add(Expense(user_id=2, amount=99.0, category="Кафе", date="2024-05-03", description="чужа"))
+    db.add_all([
+        Budget(name="Кафе", amount=1000.0, spent=0.0, start_date="2024-05-01", end_date="2024-05-14",
+               category_id=1, user_id=1),
+        Budget(name="Їжа", amount=1000.0, spent=0.0, start_date="2024-05-01", end_date="2024-05-31",
+               category_id=2, user_id=1),
+    ])
+    db.commit()
+
+
+def snapshot(db):
+    rollup_rows = set(db.execute(
+        select(DailyRollup.user_id, DailyRollup.day, DailyRollup.category, DailyRollup.count, DailyRollup.total)
+    ).all())
+    stats = {
+        (row.user_id, row.category): (row.count, round(row.mean, 6), round(row.m2, 4))
+        for row in db.scalars(select(RunningStat))
+    }
+    return rollup_rows, stats
+
+
+class TestMove:
+
+    def test_derived_data_matches_rebuild(self, session):
+        """Test that incremental deltas equal a full rebuild after a bulk move"""
+        seed(session, 40)
+        session.execute(update(QuantileSketch).values(dirty=False))
+        session.commit()
+        before = versions.current(session, 1, "expenses")
+
+        moved = recategorize.move(session, 1, recategorize.expense_filter(1, ["Кафе"], end_date="2024-05-20"), "Їжа")
+        session.commit()
+        assert moved == session.query(Expense).filter(
+            Expense.user_id == 1, Expense.category == "Їжа", Expense.description != "хліб"
+        ).count()
+        assert session.query(Expense).filter(Expense.user_id == 2, Expense.category == "Кафе").count() == 1
+        assert versions.current(session, 1, "expenses") != before
+        assert session.scalar(select(QuantileSketch.dirty).where(QuantileSketch.category == "Кафе")) is True
+
+        incremental = snapshot(session)
+        with session.get_bind().begin() as conn:
+            rollups.rebuild(conn)
+            running_stats.rebuild(conn)
+        assert snapshot(session) == incremental
+
+        # Витрачене бюджетів не зберігається — бюджети не змінюються
+        assert session.scalars(select(Budget.spent)).all() == [0.0, 0.0]
+
+    def test_constant_query_count(self, tmp_path):
+        """Test that the number of statements does not depend on the number of moved expenses"""
+        counts = []
+        for size in (10, 300):
+            engine = create_engine(f"sqlite:///{tmp_path}/size{size}.db")
+            Base.metadata.create_all(bind=engine)
+            db = sessionmaker(bind=engine)()
+            seed(db, size)
+            statements = []
+            event.listen(engine, "before_cursor_execute", lambda *args: statements.append(1))
+            recategorize.move(db, 1, recategorize.expense_filter(1, ["Кафе", "Таксі"]), "Їжа")
+            db.commit()
+            db.close()
+            engine.dispose()
+            counts.append(len(statements))
+        assert counts[0] == counts[1]
+
+    def test_change_sequence_per_row(self, session):
+        """Test that each moved expense gets its own change_seq for delta sync"""
+        seed(session, 5)
+        recategorize.move(session, 1, recategorize.expense_filter(1, ["Таксі"]), "Транспорт")
+        session.commit()
+        seqs = session.scalars(select(Expense.change_seq).where(Expense.category == "Транспорт")).all()
+        assert len(seqs) == len(set(seqs)) == 3
+
+
+class TestRecategorizeApi:
+
+    def test_merge_and_bulk_endpoints(self, client, auth_headers):
+        """Test category merge and filter-based recategorization over the API"""
+        source = client.post("/api/categories/", json={"name": "Кав'ярні"}, headers=auth_headers).json()
+        target = client.post("/api/categories/", json={"name": "Кафе"}, headers=auth_headers).json()
+        child = client.post(
+            "/api/categories/", json={"name": "Еспресо", "parent_id": source["id"]}, headers=auth_headers
+        ).json()
+        for amount, category, description in [(30.0, "Кав'ярні", "лате"), (20.0, "Кав'ярні", "круасан"),
+                                              (15.0, "Таксі", "поїздка")]:
+            client.post("/api/expenses/", json={
+                "amount": amount, "description": description, "category": category, "date": "2024-05-01"
+            }, headers=auth_headers)
+
+        invalid = client.post(f"/api/categories/{source['id']}/merge-into/{child['id']}", headers=auth_headers)
+        assert invalid.status_code == 400
+        merged = client.post(f"/api/categories/{source['id']}/merge-into/{target['id']}", headers=auth_headers)
+        assert merged.status_code == 200
+        assert merged.json()["moved"] == 2
+
+        categories = {row["name"]: row for row in client.get("/api/categories/", headers=auth_headers).json()}
+        assert "Кав'ярні" not in categories
+        assert categories["Еспресо"]["parent_id"] == target["id"]
+
+        # Категорія без витрат: бюджети все одно переходять до target
+        empty = client.post("/api/categories/", json={"name": "Порожня"}, headers=auth_headers).json()
+        budget = client.post("/api/budgets/", json={
+            "name": "Порожня", "amount": 50.0, "period": "monthly", "start_date": "2024-05-01",
+            "end_date": "2024-05-31", "category_id": empty["id"]
+        }, headers=auth_headers).json()
+        assert client.post(f"/api/categories/{empty['id']}/merge-into/{target['id']}",
+                           headers=auth_headers).json()["moved"] == 0
+        budgets = client.get("/api/budgets/?active_only=false", headers=auth_headers).json()
+        assert [row["category_id"] for row in budgets if row["id"] == budget["id"]] == [target["id"]]
+
+        no_filter = client.post("/api/expenses/recategorize", json={"category": "Кафе"}, headers=auth_headers)
+        assert no_filter.status_code == 400
+        bulk = client.post("/api/expenses/recategorize", json={
+            "category": "Транспорт", "description": "поїзд"
+        }, headers=auth_headers)
+        assert bulk.json() == {"updated": 1, "category": "Транспорт"}
+
+        expenses = client.get("/api/expenses/", headers=auth_headers).json()
+        assert sorted(expense["category"] for expense in expenses) == ["Кафе", "Кафе", "Транспорт"]
@@ -0,0 +1,101 @@
+import pytest
+from datetime import date, timedelta
+
+import recommendations
+import rollups
+from models import Expense, DailyRollup
+
+
+def rollup_rows(db_session):
+    db_session.expire_all()
+    return {
+        (row.user_id, row.day, row.category): (round(row.total, 6), row.count)
+        for row in db_session.query(DailyRollup).all()
+    }
+
+
+class TestRollups:
+
+    def test_insert_update_delete(self, db_session):
+        """Test that daily rollups follow ORM writes"""
+        first = Expense(amount=10.0, description="a", category="food", date="2024-01-02", user_id=1)
+        second = Expense(amount=5.0, description="b", category="food", date="2024-01-02", user_id=1)
+        db_session.add_all([first, second])
+        db_session.commit()
+        assert rollup_rows(db_session) == {(1, "2024-01-02", "food"): (15.0, 2)}
+
+        first.category = "transport"
+        first.amount = 12.0
+        db_session.commit()
+        assert rollup_rows(db_session) == {
+            (1, "2024-01-02", "food"): (5.0, 1),
+            (1, "2024-01-02", "transport"): (12.0, 1)
+        }
+
+        db_session.delete(second)
+        db_session.commit()
+        assert rollup_rows(db_session) == {(1, "2024-01-02", "transport"): (12.0, 1)}
+
+    def test_rebuild_matches_incremental(self, db_session):
+        """Test that a full rebuild reproduces incrementally maintained rollups"""
+        for day, amount in [(1, 3.0), (1, 4.0), (2, 8.5)]:
+            db_session.add(Expense(amount=amount, description="x", category="food",
+                                   date=f"2024-02-0{day}", user_id=2))
+        db_session.commit()
+        incremental = rollup_rows(db_session)
+
+        rollups.rebuild(db_session)
+        db_session.commit()
+
+        assert rollup_rows(db_session) == incremental
+
+
+class TestRecommendations:
+
+    def test_signals(self, client, auth_headers, test_budget_data):
+        """Test trend, top category, anomaly and budget risk signals"""
+        today = date.today()
+        for months_ago, amount in [(3, 100.0), (2, 200.0), (1, 300.0)]:
+            day = (today.replace(day=1) - timedelta(days=30 * months_ago - 5)).isoformat()
+            client.post("/api/expenses/", json={"amount": amount, "description": "x", "category": "food",
+                                                 "date": day}, headers=auth_headers)
+        for _ in range(10):
+            client.post("/api/expenses/", json={"amount": 10.0, "description": "x", "category": "transport",
+                                                 "date": today.isoformat()}, headers=auth_headers)
+        client.post("/api/budgets/", json={**test_budget_data, "amount": 50.0, "start_date": today.isoformat(),
+                                           "end_date": (today + timedelta(days=29)).isoformat()},
+                    headers=auth_headers)
+
+        data = client.get("/api/analytics/recommendations", headers=auth_headers).json()
+        titles = [item["title"] for item in data]
+
+        assert "Найбільші витрати" in titles
+        assert "\"food\"" in data[titles.index("Найбільші витрати")]["message"]
+        assert "Незвичайні витрати" in titles
+        assert "Бюджет перевищено" in titles
+        assert set(data[0]) == {"type", "title", "message", "icon"}
+
+    def test_cached_until_next_write(self, client, auth_headers, test_expense_data, monkeypatch):
+        """Test that results are reused until the user's data changes"""
+        calls = []
+        original = recommendations.compute
+        monkeypatch.setattr(recommendations, "compute", lambda *args: calls.append(1) or original(*args))
+
+        client.get("/api/analytics/recommendations", headers=auth_headers)
+        client.get("/api/analytics/recommendations", headers=auth_headers)
+        assert len(calls) == 1
+
+        client.post("/api/expenses/", json=test_expense_data, headers=auth_headers)
+        data = client.get("/api/analytics/recommendations", headers=auth_headers).json()
+        assert len(calls) == 2
+        assert data[0]["title"] == "Найбільші витрати"
+
+    def test_spending_trend(self):
+        """Test the monthly regression used for the growth signal"""
+        rising = [type("Row", (), {"total": value}) for value in (100.0, 150.0, 210.0)]
+
+        trend = recommendations.spending_trend(rising)
+
+        assert trend["direction"] == "зростання"
+        assert trend["next_month"] == 263
+        assert recommendations.spending_trend(rising[:1])["direction"] == "стабільно"
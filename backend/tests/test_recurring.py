@@ -0,0 +1,138 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select, func
+
+import recurring
+from models import Expense, RecurringRule
+
+
+def add_rule(db, frequency, start, user_id=1, amount=100.0, category="Підписки", **kwargs):
+    rule = RecurringRule(
+        user_id=user_id, amount=amount, description="Netflix", category=category,
+        rule=recurring.build_rule(frequency, start, **kwargs), start_date=start.isoformat(), is_active=True
+    )
+    db.add(rule)
+    db.commit()
+    return rule
+
+
+class TestRules:
+
+    def test_month_end_is_clamped(self):
+        """Test that a rule on the 31st falls on the last day of shorter months"""
+        rule = recurring.build_rule("monthly", date(2025, 1, 31))
+        days = recurring.occurrences(rule, "2025-01-31", None, date(2025, 1, 1), date(2025, 4, 30))
+        assert days == [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30)]
+
+    def test_custom_rule_and_end_date(self):
+        """Test a custom RRULE (first Monday of the month) bounded by end_date"""
+        rule = recurring.build_rule("custom", date(2025, 1, 1), rrule="RRULE:FREQ=MONTHLY;BYDAY=MO;BYSETPOS=1")
+        days = recurring.occurrences(rule, "2025-01-01", "2025-03-10", date(2025, 1, 1), date(2025, 12, 31))
+        assert days == [date(2025, 1, 6), date(2025, 2, 3), date(2025, 3, 3)]
+
+    def test_invalid_rules(self):
+        """Test that malformed and sub-daily rules are rejected"""
+        with pytest.raises(ValueError):
+            recurring.build_rule("custom", date(2025, 1, 1), rrule="FREQ=HOURLY")
+        with pytest.raises(ValueError):
+            recurring.build_rule("custom", date(2025, 1, 1), rrule="FREQ=SOMETIMES")
+        with pytest.raises(ValueError):
+            recurring.build_rule("custom", date(2025, 1, 1))
+
+
+class TestMaterialization:
+
+    def test_only_past_days_are_stored(self, session):
+        """Test that materialization writes due occurrences once and never future ones"""
+        today = date(2025, 6, 15)
+        rule = add_rule(session, "weekly", today - timedelta(days=20))
+
+        assert recurring.materialize(session, 1, today) == 3
+        assert recurring.materialize(session, 1, today) == 0
+        days = session.scalars(select(Expense.date).where(Expense.recurring_rule_id == rule.id)).all()
+        assert sorted(days) == ["2025-05-26", "2025-06-02", "2025-06-09"]
+        assert session.scalar(select(RecurringRule.materialized_through)) == today.isoformat()
+
+        upcoming = recurring.upcoming(session, 1, today, today + timedelta(days=13))
+        assert [item["date"] for item in upcoming] == ["2025-06-16", "2025-06-23"]
+        assert recurring.scheduled_total(upcoming) == 200.0
+        assert recurring.scheduled_total(upcoming, category="Інше") == 0.0
+
+        # Наступного дня дописується лише новий день
+        assert recurring.materialize(session, 1, date(2025, 6, 16)) == 1
+        assert session.scalar(select(func.count(Expense.id))) == 4
+
+    def test_lazy_materialization_once_per_day(self, session):
+        """Test that repeated reads on the same day skip the database"""
+        today = date(2025, 6, 15)
+        add_rule(session, "daily", today - timedelta(days=2), user_id=7)
+
+        runs = recurring.stats()["lazy_runs"]
+        assert recurring.ensure_materialized(session, 7, today) == 3
+        assert recurring.ensure_materialized(session, 7, today) == 0
+        assert recurring.stats()["lazy_runs"] == runs + 1
+
+    def test_batched_sweep(self, session):
+        """Test that the sweep materializes all users of a database"""
+        today = date(2025, 6, 15)
+        add_rule(session, "monthly", date(2025, 4, 1), user_id=1)
+        add_rule(session, "yearly", date(2024, 6, 1), user_id=2)
+        inactive = add_rule(session, "daily", date(2025, 6, 1), user_id=3)
+        inactive.is_active = False
+        session.commit()
+
+        assert recurring.materialize_due(session.get_bind(), today) == 5
+        counts = dict(session.execute(
+            select(Expense.user_id, func.count(Expense.id)).group_by(Expense.user_id)
+        ).all())
+        assert counts == {1: 3, 2: 2}
+
+
+class TestRecurringApi:
+
+    def test_rule_lifecycle(self, client, auth_headers):
+        """Test creating a rule, seeing its occurrences and deactivating it"""
+        today = date.today()
+        start = today - timedelta(days=14)
+        created = client.post("/api/recurring/", json={
+            "amount": 25.0, "description": "Спортзал", "category": "Спорт",
+            "frequency": "weekly", "start_date": start.isoformat()
+        }, headers=auth_headers)
+        assert created.status_code == 201
+        rule = created.json()
+        assert rule["materialized_through"] == today.isoformat()
+        assert rule["next_occurrence"] == (today + timedelta(days=7)).isoformat()
+
+        expenses = client.get("/api/expenses/", headers=auth_headers).json()
+        assert sorted(item["date"] for item in expenses if item["recurring_rule_id"] == rule["id"]) == [
+            start.isoformat(), (start + timedelta(days=7)).isoformat(), today.isoformat()
+        ]
+
+        upcoming = client.get("/api/recurring/upcoming?days=15", headers=auth_headers).json()
+        assert [item["date"] for item in upcoming["occurrences"]] == [
+            (today + timedelta(days=7)).isoformat(), (today + timedelta(days=14)).isoformat()
+        ]
+        assert upcoming["total"] == 50.0
+
+        forecast = client.get("/api/analytics/spending-forecast?days=15", headers=auth_headers).json()
+        assert forecast["scheduled_total"] == 50.0
+
+        client.post("/api/budgets/", json={
+            "name": "Спорт", "amount": 100.0, "period": "monthly",
+            "start_date": today.isoformat(), "end_date": (today + timedelta(days=10)).isoformat()
+        }, headers=auth_headers)
+        status = client.get("/api/analytics/budget-status", headers=auth_headers).json()
+        assert status[0]["scheduled"] == 25.0
+
+        assert client.delete(f"/api/recurring/{rule['id']}", headers=auth_headers).status_code == 204
+        assert client.get("/api/recurring/", headers=auth_headers).json() == []
+        assert client.get("/api/recurring/upcoming", headers=auth_headers).json()["occurrences"] == []
+
+    def test_invalid_rule(self, client, auth_headers):
+        """Test that an unparsable rule is rejected"""
+        response = client.post("/api/recurring/", json={
+            "amount": 10.0, "description": "x", "frequency": "custom",
+            "rrule": "FREQ=MINUTELY", "start_date": "2025-01-01"
+        }, headers=auth_headers)
+        assert response.status_code == 400
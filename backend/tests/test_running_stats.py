@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+import running_stats
+from models import Expense, RunningStat
+
+
+def add_expense(client, headers, amount, category):
+    return client.post(
+        "/api/expenses/",
+        json={"amount": amount, "description": "x", "category": category, "date": "2024-05-01"},
+        headers=headers
+    ).json()
+
+
+class TestWelford:
+
+    def test_combine_and_remove(self):
+        """Test that merging and reverse merging match direct computation"""
+        values = np.random.default_rng(3).gamma(2.0, 100.0, 1000)
+        state = (0, 0.0, 0.0)
+        for chunk in np.array_split(values, 7):
+            state = running_stats.combine(state, chunk.tolist())
+
+        assert state[0] == 1000
+        assert state[1] == pytest.approx(values.mean())
+        assert state[2] / (state[0] - 1) == pytest.approx(values.var(ddof=1))
+
+        state = running_stats.remove(state, values[:400].tolist())
+        assert state[1] == pytest.approx(values[400:].mean())
+        assert state[2] / (state[0] - 1) == pytest.approx(values[400:].var(ddof=1))
+
+    def test_remove_everything(self):
+        """Test that removing all values resets the state"""
+        state = running_stats.combine((0, 0.0, 0.0), [1.0, 2.0])
+
+        assert running_stats.remove(state, [1.0, 2.0]) == (0, 0.0, 0.0)
+
+
+class TestStatisticsEndpoint:
+
+    def test_statistics_follow_writes(self, client, auth_headers):
+        """Test mean, variance and extremes after create, update and delete"""
+        created = [add_expense(client, auth_headers, amount, "food") for amount in (10.0, 20.0, 30.0)]
+        add_expense(client, auth_headers, 100.0, "rent")
+
+        data = client.get("/api/analytics/statistics", headers=auth_headers).json()
+        food = data["categories"][0]
+        assert food["category"] == "food"
+        assert (food["count"], food["mean"], food["variance"]) == (3, 20.0, 100.0)
+        assert data["overall"]["count"] == 4
+        assert data["overall"]["max"] == 100.0
+
+        client.delete(f"/api/expenses/{created[2]['id']}", headers=auth_headers)
+        food = client.get("/api/analytics/statistics?category=food", headers=auth_headers).json()["categories"][0]
+        assert (food["count"], food["mean"], food["min"], food["max"]) == (2, 15.0, 10.0, 20.0)
+
+        client.put(
+            f"/api/expenses/{created[0]['id']}",
+            json={"amount": 40.0, "description": "x", "category": "food", "date": "2024-05-01"},
+            headers=auth_headers
+        )
+        food = client.get("/api/analytics/statistics?category=food", headers=auth_headers).json()["categories"][0]
+        assert (food["count"], food["mean"], food["min"], food["max"]) == (2, 30.0, 20.0, 40.0)
+
+    def test_zscore(self, client, auth_headers):
+        """Test the z-score of a given amount"""
+        for amount in (10.0, 20.0, 30.0):
+            add_expense(client, auth_headers, amount, "food")
+
+        data = client.get("/api/analytics/statistics?category=food&amount=40", headers=auth_headers).json()
+
+        assert data["categories"][0]["zscore"] == 2.0
+
+    def test_star_category_is_not_overall(self, client, auth_headers):
+        """Test that a category named "*" is kept apart from the overall statistics"""
+        add_expense(client, auth_headers, 10.0, "*")
+        add_expense(client, auth_headers, 30.0, "food")
+
+        data = client.get("/api/analytics/statistics", headers=auth_headers).json()
+
+        assert {item["category"]: item["count"] for item in data["categories"]} == {"*": 1, "food": 1}
+        assert data["overall"]["count"] == 2
+        response = client.post("/api/expenses/", json={
+            "amount": 5.0, "description": "x", "category": running_stats.ALL, "date": "2024-05-01"
+        }, headers=auth_headers)
+        assert response.status_code == 422
+
+
+class TestExtremes:
+
+    def test_stale_extremes_are_read_without_writes(self, session):
+        """Test that a removed maximum is recomputed on read and persisted only by the job"""
+        db = session
+        expenses = [
+            Expense(user_id=1, amount=amount, category="food", date="2024-05-01", description="x")
+            for amount in (10.0, 20.0, 30.0)
+        ]
+        db.add_all(expenses)
+        db.commit()
+        db.delete(expenses[2])
+        db.commit()
+        stale = select(RunningStat.extremes_stale).where(RunningStat.user_id == 1, RunningStat.category == "food")
+
+        assert running_stats.summary(db, 1)["food"]["max"] == 20.0
+        assert db.scalar(stale) is True
+        assert running_stats.refresh_extremes(db, 1) == 2
+        db.commit()
+        assert db.scalar(stale) is False
+        assert running_stats.summary(db, 1)[running_stats.ALL]["max"] == 20.0
@@ -0,0 +1,116 @@
+import json
+import numpy as np
+import pytest
+from datetime import date, datetime
+
+import serialization
+from main import app
+from models import Expense
+from api.expenses import ExpenseResponse
+from api.budgets import BudgetResponse
+from api.goals import GoalResponse
+from api.categories import CategoryResponse
+
+
+class TestFastListPath:
+
+    def test_expenses_shape_matches_response_model(self, client, auth_headers, test_expense_data):
+        """Test that the Core-row path returns exactly the ExpenseResponse fields"""
+        client.post("/api/expenses/", json=test_expense_data, headers=auth_headers)
+
+        data = client.get("/api/expenses/", headers=auth_headers).json()
+
+        assert set(data[0]) == set(ExpenseResponse.model_fields)
+        assert ExpenseResponse(**data[0]).amount == test_expense_data["amount"]
+
+    def test_budgets_computed_fields(self, client, auth_headers, test_budget_data):
+        """Test that remaining and percentage_used are computed in SQL"""
+        client.post("/api/budgets/", json=test_budget_data, headers=auth_headers)
+
+        data = client.get("/api/budgets/", headers=auth_headers).json()
+
+        assert set(data[0]) == set(BudgetResponse.model_fields)
+        assert data[0]["remaining"] == test_budget_data["amount"]
+        assert data[0]["percentage_used"] == 0.0
+        assert data[0]["is_active"] is True
+
+    def test_goals_computed_fields(self, client, auth_headers):
+        """Test goal progress fields on the fast path"""
+        goal = client.post(
+            "/api/goals/",
+            json={"title": "Trip", "target_amount": 200.0, "target_date": "2025-06-01"},
+            headers=auth_headers
+        ).json()
+        client.patch(f"/api/goals/{goal['id']}/add-money", json={"amount": 50.0}, headers=auth_headers)
+
+        data = client.get("/api/goals/", headers=auth_headers).json()
+
+        assert set(data[0]) == set(GoalResponse.model_fields)
+        assert data[0]["progress_percentage"] == 25.0
+        assert data[0]["remaining_amount"] == 150.0
+
+    def test_categories_shape(self, client, auth_headers):
+        """Test categories list on the fast path"""
+        client.post("/api/categories/", json={"name": "Pets"}, headers=auth_headers)
+
+        data = client.get("/api/categories/", headers=auth_headers).json()
+
+        assert set(data[0]) == set(CategoryResponse.model_fields)
+        assert "Pets" in [item["name"] for item in data]
+
+
+class TestDumps:
+
+    def test_dumps_without_orjson(self, monkeypatch):
+        """Test the stdlib fallback keeps non-ASCII text readable"""
+        monkeypatch.setattr(serialization, "orjson", None)
+
+        assert serialization.dumps([{"name": "Продукти", "total": 1.5}]) == \
+            '[{"name":"Продукти","total":1.5}]'.encode("utf-8")
+
+
+class TestFastJSONResponse:
+
+    def test_renders_datetimes_orm_and_numpy(self):
+        """Test native handling of datetime, ORM entities and numpy values"""
+        expense = Expense(id=3, amount=12.5, description="Кава", category="food", date="2024-01-15", user_id=1)
+        response = serialization.FastJSONResponse({
+            "at": datetime(2024, 1, 15, 10, 30),
+            "expense": expense,
+            "mean": np.float64(2.5),
+            "series": np.array([1.0, 2.0])
+        })
+
+        data = json.loads(response.body)
+        assert data["at"] == "2024-01-15T10:30:00"
+        assert data["expense"]["description"] == "Кава"
+        assert data["mean"] == 2.5
+        assert data["series"] == [1.0, 2.0]
+
+    def test_fallback_matches_orjson(self, monkeypatch):
+        """Test that the stdlib fallback produces the same document"""
+        content = [{"day": date(2024, 1, 1), "total": 10.25, "name": "Продукти"}]
+        fast = json.loads(serialization.FastJSONResponse(content).body)
+        monkeypatch.setattr(serialization, "orjson", None)
+        slow = json.loads(serialization.FastJSONResponse(content).body)
+
+        assert fast == slow
+
+    def test_app_uses_fast_response_class(self):
+        """Test that the app-wide default response class is installed"""
+        assert app.router.default_response_class.value is serialization.FastJSONResponse
+
+    def test_expenses_by_category_response(self, client, auth_headers):
+        """Test analytics endpoint returning FastJSONResponse directly"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        for amount, category in [(30.0, "food"), (10.0, "food"), (60.0, "transport")]:
+            client.post(
+                "/api/expenses/",
+                json={"amount": amount, "description": "x", "category": category, "date": today},
+                headers=auth_headers
+            )
+
+        data = client.get("/api/analytics/expenses-by-category", headers=auth_headers).json()
+
+        assert data[0] == {"category": "transport", "total": 60.0, "count": 1, "percentage": 60.0}
+        assert data[1]["total"] == 40.0
@@ -0,0 +1,255 @@
+import threading
+from datetime import date
+
+import pytest
+from sqlalchemy import event, func, select, text
+from sqlalchemy.exc import OperationalError
+
+import budget_periods
+import database
+import utils
+import queries
+from database import Base, ShardRouter, SessionLocal, UserMoving, route_session
+from models import User, Expense, Category, Budget, RecurringRule
+from write_queue import GroupCommitQueue
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    directory = database.create_engine(f"sqlite:///{tmp_path}/directory.db")
+    shard_router = ShardRouter(directory, 3, f"sqlite:///{tmp_path}/shard{{}}.db")
+    Base.metadata.create_all(bind=directory)
+    for shard_engine in shard_router.engines:
+        Base.metadata.create_all(bind=shard_engine)
+    monkeypatch.setattr(database, "shard_router", shard_router)
+    return shard_router
+
+
+def add_user(router, email):
+    db = SessionLocal(bind=router.directory_engine)
+    user = User(email=email, name="Shard User", hashed_password="x")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+
+class TestShardRouter:
+
+    def test_assignment_is_persisted(self, router):
+        """Test that first routing stores the hash-based shard in user_shards"""
+        user_id = add_user(router, "a@example.com")
+        shard = router.shard_for(user_id)
+
+        assert shard == ShardRouter.hash_shard(user_id, 3)
+        with router.directory_engine.connect() as conn:
+            stored = conn.execute(
+                text("SELECT shard FROM user_shards WHERE user_id = :u"), {"u": user_id}
+            ).scalar()
+        assert stored == shard
+
+    def test_session_routes_user_tables_to_shard(self, router):
+        """Test that user data goes to the shard while users stay in the directory"""
+        user_id = add_user(router, "b@example.com")
+        db = SessionLocal(bind=router.directory_engine)
+        route_session(db, user_id)
+
+        db.add(Expense(amount=10.0, description="x", category="food", date="2024-01-01", user_id=user_id))
+        db.commit()
+
+        assert db.query(User).filter(User.id == user_id).count() == 1
+        assert db.query(func.sum(Expense.amount)).filter(Expense.user_id == user_id).scalar() == 10.0
+        assert len(db.execute(queries.expense_rows(user_id)).all()) == 1
+        db.close()
+
+        shard_engine = router.engine_for(user_id)
+        with shard_engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM expenses")).scalar() == 1
+        with router.directory_engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM expenses")).scalar() == 0
+
+    def test_core_statements_route_to_shard(self, router):
+        """Test that Core statements built on Table objects follow the session's shard"""
+        user_id = add_user(router, "core@example.com")
+        db = SessionLocal(bind=router.directory_engine)
+        route_session(db, user_id)
+        expenses = Expense.__table__
+
+        db.execute(expenses.insert().values(amount=3.0, description="core", category="food",
+                                            date="2024-01-01", user_id=user_id))
+        db.commit()
+
+        assert db.execute(select(func.count()).select_from(expenses)).scalar() == 1
+        assert db.execute(select(User.__table__.c.id)).scalars().all() == [user_id]
+        db.close()
+        with router.directory_engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM expenses")).scalar() == 0
+
+    def test_budget_rollover_runs_in_shard(self, router, monkeypatch):
+        """Test that the lazy budget rollover updates the budget in the user's shard"""
+        monkeypatch.setattr(budget_periods, "_rolled", {})
+        user_id = add_user(router, "budget@example.com")
+        db = SessionLocal(bind=router.directory_engine)
+        route_session(db, user_id)
+        db.add(Budget(name="Місяць", amount=100.0, period="monthly", start_date="2024-01-01",
+                      end_date="2024-01-31", is_active=True, user_id=user_id))
+        db.commit()
+
+        assert budget_periods.ensure_current(db, user_id, date(2024, 3, 10)) == 1
+        db.close()
+        with router.engine_for(user_id).connect() as conn:
+            window = conn.execute(text("SELECT start_date, end_date FROM budgets")).one()
+        assert tuple(window) == ("2024-03-01", "2024-03-31")
+
+    def test_migrate_existing_users(self, router, monkeypatch):
+        """Test that rows written before sharding was enabled are moved out of the directory"""
+        monkeypatch.setattr(database, "init_shards", lambda: None)
+        user_id = add_user(router, "legacy@example.com")
+        db = SessionLocal(bind=router.directory_engine)
+        db.add(Expense(amount=7.0, description="до шардування", category="food", date="2024-01-01", user_id=user_id))
+        db.commit()
+        db.close()
+
+        assert utils.migrate_to_shards() > 1
+        with router.directory_engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM expenses")).scalar() == 0
+            assert conn.execute(text("SELECT COUNT(*) FROM users")).scalar() == 1
+        with router.engine_for(user_id).connect() as conn:
+            assert conn.execute(text("SELECT description FROM expenses")).scalars().all() == ["до шардування"]
+        assert utils.migrate_to_shards() == 0
+
+    def test_group_commit_is_routed(self, router):
+        """Test that queued inserts go to the shard and are fenced like request sessions"""
+        user_id = add_user(router, "queue@example.com")
+        shard = router.shard_for(user_id)
+        values = dict(amount=4.0, description="черга", category="food", date="2024-01-01", user_id=user_id)
+
+        stored = GroupCommitQueue(router.engines[shard], max_delay=0.01).submit(Expense, values).result(timeout=10)
+        stale = GroupCommitQueue(router.engines[(shard + 1) % 3], max_delay=0.01).submit(Expense, values)
+
+        with pytest.raises(UserMoving):
+            stale.result(timeout=10)
+        with router.engines[shard].connect() as conn:
+            assert conn.execute(text("SELECT id FROM expenses")).scalars().all() == [stored.id]
+            assert conn.execute(text("SELECT COUNT(*) FROM daily_rollups")).scalar() == 1
+        with router.directory_engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM daily_rollups")).scalar() == 0
+
+    def test_fan_out_covers_all_shards(self, router):
+        """Test that fan-out runs on every shard"""
+        results = router.fan_out(lambda db: db.query(Expense).count())
+        assert results == [0, 0, 0]
+
+    def test_move_user_to_shard(self, router):
+        """Test that rebalancing moves rows and remaps category references"""
+        user_id = add_user(router, "c@example.com")
+        db = SessionLocal(bind=router.directory_engine)
+        route_session(db, user_id)
+        category = Category(name="Custom", user_id=user_id, is_default=False)
+        db.add(category)
+        db.flush()
+        db.add(Category(name="Sub", user_id=user_id, is_default=False, parent_id=category.id))
+        db.add(Expense(amount=5.0, description="y", category="Custom", category_id=category.id,
+                       date="2024-01-02", user_id=user_id))
+        db.commit()
+        db.close()
+
+        source = router.shard_for(user_id)
+        target = (source + 1) % 3
+        moved = utils.move_user_to_shard(user_id, target)
+
+        assert moved >= 2
+        assert router.shard_for(user_id) == target
+        with router.engines[source].connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM expenses")).scalar() == 0
+            assert conn.execute(text("SELECT COUNT(*) FROM category_closure")).scalar() == 0
+        with router.engines[target].connect() as conn:
+            category_id = conn.execute(text("SELECT id FROM categories WHERE name = 'Custom'")).scalar()
+            sub_id = conn.execute(text("SELECT id FROM categories WHERE name = 'Sub'")).scalar()
+            expense_category = conn.execute(text("SELECT category_id FROM expenses")).scalar()
+            closure = set(conn.execute(text("SELECT ancestor_id, descendant_id, depth FROM category_closure")).all())
+        assert expense_category == category_id
+        assert closure == {(category_id, category_id, 0), (sub_id, sub_id, 0), (category_id, sub_id, 1)}
+        with router.directory_engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM category_closure")).scalar() == 0
+
+    def test_move_remaps_expense_references(self, router):
+        """Test that duplicate_of and recurring_rule_id point at the moved rows"""
+        user_id = add_user(router, "refs@example.com")
+        source = router.shard_for(user_id)
+        target = (source + 1) % 3
+        # Зайняті id у цільовому шарді, щоб нові ключі відрізнялись від старих
+        with router.engines[target].begin() as conn:
+            conn.execute(text("INSERT INTO expenses (amount, user_id) VALUES (1, 999), (2, 999)"))
+            conn.execute(text(
+                "INSERT INTO recurring_rules (user_id, amount, rule, start_date, is_active) "
+                "VALUES (999, 1, 'FREQ=DAILY', '2024-01-01', 1)"
+            ))
+        db = route_session(SessionLocal(bind=router.directory_engine), user_id)
+        rule = RecurringRule(user_id=user_id, amount=5.0, rule="FREQ=MONTHLY", start_date="2024-01-02")
+        db.add(rule)
+        db.flush()
+        original = Expense(amount=5.0, description="y", category="food", date="2024-01-02", user_id=user_id,
+                           recurring_rule_id=rule.id)
+        db.add(original)
+        db.flush()
+        db.add(Expense(amount=5.0, description="y", category="food", date="2024-01-02", user_id=user_id,
+                       duplicate_of=original.id))
+        db.commit()
+        db.close()
+
+        utils.move_user_to_shard(user_id, target)
+
+        with router.engines[target].connect() as conn:
+            rows = conn.execute(text(
+                "SELECT id, duplicate_of, recurring_rule_id FROM expenses WHERE user_id = :u ORDER BY id"
+            ), {"u": user_id}).all()
+            rule_id = conn.execute(text("SELECT id FROM recurring_rules WHERE user_id = :u"), {"u": user_id}).scalar()
+        assert rows[1].duplicate_of == rows[0].id
+        assert rows[0].recurring_rule_id == rule_id
+
+    def test_write_during_move_is_not_lost(self, router):
+        """Test that a write racing a shard move is rolled back instead of landing in the old shard"""
+        user_id = add_user(router, "d@example.com")
+        writer = SessionLocal(bind=router.directory_engine)
+        route_session(writer, user_id)
+        writer.add(Expense(amount=1.0, description="до переносу", category="food", date="2024-01-01", user_id=user_id))
+        writer.commit()
+
+        source = router.shard_for(user_id)
+        target = (source + 1) % 3
+        outcome = []
+
+        def write():
+            # Сесія маршрутизована до переносу і пише в старий шард
+            try:
+                writer.add(Expense(amount=2.0, description="під час переносу", category="food",
+                                   date="2024-01-02", user_id=user_id))
+                writer.commit()
+                outcome.append("committed")
+            except (UserMoving, OperationalError) as e:
+                writer.rollback()
+                outcome.append(type(e))
+
+        thread = threading.Thread(target=write)
+        copying = []
+
+        @event.listens_for(router.engines[target], "before_cursor_execute")
+        def during_copy(*args):
+            if not copying:
+                copying.append(True)
+                with pytest.raises(UserMoving):
+                    router.shard_for(user_id)
+                thread.start()
+
+        utils.move_user_to_shard(user_id, target)
+        thread.join()
+        writer.close()
+
+        assert outcome and outcome[0] != "committed"
+        assert router.shard_for(user_id) == target
+        with router.engines[source].connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM expenses")).scalar() == 0
+        with router.engines[target].connect() as conn:
+            assert conn.execute(text("SELECT description FROM expenses")).scalars().all() == ["до переносу"]
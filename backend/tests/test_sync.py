@@ -0,0 +1,111 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+import changefeed
+from database import upgrade_schema
+
+
+def add_expense(client, headers, amount=10.0, description="Кава"):
+    return client.post(
+        "/api/expenses/",
+        json={"amount": amount, "description": description, "category": "food", "date": "2024-01-15"},
+        headers=headers
+    ).json()
+
+
+class TestSync:
+
+    def test_full_then_empty_delta(self, client, auth_headers):
+        """Test that a second sync with the returned cursor is empty"""
+        expense = add_expense(client, auth_headers)
+        client.post("/api/categories/", json={"name": "Pets"}, headers=auth_headers)
+
+        first = client.get("/api/sync/", headers=auth_headers).json()
+        second = client.get(f"/api/sync/?since={first['cursor']}", headers=auth_headers).json()
+
+        assert [row["id"] for row in first["expenses"]] == [expense["id"]]
+        assert "Pets" in [row["name"] for row in first["categories"]]
+        assert first["reset"] is False
+        assert second["expenses"] == [] and second["categories"] == []
+        assert second["cursor"] == first["cursor"]
+
+    def test_update_and_delete(self, client, auth_headers):
+        """Test that only changed rows and tombstones come after the cursor"""
+        kept = add_expense(client, auth_headers, description="Хліб")
+        removed = add_expense(client, auth_headers, description="Таксі")
+        cursor = client.get("/api/sync/", headers=auth_headers).json()["cursor"]
+
+        client.put(f"/api/expenses/{kept['id']}", json={**kept, "amount": 99.0}, headers=auth_headers)
+        client.delete(f"/api/expenses/{removed['id']}", headers=auth_headers)
+        delta = client.get(f"/api/sync/?since={cursor}", headers=auth_headers).json()
+
+        assert [(row["id"], row["amount"]) for row in delta["expenses"]] == [(kept["id"], 99.0)]
+        assert delta["deleted"]["expenses"] == [removed["id"]]
+        assert delta["cursor"] > cursor
+
+    def test_pagination_does_not_skip_changes(self, client, auth_headers, test_budget_data):
+        """Test paging across entity types with a small limit"""
+        ids = [add_expense(client, auth_headers, amount=i + 1)["id"] for i in range(5)]
+        client.post("/api/budgets/", json=test_budget_data, headers=auth_headers)
+
+        seen, budgets, cursor, pages = [], 0, 0, 0
+        while True:
+            page = client.get(f"/api/sync/?since={cursor}&limit=2", headers=auth_headers).json()
+            seen += [row["id"] for row in page["expenses"]]
+            budgets += len(page["budgets"])
+            cursor = page["cursor"]
+            pages += 1
+            if not page["has_more"]:
+                break
+
+        assert sorted(seen) == ids
+        assert budgets == 1
+        assert pages >= 3
+
+    def test_stale_cursor_forces_reset(self, client, auth_headers):
+        """Test that a cursor ahead of the database triggers a full resync"""
+        add_expense(client, auth_headers)
+
+        data = client.get("/api/sync/?since=1000000", headers=auth_headers).json()
+
+        assert data["reset"] is True
+        assert len(data["expenses"]) == 1
+
+    def test_reset_tombstone(self, client, auth_headers, db_session):
+        """Test that a reset marker (shard move) makes clients resync from zero"""
+        add_expense(client, auth_headers)
+        cursor = client.get("/api/sync/", headers=auth_headers).json()["cursor"]
+        user_id = client.get("/api/auth/me", headers=auth_headers).json()["id"]
+
+        changefeed.mark_reset(db_session, user_id)
+        db_session.commit()
+        data = client.get(f"/api/sync/?since={cursor}", headers=auth_headers).json()
+
+        assert data["reset"] is True
+        assert len(data["expenses"]) == 1
+
+
+class TestUpgradeSchema:
+
+    def test_adds_missing_columns_and_stamps_rows(self, tmp_path):
+        """Test migrating a database created before change_seq existed"""
+        engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE expenses (id INTEGER PRIMARY KEY, amount FLOAT, description VARCHAR, "
+                "category VARCHAR, date VARCHAR, user_id INTEGER)"
+            ))
+            conn.execute(text(
+                "INSERT INTO expenses (amount, description, category, date, user_id) "
+                "VALUES (1.0, 'a', 'food', '2024-01-01', 1), (2.0, 'b', 'food', '2024-01-02', 1)"
+            ))
+
+        upgrade_schema(engine)
+        changefeed.stamp_unsequenced(engine)
+
+        with engine.connect() as conn:
+            seqs = conn.execute(text("SELECT change_seq FROM expenses ORDER BY id")).scalars().all()
+            indexes = [row[1] for row in conn.execute(text("PRAGMA index_list(expenses)"))]
+            assert changefeed.last_seq(conn) == 2
+        assert seqs == [1, 2]
+        assert "ix_expenses_user_change_seq" in indexes
@@ -0,0 +1,84 @@
+import pytest
+from datetime import date
+
+import timeseries
+
+
+def add_expense(client, headers, amount, day, category="food"):
+    client.post(
+        "/api/expenses/",
+        json={"amount": amount, "description": "x", "category": category, "date": day},
+        headers=headers
+    )
+
+
+class TestBucketize:
+
+    @pytest.mark.parametrize("granularity, buckets, totals", [
+        ("day", ["2024-01-30", "2024-01-31", "2024-02-01"], [5.0, 0.0, 7.0]),
+        ("week", ["2024-01-29"], [12.0]),
+        ("month", ["2024-01", "2024-02"], [5.0, 7.0]),
+        ("quarter", ["2024-Q1"], [12.0]),
+        ("year", ["2024"], [12.0]),
+    ])
+    def test_granularities(self, granularity, buckets, totals):
+        """Test bucket labels and gap filling for every granularity"""
+        data = timeseries.bucketize(
+            ["2024-01-30", "2024-02-01"], [5.0, 7.0], [1, 2],
+            date(2024, 1, 30), date(2024, 2, 1), granularity
+        )
+
+        assert data["buckets"] == buckets
+        assert data["totals"] == totals
+        assert sum(data["counts"]) == 3
+
+    def test_quarter_labels_span_years(self):
+        """Test quarter buckets across a year boundary"""
+        data = timeseries.bucketize([], [], [], date(2023, 11, 5), date(2024, 4, 1), "quarter")
+
+        assert data["buckets"] == ["2023-Q4", "2024-Q1", "2024-Q2"]
+        assert data["totals"] == [0.0, 0.0, 0.0]
+
+    def test_bucket_limit(self):
+        """Test that oversized ranges are rejected"""
+        with pytest.raises(ValueError):
+            timeseries.bucketize([], [], [], date(1990, 1, 1), date(2024, 1, 1), "day")
+
+
+class TestTimeseriesEndpoint:
+
+    def test_parallel_arrays_with_gaps(self, client, auth_headers):
+        """Test month buckets with an empty month in the middle"""
+        add_expense(client, auth_headers, 10.0, "2024-01-15")
+        add_expense(client, auth_headers, 5.0, "2024-03-02")
+        add_expense(client, auth_headers, 2.5, "2024-03-20", category="transport")
+
+        data = client.get(
+            "/api/analytics/timeseries?granularity=month&start=2024-01-01&end=2024-03-31",
+            headers=auth_headers
+        ).json()
+
+        assert data["buckets"] == ["2024-01", "2024-02", "2024-03"]
+        assert data["totals"] == [10.0, 0.0, 7.5]
+        assert data["counts"] == [1, 0, 2]
+
+    def test_category_filter_and_default_start(self, client, auth_headers):
+        """Test the category filter and a start taken from the first expense"""
+        add_expense(client, auth_headers, 10.0, "2024-01-15")
+        add_expense(client, auth_headers, 4.0, "2024-01-16", category="transport")
+
+        data = client.get(
+            "/api/analytics/timeseries?granularity=day&end=2024-01-17&category=transport",
+            headers=auth_headers
+        ).json()
+
+        assert data["start"] == "2024-01-15"
+        assert data["totals"] == [0.0, 4.0, 0.0]
+
+    def test_invalid_requests(self, client, auth_headers):
+        """Test validation of granularity and date order"""
+        bad_granularity = client.get("/api/analytics/timeseries?granularity=hour", headers=auth_headers)
+        bad_range = client.get("/api/analytics/timeseries?start=2024-02-01&end=2024-01-01", headers=auth_headers)
+
+        assert bad_granularity.status_code == 422
+        assert bad_range.status_code == 400
@@ -0,0 +1,79 @@
+import pytest
+
+import versions
+from models import CollectionVersion
+
+
+class TestConditionalCollections:
+
+    def test_etag_and_not_modified(self, client, auth_headers, test_expense_data):
+        """Test that an unchanged collection answers 304"""
+        client.post("/api/expenses/", json=test_expense_data, headers=auth_headers)
+
+        first = client.get("/api/expenses/", headers=auth_headers)
+        etag = first.headers["etag"]
+        second = client.get("/api/expenses/", headers={**auth_headers, "If-None-Match": etag})
+
+        assert first.status_code == 200
+        assert second.status_code == 304
+        assert second.headers["etag"] == etag
+        assert second.content == b""
+
+    def test_write_bumps_version(self, client, auth_headers, test_expense_data):
+        """Test that a write to the collection invalidates the ETag"""
+        etag = client.get("/api/expenses/", headers=auth_headers).headers["etag"]
+        client.post("/api/expenses/", json=test_expense_data, headers=auth_headers)
+
+        response = client.get("/api/expenses/", headers={**auth_headers, "If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert len(response.json()) == 1
+
+    def test_other_collection_write_keeps_etag(self, client, auth_headers, test_budget_data):
+        """Test that versions are tracked per collection"""
+        etag = client.get("/api/goals/", headers=auth_headers).headers["etag"]
+        client.post("/api/budgets/", json=test_budget_data, headers=auth_headers)
+
+        response = client.get("/api/goals/", headers={**auth_headers, "If-None-Match": etag})
+
+        assert response.status_code == 304
+
+    def test_query_parameters_change_etag(self, client, auth_headers):
+        """Test that filtered views get their own ETag"""
+        plain = client.get("/api/expenses/", headers=auth_headers).headers["etag"]
+        filtered = client.get("/api/expenses/?category=food", headers=auth_headers).headers["etag"]
+
+        assert plain != filtered
+
+    def test_update_and_delete_bump_version(self, client, auth_headers, db_session):
+        """Test that updates and deletes are versioned too"""
+        created = client.post("/api/categories/", json={"name": "Pets"}, headers=auth_headers).json()
+        version_after_create = db_session.query(CollectionVersion).filter_by(collection="categories").one().version
+
+        client.put(f"/api/categories/{created['id']}", json={"name": "Pets & Vet"}, headers=auth_headers)
+        client.delete(f"/api/categories/{created['id']}", headers=auth_headers)
+        db_session.expire_all()
+
+        version = db_session.query(CollectionVersion).filter_by(collection="categories").one().version
+        assert version == version_after_create + 2
+
+    def test_hit_rate_counters(self, client, auth_headers):
+        """Test that hit-rate counters are exposed in metrics"""
+        etag = client.get("/api/budgets/", headers=auth_headers).headers["etag"]
+        client.get("/api/budgets/", headers={**auth_headers, "If-None-Match": etag})
+
+        data = client.get("/api/health/metrics").json()["etag"]["budgets"]
+        assert data["not_modified"] >= 1
+        assert 0 < data["hit_rate"] <= 1
+
+
+class TestMatching:
+
+    def test_weak_comparison(self):
+        """Test that weakened (compressed) ETags still match"""
+        assert versions.matches('W/"a-1-2-0"', '"a-1-2-0"')
+        assert versions.matches('"x", "a-1-2-0"', '"a-1-2-0"')
+        assert versions.matches("*", '"a-1-2-0"')
+        assert not versions.matches('"a-1-3-0"', '"a-1-2-0"')
+        assert not versions.matches(None, '"a-1-2-0"')
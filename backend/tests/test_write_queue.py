@@ -0,0 +1,76 @@
+import pytest
+from concurrent.futures import wait
+from sqlalchemy import create_engine, text
+
+from database import Base
+from models import Expense
+from write_queue import GroupCommitQueue
+
+
+@pytest.fixture
+def queue_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/queue.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def expense_values(i):
+    return dict(amount=10.0 + i, description=f"Item {i}", category="food", date="2024-01-15", user_id=1)
+
+
+class TestGroupCommitQueue:
+
+    def test_concurrent_inserts_share_commits(self, queue_engine):
+        """Test that many submitted rows are committed in fewer transactions"""
+        queue = GroupCommitQueue(queue_engine, max_delay=0.05, max_batch=20)
+        futures = [queue.submit(Expense, expense_values(i)) for i in range(50)]
+        wait(futures, timeout=10)
+
+        ids = [future.result().id for future in futures]
+        assert len(set(ids)) == 50
+        assert queue.rows == 50
+        assert queue.batches < 50
+        assert queue.stats()["max_batch_size"] <= 20
+
+        with queue_engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM expenses")).scalar() == 50
+
+    def test_failing_row_gets_its_own_error(self, queue_engine):
+        """Test that one bad row does not fail the other rows of its batch"""
+        queue = GroupCommitQueue(queue_engine, max_delay=0.05, max_batch=10)
+        good = queue.submit(Expense, expense_values(1))
+        bad = queue.submit(Expense, {"amount": 1.0, "no_such_column": "x"})
+        also_good = queue.submit(Expense, expense_values(2))
+        wait([good, bad, also_good], timeout=10)
+
+        assert good.result().id is not None
+        assert also_good.result().id is not None
+        with pytest.raises(TypeError):
+            bad.result()
+        assert queue.failed_rows == 1
+
+    def test_stats_shape(self, queue_engine):
+        """Test that metrics expose batch size and commit latency"""
+        queue = GroupCommitQueue(queue_engine, max_delay=0.01, max_batch=5)
+        queue.submit(Expense, expense_values(1)).result(timeout=10)
+
+        stats = queue.stats()
+        assert stats["batches"] == 1
+        assert stats["avg_batch_size"] == 1
+        assert stats["commit_latency_ms"]["avg"] >= 0
+
+
+class TestGroupCommitEndpoint:
+
+    def test_create_expense_through_queue(self, client, auth_headers, test_expense_data, monkeypatch):
+        """Test that the expense endpoint returns ids when group commit is on"""
+        import write_queue
+        monkeypatch.setattr(write_queue, "GROUP_COMMIT_ENABLED", True)
+
+        response = client.post("/api/expenses/", json=test_expense_data, headers=auth_headers)
+
+        assert response.status_code == 201
+        expense_id = response.json()["id"]
+        fetched = client.get(f"/api/expenses/{expense_id}", headers=auth_headers)
+        assert fetched.status_code == 200
+        assert fetched.json()["amount"] == test_expense_data["amount"]
@@ -0,0 +1,95 @@
+from datetime import date
+
+import numpy as np
+from sqlalchemy import select, func, bindparam
+
+from models import DailyRollup
+
+GRANULARITIES = ("day", "week", "month", "quarter", "year")
+# Захист від випадкових запитів на кшталт day за 100 років
+MAX_BUCKETS = 5000
+
+_daily = select(
+    DailyRollup.day,
+    func.sum(DailyRollup.total).label("total"),
+    func.sum(DailyRollup.count).label("count")
+).where(
+    DailyRollup.user_id == bindparam("user_id"),
+    DailyRollup.day >= bindparam("start"),
+    DailyRollup.day <= bindparam("end")
+).group_by(DailyRollup.day)
+
+_first_day = select(func.min(DailyRollup.day)).where(DailyRollup.user_id == bindparam("user_id"))
+
+
+def bucket_ordinals(days, granularity):
+    """Порядковий номер відрізка для кожного дня (datetime64[D])"""
+    if granularity == "day":
+        return days.astype(np.int64)
+    if granularity == "week":
+        # 1970-01-01 — четвер; +3 зсуває початок тижня на понеділок (ISO)
+        return (days.astype(np.int64) + 3) // 7
+    months = days.astype("datetime64[M]").astype(np.int64)
+    if granularity == "month":
+        return months
+    if granularity == "quarter":
+        return months // 3
+    return days.astype("datetime64[Y]").astype(np.int64)
+
+
+def bucket_labels(ordinals, granularity):
+    if granularity == "day":
+        return np.datetime_as_string(ordinals.astype("datetime64[D]")).tolist()
+    if granularity == "week":
+        return np.datetime_as_string((ordinals * 7 - 3).astype("datetime64[D]")).tolist()
+    if granularity == "month":
+        return np.datetime_as_string(ordinals.astype("datetime64[M]")).tolist()
+    if granularity == "quarter":
+        return [f"{1970 + q // 4}-Q{q % 4 + 1}" for q in ordinals.tolist()]
+    return np.datetime_as_string(ordinals.astype("datetime64[Y]")).tolist()
+
+
+def bucketize(days, totals, counts, start, end, granularity):
+    """Суми по відрізках від start до end включно, порожні відрізки — нулі"""
+    first, last = bucket_ordinals(np.array([start, end], dtype="datetime64[D]"), granularity)
+    size = int(last - first) + 1
+    if size > MAX_BUCKETS:
+        raise ValueError(f"Забагато відрізків ({size}), максимум {MAX_BUCKETS}")
+
+    index = bucket_ordinals(np.asarray(days, dtype="datetime64[D]"), granularity) - first
+    bucket_totals = np.bincount(index, weights=np.asarray(totals, dtype=float), minlength=size)
+    bucket_counts = np.bincount(index, weights=np.asarray(counts, dtype=float), minlength=size)
+    return {
+        "buckets": bucket_labels(np.arange(first, last + 1), granularity),
+        "totals": np.round(bucket_totals, 2).tolist(),
+        "counts": bucket_counts.astype(np.int64).tolist()
+    }
+
+
+def resolve_range(db, user_id, start=None, end=None):
+    """Період запиту: за замовчуванням від першого дня з витратами до сьогодні"""
+    end = end or date.today()
+    if start is None:
+        first_day = db.execute(_first_day, {"user_id": user_id}).scalar()
+        start = date.fromisoformat(first_day) if first_day else end
+    if start > end:
+        raise ValueError("start не може бути пізніше за end")
+    return start, end
+
+
+def series(db, user_id, granularity="month", start=None, end=None, category=None):
+    """Часовий ряд витрат користувача з денних підсумків"""
+    start, end = resolve_range(db, user_id, start, end)
+
+    stmt = _daily
+    if category:
+        stmt = stmt.where(DailyRollup.category == category)
+    rows = db.execute(stmt, {"user_id": user_id, "start": start.isoformat(), "end": end.isoformat()}).all()
+
+    result = bucketize(
+        [row.day for row in rows],
+        [row.total for row in rows],
+        [row.count for row in rows],
+        start, end, granularity
+    )
+    return {"granularity": granularity, "start": start.isoformat(), "end": end.isoformat(), **result}
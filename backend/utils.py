@@ -79,6 +79,12 @@ def seed_database():
         
         conn.commit()
         print(f"✅ Додано {len(default_categories)} стандартних категорій")
+
+        # Категорії додано напряму в SQLite, тож замикання дерева будується окремо
+        from database import engine
+        import category_tree
+        with engine.begin() as tree_conn:
+            category_tree.rebuild(tree_conn)
         
 
         cursor.execute("SELECT name, icon FROM categories WHERE is_default = 1;")
@@ -272,6 +278,10 @@ def create_realistic_test_data():
         conn.commit()
         conn.close()
         
+        # Витрати вставлені напряму, повз ORM-хуки, тож підсумки й ескізи перераховуються
+        rebuild_rollups()
+        rebuild_sketches()
+        
         print("✅ Реалістичні тестові дані створено!")
         print(f"👥 Користувачів: {len(test_users)}")
         print(f"💰 Витрат: {sum(len(expenses) for expenses in realistic_expenses.values())}")
@@ -307,6 +317,334 @@ def reset_database():
     except Exception as e:
         print(f"❌ Помилка при очищенні БД: {e}")
 
+def rebuild_rollups(user_id=None):
+    """Перерахувати денні підсумки і поточну статистику витрат на всіх шардах"""
+    from database import engine, shard_router
+    import rollups
+    import running_stats
+
+    engines = shard_router.engines if shard_router.enabled else [engine]
+    for bind in engines:
+        with bind.begin() as conn:
+            rollups.rebuild(conn, user_id)
+            running_stats.rebuild(conn, user_id)
+    print(f"✅ Денні підсумки і статистику перераховано ({len(engines)} БД)")
+
+def rebuild_sketches(user_id=None):
+    """Перебудувати ескізи квантилів витрат з історії на всіх шардах"""
+    from database import engine, shard_router
+    import sketches
+
+    engines = shard_router.engines if shard_router.enabled else [engine]
+    rebuilt = 0
+    for bind in engines:
+        with bind.begin() as conn:
+            rebuilt += sketches.rebuild_all(conn, user_id)
+    print(f"✅ Перебудовано ескізів: {rebuilt} ({len(engines)} БД)")
+
+def refit_forecasts(workers=None):
+    """Перенавчити моделі прогнозу всіх користувачів у пулі процесів"""
+    import time
+    from sqlalchemy import text
+    from database import engine
+    import forecasts
+
+    with engine.connect() as conn:
+        user_ids = [row[0] for row in conn.execute(text("SELECT id FROM users ORDER BY id"))]
+    started = time.perf_counter()
+    fitted = forecasts.refit_all(user_ids, workers)
+    print(f"✅ Моделі прогнозу перенавчено: {fitted} користувачів за {time.perf_counter() - started:.1f} с")
+
+def train_categorizer(user_id=None):
+    """Навчити модель категоризації користувача або глобальну (з усіх шардів)"""
+    from database import SessionLocal, shard_router, route_session
+    import categorizer
+
+    if user_id is not None:
+        db = route_session(SessionLocal(), user_id)
+        try:
+            samples = categorizer.train(db, user_id)
+        finally:
+            db.close()
+    else:
+        rows = [row for shard_rows in shard_router.fan_out(categorizer.labelled_rows) for row in shard_rows]
+        samples = categorizer.train(None, rows=rows[:categorizer.MAX_TRAINING_ROWS])
+    if samples:
+        print(f"✅ Модель категоризації навчено на {samples} витратах: {categorizer.model_path(user_id)}")
+    else:
+        print("⚠️ Замало витрат з різними категоріями для навчання")
+
+def dedup_expenses(delete=False, user_id=None):
+    """Знайти дублікати серед уже записаних витрат і позначити (або видалити) їх
+
+    Зміни йдуть через ORM-сесію, тож підсумки, статистика, журнал змін
+    і версії для ETag оновлюються так само, як при звичайних записах.
+    """
+    from sqlalchemy import select
+    from database import engine, shard_router, SessionLocal
+    from models import Expense
+    import duplicates
+
+    engines = shard_router.engines if shard_router.enabled else [engine]
+    total = 0
+    for bind in engines:
+        duplicates.backfill(bind)
+        with bind.connect() as conn:
+            groups = duplicates.duplicate_groups(conn, user_id)
+        original_of = {duplicate: original for _, original, ids in groups for duplicate in ids}
+        pending = sorted(original_of)
+        total += len(pending)
+
+        db = SessionLocal(bind=bind)
+        try:
+            for offset in range(0, len(pending), 500):
+                chunk = pending[offset:offset + 500]
+                for expense in db.scalars(select(Expense).where(Expense.id.in_(chunk))):
+                    if delete:
+                        db.delete(expense)
+                    else:
+                        expense.duplicate_of = original_of[expense.id]
+                db.commit()
+        finally:
+            db.close()
+    action = "видалено" if delete else "позначено"
+    print(f"✅ Дублікатів витрат {action}: {total} ({len(engines)} БД)")
+    return total
+
+def materialize_recurring():
+    """Записати регулярні витрати, що вже настали, для всіх користувачів"""
+    from database import engine, shard_router
+    import recurring
+
+    engines = shard_router.engines if shard_router.enabled else [engine]
+    total = sum(recurring.materialize_due(bind) for bind in engines)
+    print(f"✅ Записано регулярних витрат: {total} ({len(engines)} БД)")
+    return total
+
+def rollover_budgets():
+    """Перенести бюджети всіх користувачів, вікно яких минуло, у поточне вікно періоду"""
+    from database import engine, shard_router
+    import budget_periods
+
+    engines = shard_router.engines if shard_router.enabled else [engine]
+    total = sum(budget_periods.rollover_due(bind) for bind in engines)
+    print(f"✅ Перенесено бюджетів у нове вікно: {total} ({len(engines)} БД)")
+    return total
+
+def load_fx_rates(path):
+    """Завантажити курси валют з CSV (currency,date,rate) і перерахувати зачеплені підсумки"""
+    from database import engine, shard_router
+    import fx
+
+    engines = shard_router.engines if shard_router.enabled else [engine]
+    affected = fx.load_file(engines, path)
+    print(f"✅ Курси завантажено, перераховано підсумки {affected} користувачів ({len(engines)} БД)")
+    return affected
+
+def _user_tables():
+    """Таблиці з даними користувача (мають колонку user_id і живуть у шардах)"""
+    from database import Base, DIRECTORY_TABLES
+    import models  # noqa: F401 - реєстрація моделей у metadata
+    return [
+        table for table in Base.metadata.sorted_tables
+        if table.name not in DIRECTORY_TABLES and "user_id" in table.c
+    ]
+
+# Надгробки посилаються на id рядків старого шарду, тож не переносяться:
+# клієнти отримують надгробок скидання і синхронізуються з нуля
+_NOT_MOVED_TABLES = {"tombstones"}
+
+def move_user_to_shard(user_id, target_shard):
+    """Перенести всі дані користувача в інший шард
+
+    Рядки копіюються з новими первинними ключами (посилання між таблицями
+    перераховуються), потім дані видаляються зі старого шарду і користувач
+    перепризначається. На час переносу користувач позначений як moving (нові
+    запити отримують 503), а старий шард тримає блокування запису від
+    копіювання до видалення: запис, що почався раніше, встигає потрапити в
+    копію, а пізніший відкочується (див. database._fence_stale_routing).
+    """
+    from database import shard_router
+
+    source_shard = shard_router.shard_for(user_id)
+    if source_shard == target_shard:
+        return 0
+
+    shard_router.begin_move(user_id)
+    try:
+        moved = _move_user_rows(user_id, shard_router.engines[source_shard], shard_router.engines[target_shard])
+    except BaseException:
+        shard_router.assign(user_id, source_shard)
+        raise
+    shard_router.assign(user_id, target_shard)
+    return moved
+
+def migrate_to_shards():
+    """Перенести дані наявних користувачів з data.db у їхні шарди
+
+    Після ввімкнення шардування (SPENDIO_SHARDS > 1) рядки, записані раніше,
+    лишаються в головній базі, яку запити вже не читають. Команду запускають
+    один раз після зміни SPENDIO_SHARDS, до старту сервера; користувачі, що
+    вже мають витрати у своєму шарді, пропускаються.
+    """
+    from sqlalchemy import select, union, text
+    from database import shard_router, init_shards
+
+    if not shard_router.enabled:
+        print("Шардування вимкнене (SPENDIO_SHARDS <= 1)")
+        return 0
+
+    init_shards()
+    directory = shard_router.directory_engine
+    with directory.connect() as conn:
+        user_ids = sorted(conn.execute(union(*(
+            select(table.c.user_id).where(table.c.user_id.is_not(None)) for table in _user_tables()
+        ))).scalars())
+
+    moved = 0
+    for user_id in user_ids:
+        shard = shard_router.shard_for(user_id)
+        target = shard_router.engines[shard]
+        with target.connect() as conn:
+            occupied = conn.execute(
+                text("SELECT 1 FROM expenses WHERE user_id = :u LIMIT 1"), {"u": user_id}
+            ).first() is not None
+        if occupied:
+            print(f"  ⚠️ {user_id}: у шарді {shard} вже є витрати, дані в data.db лишаються")
+            continue
+        shard_router.begin_move(user_id)
+        try:
+            moved += _move_user_rows(user_id, directory, target)
+        finally:
+            shard_router.assign(user_id, shard)
+        print(f"  👤 {user_id}: data.db → шард {shard}")
+
+    print(f"✅ Перенесено рядків у шарди: {moved} ({len(user_ids)} користувачів)")
+    return moved
+
+def _move_user_rows(user_id, source, target):
+    """Скопіювати дані користувача з source у target і видалити їх із source"""
+    from sqlalchemy import delete, text
+    import category_tree
+    import changefeed
+
+    tables = _user_tables()
+    with source.connect() as src:
+        src.exec_driver_sql("BEGIN IMMEDIATE")
+        with target.begin() as dst:
+            moved = _copy_user_rows(src, dst, user_id, tables)
+            # Ідентифікатори змінились: версії колекцій мають інвалідувати ETag клієнтів
+            dst.execute(
+                text("UPDATE collection_versions SET version = version + 1 WHERE user_id = :u"),
+                {"u": user_id}
+            )
+            changefeed.mark_reset(dst, user_id, floor=changefeed.last_seq(src))
+            # Замикання категорій не має user_id: рядки перебудовуються з нових id
+            category_tree.rebuild(dst, user_id)
+        category_tree.drop_user(src, user_id)
+        for table in reversed(tables):
+            src.execute(delete(table).where(table.c.user_id == user_id))
+        src.commit()
+    return moved
+
+def _copy_user_rows(src, dst, user_id, tables):
+    """Скопіювати рядки користувача з src у dst з новими ключами; повертає їх кількість"""
+    from sqlalchemy import select
+
+    id_maps = {}
+    moved = 0
+    for table in tables:
+        if table.name in _NOT_MOVED_TABLES:
+            continue
+        rows = [dict(row) for row in src.execute(
+            select(table).where(table.c.user_id == user_id)
+        ).mappings()]
+        if not rows:
+            continue
+
+        has_serial_id = "id" in table.c and list(table.primary_key.columns) == [table.c.id]
+        self_refs = [
+            col.name for col in table.c
+            for fk in col.foreign_keys if fk.column.table is table
+        ]
+        id_map = id_maps.setdefault(table.name, {})
+
+        for row in rows:
+            for col in table.c:
+                for fk in col.foreign_keys:
+                    ref_map = id_maps.get(fk.column.table.name)
+                    if ref_map and row[col.name] in ref_map and fk.column.table is not table:
+                        row[col.name] = ref_map[row[col.name]]
+            old_id = row.pop("id") if has_serial_id else None
+            pending_refs = {name: row.pop(name) for name in self_refs}
+            result = dst.execute(table.insert().values(**row, **{name: None for name in pending_refs}))
+            if has_serial_id:
+                id_map[old_id] = result.inserted_primary_key[0]
+            row["_pending_refs"] = (old_id, pending_refs)
+            moved += 1
+
+        for row in rows:
+            old_id, pending_refs = row["_pending_refs"]
+            refs = {name: id_map.get(value) for name, value in pending_refs.items() if value is not None}
+            if refs and has_serial_id:
+                dst.execute(table.update().where(table.c.id == id_map[old_id]).values(**refs))
+    return moved
+
+def rebalance_shards(dry_run=False):
+    """Вирівняти навантаження: переносити користувачів з найважчого шарду в найлегший"""
+    from sqlalchemy import text
+    from database import shard_router, init_shards
+
+    if not shard_router.enabled:
+        print("Шардування вимкнене (SPENDIO_SHARDS <= 1)")
+        return []
+
+    init_shards()
+    with shard_router.directory_engine.connect() as conn:
+        user_ids = [row[0] for row in conn.execute(text("SELECT id FROM users"))]
+
+    # Вага користувача = кількість його витрат у поточному шарді
+    weights = {}
+    for user_id in user_ids:
+        shard = shard_router.shard_for(user_id)
+        with shard_router.engines[shard].connect() as conn:
+            count = conn.execute(
+                text("SELECT COUNT(*) FROM expenses WHERE user_id = :u"), {"u": user_id}
+            ).scalar()
+        weights[user_id] = (shard, count)
+
+    loads = [0] * shard_router.shard_count
+    for shard, count in weights.values():
+        loads[shard] += count
+
+    moves = []
+    candidates = sorted(weights.items(), key=lambda item: item[1][1])
+    while True:
+        heavy = max(range(len(loads)), key=lambda i: loads[i])
+        light = min(range(len(loads)), key=lambda i: loads[i])
+        gap = loads[heavy] - loads[light]
+        # Найбільший користувач важкого шарду, перенесення якого зменшує розрив
+        best = None
+        for user_id, (shard, count) in candidates:
+            if shard == heavy and 0 < count < gap:
+                best = (user_id, count)
+        if best is None:
+            break
+        user_id, count = best
+        moves.append((user_id, heavy, light, count))
+        weights[user_id] = (light, count)
+        candidates = sorted(weights.items(), key=lambda item: item[1][1])
+        loads[heavy] -= count
+        loads[light] += count
+
+    for user_id, source, target, count in moves:
+        print(f"  👤 {user_id}: шард {source} → {target} ({count} витрат)")
+        if not dry_run:
+            move_user_to_shard(user_id, target)
+
+    print(f"✅ Навантаження шардів: {loads}")
+    return moves
+
 if __name__ == "__main__":
     import sys
     
@@ -320,11 +658,44 @@ if __name__ == "__main__":
             create_realistic_test_data()
         elif command == "reset":
             reset_database()
+        elif command == "rebalance":
+            rebalance_shards(dry_run="--dry-run" in sys.argv)
+        elif command == "move-user":
+            move_user_to_shard(int(sys.argv[2]), int(sys.argv[3]))
+        elif command == "migrate-shards":
+            migrate_to_shards()
+        elif command == "rebuild-rollups":
+            rebuild_rollups(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        elif command == "rebuild-sketches":
+            rebuild_sketches(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        elif command == "refit-forecasts":
+            refit_forecasts(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        elif command == "train-categorizer":
+            train_categorizer(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        elif command == "dedup":
+            dedup_expenses(delete="--delete" in sys.argv)
+        elif command == "materialize-recurring":
+            materialize_recurring()
+        elif command == "rollover-budgets":
+            rollover_budgets()
+        elif command == "load-fx-rates":
+            load_fx_rates(sys.argv[2])
         else:
-            print("Доступні команди: check, seed, test, reset")
+            print("Доступні команди: check, seed, test, reset, rebalance, move-user, migrate-shards, rebuild-rollups, rebuild-sketches, refit-forecasts, train-categorizer, dedup, materialize-recurring, rollover-budgets, load-fx-rates")
     else:
         print("Утиліти для роботи з БД:")
         print("  python utils.py check  - перевірити БД")
         print("  python utils.py seed   - заповнити початковими даними")
         print("  python utils.py test   - створити реалістичні тестові дані")
-        print("  python utils.py reset  - очистити БД") 
\ No newline at end of file
+        print("  python utils.py reset  - очистити БД")
+        print("  python utils.py rebalance [--dry-run] - вирівняти навантаження шардів")
+        print("  python utils.py move-user <user_id> <shard> - перенести користувача в шард")
+        print("  python utils.py migrate-shards - перенести дані з data.db у шарди після ввімкнення шардування")
+        print("  python utils.py rebuild-rollups [user_id] - перерахувати денні підсумки і статистику витрат")
+        print("  python utils.py rebuild-sketches [user_id] - перебудувати ескізи квантилів витрат")
+        print("  python utils.py refit-forecasts [workers] - перенавчити моделі прогнозу (усі ядра)")
+        print("  python utils.py train-categorizer [user_id] - навчити модель категоризації витрат")
+        print("  python utils.py dedup [--delete] - позначити (або видалити) дублікати витрат")
+        print("  python utils.py materialize-recurring - записати регулярні витрати, що вже настали")
+        print("  python utils.py rollover-budgets - перенести бюджети, що минули, у поточне вікно періоду")
+        print("  python utils.py load-fx-rates <file.csv> - завантажити курси валют (currency,date,rate)") 
\ No newline at end of file
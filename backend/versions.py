@@ -0,0 +1,126 @@
+import random
+import threading
+import zlib
+
+from fastapi import Response
+from sqlalchemy import select, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import changes
+from models import CollectionVersion
+
+# Колекції, для яких ведеться версія: таблиця -> назва колекції
+TRACKED_TABLES = {
+    "expenses": "expenses",
+    "categories": "categories",
+    "budgets": "budgets",
+    "goals": "goals",
+    "recurring_rules": "recurring"
+}
+
+# Стандартні категорії (user_id = NULL) мають спільну версію під user_id = 0
+DEFAULTS_USER = 0
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+@changes.on_flush
+def _bump_changed_collections(session, changeset):
+    keys = set()
+    for change in changeset:
+        collection = TRACKED_TABLES.get(change.table)
+        if collection is not None:
+            user_id = change.user_id if change.user_id is not None else DEFAULTS_USER
+            keys.add((user_id, collection))
+    bump(session, keys)
+
+
+def bump(session, keys):
+    """Збільшити версії колекцій {(user_id, collection)} у поточній транзакції
+
+    Нова версія стартує з випадкового числа, тож після очищення БД
+    старі ETag клієнтів не збігаються з новими даними.
+    """
+    for user_id, collection in sorted(keys):
+        stmt = sqlite_insert(CollectionVersion).values(
+            user_id=user_id,
+            collection=collection,
+            version=random.randint(1, 2 ** 31)
+        ).on_conflict_do_update(
+            index_elements=["user_id", "collection"],
+            set_={"version": CollectionVersion.version + 1}
+        )
+        session.execute(stmt)
+
+
+_versions_query = select(CollectionVersion.user_id, CollectionVersion.version).where(
+    CollectionVersion.user_id.in_(bindparam("user_ids", expanding=True)),
+    CollectionVersion.collection == bindparam("collection")
+)
+
+
+def current(db, user_id, collection):
+    """Поточна версія колекції користувача (0, якщо записів ще не було)"""
+    user_ids = [user_id, DEFAULTS_USER] if collection == "categories" else [user_id]
+    found = dict(db.execute(_versions_query, {"user_ids": user_ids, "collection": collection}).all())
+    return ".".join(str(found.get(uid, 0)) for uid in user_ids)
+
+
+def make_etag(user_id, collection, version, query_string=""):
+    query_hash = zlib.crc32(query_string.encode()) if query_string else 0
+    return f'"{collection}-{user_id}-{version}-{query_hash:x}"'
+
+
+def matches(if_none_match, etag):
+    """Слабке порівняння If-None-Match (стиснення робить ETag слабким)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def conditional_get(request, db, user_id, collection, version=None):
+    """ETag колекції і готова відповідь 304, якщо клієнт має актуальну копію
+
+    Повертає (etag, response): response = None означає, що треба
+    виконати запит і віддати дані з заголовками headers(etag).
+    version — вже прочитана current() (щоб не читати її вдруге).
+    """
+    query_string = "&".join(sorted(request.url.query.split("&"))) if request.url.query else ""
+    version = version or current(db, user_id, collection)
+    etag = make_etag(user_id, collection, version, query_string)
+    hit = matches(request.headers.get("if-none-match"), etag)
+    _count(collection, hit)
+    if hit:
+        return etag, Response(status_code=304, headers=headers(etag))
+    return etag, None
+
+
+def headers(etag):
+    # no-cache: браузер завжди перепитує, але з If-None-Match
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def _count(collection, hit):
+    with _stats_lock:
+        entry = _stats.setdefault(collection, {"requests": 0, "not_modified": 0})
+        entry["requests"] += 1
+        if hit:
+            entry["not_modified"] += 1
+
+
+def stats():
+    with _stats_lock:
+        return {
+            collection: dict(entry, hit_rate=round(entry["not_modified"] / entry["requests"], 4))
+            for collection, entry in _stats.items()
+        }
@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+
+import database
+from database import SessionLocal
+
+# Групові коміти для вставок: вмикаються змінною середовища SPENDIO_GROUP_COMMIT=1
+GROUP_COMMIT_ENABLED = os.getenv("SPENDIO_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_DELAY_MS = float(os.getenv("SPENDIO_GROUP_COMMIT_MS", "5"))
+GROUP_COMMIT_MAX_ROWS = int(os.getenv("SPENDIO_GROUP_COMMIT_ROWS", "100"))
+
+
+class GroupCommitQueue:
+    """Черга вставок, яка комітить рядки багатьох запитів однією транзакцією
+
+    Батч закривається через max_delay секунд після першого рядка або при
+    max_batch рядках. Якщо спільна транзакція падає, рядки батчу
+    повторюються поодинці, щоб кожен запит отримав власну помилку.
+    """
+
+    def __init__(self, bind, max_delay=GROUP_COMMIT_DELAY_MS / 1000, max_batch=GROUP_COMMIT_MAX_ROWS):
+        self.bind = bind
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._commit_latencies = deque(maxlen=1000)
+        self._batch_sizes = deque(maxlen=1000)
+        self.batches = 0
+        self.rows = 0
+        self.failed_rows = 0
+
+    def submit(self, model, values):
+        """Поставити вставку в чергу, повертає concurrent.futures.Future з об'єктом"""
+        future = Future()
+        with self._cond:
+            self._pending.append((model, values, future))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_delay
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                self._commit_batch(batch)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _session(self):
+        # Як route_session у запиті: таблиці користувачів — у шард черги, каталог —
+        # у data.db, а _fence_stale_routing відхиляє рядки користувачів, яких переносять
+        if not database.shard_router.enabled:
+            return SessionLocal(bind=self.bind, expire_on_commit=False)
+        db = SessionLocal(bind=database.shard_router.directory_engine, expire_on_commit=False)
+        db.shard_engine = self.bind
+        return db
+
+    def _commit_batch(self, batch):
+        db = self._session()
+        try:
+            objects = [model(**values) for model, values, _ in batch]
+            db.add_all(objects)
+            started = time.perf_counter()
+            db.commit()
+            self._record(len(batch), time.perf_counter() - started)
+            for (_, _, future), obj in zip(batch, objects):
+                future.set_result(obj)
+        except Exception:
+            db.rollback()
+            self._commit_individually(batch)
+        finally:
+            db.close()
+
+    def _commit_individually(self, batch):
+        for model, values, future in batch:
+            db = self._session()
+            try:
+                obj = model(**values)
+                db.add(obj)
+                started = time.perf_counter()
+                db.commit()
+                self._record(1, time.perf_counter() - started)
+                future.set_result(obj)
+            except Exception as e:
+                db.rollback()
+                self.failed_rows += 1
+                future.set_exception(e)
+            finally:
+                db.close()
+
+    def _record(self, size, latency):
+        self.batches += 1
+        self.rows += size
+        self._batch_sizes.append(size)
+        self._commit_latencies.append(latency)
+
+    def stats(self):
+        latencies = sorted(self._commit_latencies)
+        sizes = list(self._batch_sizes)
+
+        def percentile(values, q):
+            return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "failed_rows": self.failed_rows,
+            "pending": len(self._pending),
+            "avg_batch_size": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "max_batch_size": max(sizes) if sizes else 0,
+            "commit_latency_ms": {
+                "avg": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+                "p50": round(percentile(latencies, 0.5) * 1000, 3),
+                "p99": round(percentile(latencies, 0.99) * 1000, 3)
+            }
+        }
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(bind):
+    """Черга для конкретного engine (окрема для кожного шарду)"""
+    with _queues_lock:
+        queue = _queues.get(bind)
+        if queue is None:
+            queue = _queues[bind] = GroupCommitQueue(bind)
+        return queue
+
+
+async def insert(db, model, values):
+    """Вставити рядок через групову чергу того ж engine, що й сесія запиту"""
+    queue = get_queue(db.get_bind(model.__mapper__))
+    return await asyncio.wrap_future(queue.submit(model, values))
+
+
+def stats():
+    return {
+        "enabled": GROUP_COMMIT_ENABLED,
+        "queues": [queue.stats() for queue in list(_queues.values())]
+    }
@@ -105,7 +105,22 @@ const Dashboard = () => {
   const predictions = React.useMemo(() => predictFutureExpenses(expenses, predictionPeriod), [expenses, predictionPeriod]);
   const categoryAnalytics = React.useMemo(() => getCategoryAnalytics(expenses), [expenses]);
   const anomalies = React.useMemo(() => detectAnomalies(expenses), [expenses]);
-  const recommendations = React.useMemo(() => getRecommendations(expenses, predictions), [expenses, predictions]);
+  const [serverRecommendations, setServerRecommendations] = React.useState<ReturnType<typeof getRecommendations> | null>(null);
+  // Server-side recommendations come from rollups; local computation is only a fallback (e.g. test data)
+  const recommendations = React.useMemo(
+    () => serverRecommendations ?? getRecommendations(expenses, predictions),
+    [serverRecommendations, expenses, predictions]
+  );
+
+  const loadRecommendations = async () => {
+    try {
+      const { api } = await import('../services/api');
+      setServerRecommendations(await api.getRecommendations());
+    } catch (error) {
+      console.error('Error loading recommendations:', error);
+      setServerRecommendations(null);
+    }
+  };
 
   const loadExpenses = async () => {
     try {
@@ -122,6 +137,7 @@ const Dashboard = () => {
     try {
       const testExpenses = await loadTestData();
       setExpenses(testExpenses);
+      setServerRecommendations(null);
       alert(`Завантажено ${testExpenses.length} тестових витрат! 🎉`);
     } catch (error) {
       console.error('Error loading test data:', error);
@@ -136,6 +152,7 @@ const Dashboard = () => {
       const { api } = await import('../services/api');
       await api.deleteExpense(id);
       await loadExpenses();
+      await loadRecommendations();
     } catch (error) {
       console.error('Error deleting expense:', error);
     }
@@ -144,6 +161,7 @@ const Dashboard = () => {
   React.useEffect(() => {
     if (user) {
       loadExpenses();
+      loadRecommendations();
     }
   }, [user]);
 
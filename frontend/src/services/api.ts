@@ -145,6 +145,59 @@ export const api = {
     }
   },
 
+  // Delta sync: only rows changed after the stored cursor
+  async getChanges(since: number = 0, limit?: number) {
+    try {
+      const params = new URLSearchParams({ since: String(since) });
+      if (limit) {
+        params.set('limit', String(limit));
+      }
+      const response = await fetch(`${API_BASE}/sync/?${params}`, {
+        headers: getAuthHeaders()
+      });
+
+      return await handleResponse(response);
+    } catch (error) {
+      console.error('Failed to fetch changes:', error);
+      throw error;
+    }
+  },
+
+  async getRecommendations() {
+    try {
+      const response = await fetch(`${API_BASE}/analytics/recommendations`, {
+        headers: getAuthHeaders()
+      });
+
+      return await handleResponse(response);
+    } catch (error) {
+      console.error('Failed to fetch recommendations:', error);
+      throw error;
+    }
+  },
+
+  async getTimeseries(
+    granularity: 'day' | 'week' | 'month' | 'quarter' | 'year' = 'month',
+    options: { start?: string; end?: string; category?: string } = {}
+  ): Promise<{ granularity: string; start: string; end: string; buckets: string[]; totals: number[]; counts: number[] }> {
+    try {
+      const params = new URLSearchParams({ granularity });
+      Object.entries(options).forEach(([key, value]) => {
+        if (value) {
+          params.set(key, value);
+        }
+      });
+      const response = await fetch(`${API_BASE}/analytics/timeseries?${params}`, {
+        headers: getAuthHeaders()
+      });
+
+      return await handleResponse(response);
+    } catch (error) {
+      console.error('Failed to fetch timeseries:', error);
+      throw error;
+    }
+  },
+
   // Auth-related API calls
   async getCurrentUser() {
     try {